@@ -0,0 +1,564 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from utils import read_file
+
+# 默认测试规模：1KB ~ 50MB，日常回归默认只跑到1MB
+ALL_SIZES = ['1K', '10K', '100K', '1M', '10M', '50M']
+DEFAULT_SIZES = ['1K', '10K', '100K', '1M']
+
+# 修改方式：删除、增加、乱序、重复，对应测试文本 orig_0.8_del / add / dis / dup
+VARIANT_KINDS = ['del', 'add', 'dis', 'dup']
+
+# 修改比例：0.8 表示保留约80%的原文
+DEFAULT_KEEP_RATE = 0.8
+
+# 生成文本用的词表大小（取 jieba 词典中词频最高的词）
+VOCABULARY_SIZE = 5000
+
+_SENTENCE_ENDS = ['。', '。', '。', '！', '？', '；']
+
+_FALLBACK_WORDS = ['研究', '方法', '系统', '数据', '分析', '模型', '结果', '问题', '实验', '理论',
+                   '技术', '应用', '设计', '实现', '算法', '性能', '优化', '提出', '发展', '过程']
+
+
+def parse_size(size):
+    """把 '1K' / '10M' / '2048' 解析为字节数"""
+    size = size.strip().upper()
+    units = {'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024}
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def load_vocabulary(size=VOCABULARY_SIZE):
+    """从 jieba 默认词典中取高频词作为生成语料的词表，保证分词行为接近真实论文"""
+    try:
+        import jieba
+        path = os.path.join(os.path.dirname(os.path.abspath(jieba.__file__)), jieba.DEFAULT_DICT_NAME)
+        entries = []
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) >= 2 and len(parts[0]) >= 2:
+                    entries.append((int(parts[1]), parts[0]))
+        entries.sort(reverse=True)
+        return [word for _, word in entries[:size]]
+    except Exception:
+        return list(_FALLBACK_WORDS)
+
+
+def generate_text(size_bytes, vocabulary, seed=0):
+    """生成约 size_bytes 字节（UTF-8）的论文样式文本：句子由词表中的词组成，若干句成段"""
+    rng = random.Random(seed)
+    paragraphs = []
+    total = 0
+    while total < size_bytes:
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            words = rng.choices(vocabulary, k=rng.randint(6, 20))
+            sentences.append(''.join(words) + rng.choice(_SENTENCE_ENDS))
+        paragraph = ''.join(sentences)
+        paragraphs.append(paragraph)
+        total += len(paragraph.encode('utf-8')) + 1
+    return '\n'.join(paragraphs)
+
+
+def _split_sentences(text):
+    """按句末标点切分句子，保留标点"""
+    sentences = []
+    start = 0
+    for index, char in enumerate(text):
+        if char in '。！？；\n':
+            sentences.append(text[start:index + 1])
+            start = index + 1
+    if start < len(text):
+        sentences.append(text[start:])
+    return sentences
+
+
+def make_variant(text, kind, keep_rate=DEFAULT_KEEP_RATE, vocabulary=None, seed=0):
+    """
+    生成修改版文本
+    del：删除约 (1-keep_rate) 的句子；add：插入相当比例的新句子；
+    dis：打乱约 (1-keep_rate) 的句子内部的字词顺序；dup：重复约 (1-keep_rate) 的句子
+    """
+    rng = random.Random(seed)
+    rate = 1 - keep_rate
+    sentences = _split_sentences(text)
+    vocabulary = vocabulary or _FALLBACK_WORDS
+
+    if kind == 'del':
+        result = [sentence for sentence in sentences if rng.random() >= rate]
+    elif kind == 'add':
+        result = []
+        for sentence in sentences:
+            result.append(sentence)
+            if rng.random() < rate:
+                result.append(''.join(rng.choices(vocabulary, k=rng.randint(6, 20))) + '。')
+    elif kind == 'dis':
+        result = []
+        for sentence in sentences:
+            if rng.random() < rate and len(sentence) > 2:
+                body, end = list(sentence[:-1]), sentence[-1]
+                rng.shuffle(body)
+                sentence = ''.join(body) + end
+            result.append(sentence)
+    elif kind == 'dup':
+        result = []
+        for sentence in sentences:
+            result.append(sentence)
+            if rng.random() < rate:
+                result.append(sentence)
+    else:
+        raise Exception(f"不支持的修改方式: {kind}")
+    return ''.join(result)
+
+
+def generate_corpus(out_dir, sizes=DEFAULT_SIZES, kinds=VARIANT_KINDS, keep_rate=DEFAULT_KEEP_RATE, seed=0):
+    """
+    生成基准测试语料：每个规模一篇原文 orig_{规模}.txt 和各修改版 orig_{规模}_{比例}_{方式}.txt
+    返回 {规模: {'orig': 路径, 方式: 路径}}
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    vocabulary = load_vocabulary()
+    corpus = {}
+    for size in sizes:
+        text = generate_text(parse_size(size), vocabulary, seed)
+        files = {'orig': os.path.join(out_dir, f"orig_{size}.txt")}
+        with open(files['orig'], 'w', encoding='utf-8') as file:
+            file.write(text)
+        for kind in kinds:
+            path = os.path.join(out_dir, f"orig_{size}_{keep_rate}_{kind}.txt")
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(make_variant(text, kind, keep_rate, vocabulary, seed))
+            files[kind] = path
+        corpus[size] = files
+    return corpus
+
+
+def load_corpus(corpus_dir, sizes=None):
+    """
+    读取已有语料目录中的 orig*.txt 论文对，不修改目录中的任何文件
+    支持 generate 生成的 orig_{规模}.txt / orig_{规模}_{比例}_{方式}.txt，
+    以及作业自带的 orig.txt / orig_{比例}_{方式}.txt（规模记为原文字节数）
+    sizes 不为 None 时只保留这些规模；返回值与 generate_corpus 相同
+    """
+    if not os.path.isdir(corpus_dir):
+        raise Exception(f"语料目录不存在: {corpus_dir}")
+    originals = {}
+    variants = {}
+    for name in sorted(os.listdir(corpus_dir)):
+        stem, extension = os.path.splitext(name)
+        parts = stem.split('_')
+        if extension != '.txt' or parts[0] != 'orig' or len(parts) > 4:
+            continue
+        path = os.path.join(corpus_dir, name)
+        if len(parts) <= 2:
+            originals[parts[1] if len(parts) == 2 else ''] = path
+        else:
+            variants.setdefault(parts[1] if len(parts) == 4 else '', {})[parts[-1]] = path
+
+    corpus = {}
+    for key, original in originals.items():
+        size = key or str(os.path.getsize(original))
+        if key not in variants or (sizes is not None and size not in sizes):
+            continue
+        order = {kind: position for position, kind in enumerate(VARIANT_KINDS)}
+        kinds = sorted(variants[key], key=lambda kind: (order.get(kind, len(order)), kind))
+        corpus[size] = {'orig': original, **{kind: variants[key][kind] for kind in kinds}}
+    if not corpus:
+        raise Exception(f"语料目录中没有可用的 orig*.txt 论文对: {corpus_dir}")
+    return dict(sorted(corpus.items(), key=lambda item: parse_size(item[0])))
+
+
+def _peak_memory(function, *args):
+    """执行一次函数，返回 tracemalloc 记录的Python堆峰值字节（开启追踪会拖慢执行，不与计时混用）"""
+    tracemalloc.start()
+    try:
+        function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def measure_stages(original_file, plagiarized_file):
+    """
+    逐阶段测量 calculate_similarity 的流水线：读取解码、预处理、分词、向量化、余弦计算
+    返回每个阶段的耗时、处理量和吞吐率
+    """
+    from main import preprocess_text, segment_text
+    from vocabulary import Vocabulary, count_matrix, tfidf_matrix
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    stages = {}
+
+    def record(name, elapsed, amount, unit):
+        stages[name] = {
+            'seconds': elapsed,
+            unit: amount,
+            f"{unit}_per_second": amount / elapsed if elapsed > 0 else None,
+        }
+
+    start = time.perf_counter()
+    texts = [read_file(original_file), read_file(plagiarized_file)]
+    record('read', time.perf_counter() - start,
+           os.path.getsize(original_file) + os.path.getsize(plagiarized_file), 'bytes')
+
+    start = time.perf_counter()
+    cleaned = [preprocess_text(text) for text in texts]
+    record('preprocess', time.perf_counter() - start, sum(len(text) for text in texts), 'chars')
+
+    start = time.perf_counter()
+    words = [segment_text(text) for text in cleaned]
+    record('segment', time.perf_counter() - start, sum(len(text) for text in cleaned), 'chars')
+
+    start = time.perf_counter()
+    vocabulary = Vocabulary()
+    matrix = tfidf_matrix(count_matrix([vocabulary.term_ids(item) for item in words], len(vocabulary)), vocabulary)
+    record('vectorize', time.perf_counter() - start, sum(len(item) for item in words), 'tokens')
+
+    start = time.perf_counter()
+    cosine_similarity(matrix[0:1], matrix[1:2])
+    record('cosine', time.perf_counter() - start, matrix.nnz, 'nonzeros')
+    return stages
+
+
+def measure_cli(original_file, plagiarized_file):
+    """
+    以子进程运行命令行查重，返回 (耗时秒, 峰值RSS字节)
+    峰值RSS 通过 os.wait4 获取该子进程自身的资源统计，不支持的平台为 None
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output = os.path.join(temp_dir, 'result.txt')
+        command = [sys.executable, script, original_file, plagiarized_file, output, '--no-server']
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if hasattr(os, 'wait4'):
+            _, status, usage = os.wait4(process.pid, 0)
+            elapsed = time.perf_counter() - start
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # Linux 上 ru_maxrss 的单位是KB
+            peak = usage.ru_maxrss * 1024
+        else:
+            process.wait()
+            elapsed = time.perf_counter() - start
+            peak = None
+        if process.returncode != 0:
+            raise Exception(f"命令行查重失败: {' '.join(command)}")
+    return elapsed, peak
+
+
+# 在子进程中运行一次命令行查重，结束后报告加载了哪些重量级模块
+_STARTUP_PROBE = """
+import runpy, sys
+sys.argv = sys.argv[1:]
+runpy.run_path(sys.argv[0], run_name='__main__')
+heavy = sorted(name for name in ('sklearn', 'scipy', 'numpy') if name in sys.modules)
+sys.stderr.write('HEAVY_MODULES=' + ','.join(heavy) + '\\n')
+"""
+
+
+def measure_startup(repeat=5, backends=('auto', 'sklearn')):
+    """
+    测量命令行冷启动耗时：对两篇极短的论文运行完整的查重命令，
+    此时耗时几乎全部来自解释器启动、模块导入和词典加载
+    返回 {后端: {'seconds_min', 'seconds_mean', 'heavy_modules'}}
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    report = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        original = os.path.join(temp_dir, 'orig.txt')
+        plagiarized = os.path.join(temp_dir, 'plag.txt')
+        with open(original, 'w', encoding='utf-8') as file:
+            file.write("自然语言处理是人工智能领域中的一个重要方向。")
+        with open(plagiarized, 'w', encoding='utf-8') as file:
+            file.write("自然语言处理是人工智能领域中的重要方向。")
+        output = os.path.join(temp_dir, 'result.txt')
+
+        for backend in backends:
+            command = [sys.executable, '-c', _STARTUP_PROBE, script, original, plagiarized, output,
+                       '--no-server', '--backend', backend]
+            timings = []
+            heavy = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                completed = subprocess.run(command, capture_output=True, text=True)
+                timings.append(time.perf_counter() - start)
+                if completed.returncode != 0:
+                    raise Exception(f"命令行查重失败: {completed.stdout.strip()}")
+                for line in completed.stderr.splitlines():
+                    if line.startswith('HEAVY_MODULES='):
+                        heavy = [name for name in line.split('=', 1)[1].split(',') if name]
+            report[backend] = {
+                'seconds_min': min(timings),
+                'seconds_mean': sum(timings) / len(timings),
+                'heavy_modules': heavy,
+            }
+    return report
+
+
+def run_benchmarks(corpus, repeat=3, include_cli=True):
+    """对语料中的每个 (规模, 修改方式) 组合运行基准测试，返回结果列表"""
+    from main import calculate_similarity
+
+    # 预热：jieba 词典加载等一次性开销不计入单次查重耗时
+    calculate_similarity("预热基准测试的文本内容", "预热基准测试的文本")
+
+    results = []
+    for size, files in corpus.items():
+        original_file = files['orig']
+        original_text = read_file(original_file)
+        for kind, plagiarized_file in files.items():
+            if kind == 'orig':
+                continue
+            plagiarized_text = read_file(plagiarized_file)
+
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                similarity = calculate_similarity(original_text, plagiarized_text)
+                timings.append(time.perf_counter() - start)
+            peak = _peak_memory(calculate_similarity, original_text, plagiarized_text)
+
+            entry = {
+                'size': size,
+                'bytes': os.path.getsize(original_file),
+                'variant': kind,
+                'similarity': similarity,
+                'calculate_similarity': {
+                    'seconds_min': min(timings),
+                    'seconds_mean': sum(timings) / len(timings),
+                    'peak_memory_bytes': peak,
+                },
+                'stages': measure_stages(original_file, plagiarized_file),
+            }
+            if include_cli:
+                cli_timings = [measure_cli(original_file, plagiarized_file) for _ in range(repeat)]
+                entry['cli'] = {
+                    'seconds_min': min(elapsed for elapsed, _ in cli_timings),
+                    'seconds_mean': sum(elapsed for elapsed, _ in cli_timings) / len(cli_timings),
+                    'peak_rss_bytes': max((peak or 0) for _, peak in cli_timings) or None,
+                }
+            results.append(entry)
+    return results
+
+
+def compare_analyzers(corpus, repeat=3, tolerance=0.05):
+    """
+    比较 jieba 分词和字符 n-gram 两种分析器：每对论文的相似度、耗时和吞吐率（预处理后字符/秒），
+    以及两者相似度的平均/最大绝对差和差值不超过 tolerance 的比例
+    """
+    from main import calculate_similarity, configure_analyzer, preprocess_text
+
+    # 预热：jieba 词典加载、NumPy 导入等一次性开销不计入
+    for analyzer in ('jieba', 'char'):
+        configure_analyzer(analyzer)
+        calculate_similarity("预热基准测试的文本内容", "预热基准测试的文本")
+
+    pairs = []
+    try:
+        for size, files in corpus.items():
+            original_text = read_file(files['orig'])
+            for kind, plagiarized_file in files.items():
+                if kind == 'orig':
+                    continue
+                plagiarized_text = read_file(plagiarized_file)
+                chars = len(preprocess_text(original_text)) + len(preprocess_text(plagiarized_text))
+                entry = {'size': size, 'variant': kind}
+                for analyzer in ('jieba', 'char'):
+                    configure_analyzer(analyzer)
+                    timings = []
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        similarity = calculate_similarity(original_text, plagiarized_text)
+                        timings.append(time.perf_counter() - start)
+                    entry[analyzer] = {
+                        'similarity': similarity,
+                        'seconds_min': min(timings),
+                        'chars_per_second': chars / min(timings) if min(timings) > 0 else None,
+                    }
+                entry['difference'] = round(abs(entry['jieba']['similarity'] - entry['char']['similarity']), 2)
+                pairs.append(entry)
+    finally:
+        configure_analyzer('jieba')
+
+    differences = [entry['difference'] for entry in pairs]
+    summary = {
+        'pairs': len(pairs),
+        'mean_difference': sum(differences) / len(differences) if differences else None,
+        'max_difference': max(differences, default=None),
+        'within_tolerance': (sum(difference <= tolerance for difference in differences) / len(differences)
+                             if differences else None),
+        'tolerance': tolerance,
+    }
+    return {'summary': summary, 'pairs': pairs}
+
+
+def environment_info():
+    """记录运行环境和当前提交，便于比较不同提交之间的结果"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare_results(old, new, threshold=10.0):
+    """
+    比较两次基准测试结果，返回耗时增长超过 threshold% 的条目
+    [(规模, 修改方式, 指标, 旧值, 新值, 变化百分比)]
+    """
+    def index(report):
+        return {(entry['size'], entry['variant']): entry for entry in report['results']}
+
+    regressions = []
+    old_entries = index(old)
+    for key, entry in index(new).items():
+        if key not in old_entries:
+            continue
+        for metric in ('calculate_similarity', 'cli'):
+            if metric not in entry or metric not in old_entries[key]:
+                continue
+            before = old_entries[key][metric]['seconds_min']
+            after = entry[metric]['seconds_min']
+            change = (after - before) / before * 100 if before > 0 else 0.0
+            if change > threshold:
+                regressions.append((key[0], key[1], metric, before, after, change))
+    return regressions
+
+
+def main(argv=None):
+    """
+    基准测试命令行入口
+    python benchmark.py generate 语料目录 [--sizes 1K,100K,1M] [--seed N]
+    python benchmark.py run [--corpus 语料目录] [--sizes 1K,100K,1M] [--repeat N] [-o 结果.json]
+    python benchmark.py analyzers [--corpus 语料目录] [--sizes 1K,100K,1M] [--repeat N] [-o 结果.json]
+    python benchmark.py compare 旧结果.json 新结果.json [--threshold 10]
+    """
+    parser = argparse.ArgumentParser(description='论文查重系统性能基准测试')
+    actions = parser.add_subparsers(dest='action', required=True)
+
+    generate_parser = actions.add_parser('generate', help='生成合成抄袭语料')
+    generate_parser.add_argument('out_dir', help='语料输出目录')
+    generate_parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES),
+                                 help=f"逗号分隔的规模，可选 {','.join(ALL_SIZES)} 或字节数")
+    generate_parser.add_argument('--seed', type=int, default=0, help='随机种子')
+
+    run_parser = actions.add_parser('run', help='运行基准测试')
+    run_parser.add_argument('--corpus', default=None, help='已有语料目录（只读取，不改写），不指定时生成到临时目录')
+    run_parser.add_argument('--sizes', default=None,
+                            help=f"逗号分隔的规模，生成语料时默认 {','.join(DEFAULT_SIZES)}，读取已有语料时默认全部")
+    run_parser.add_argument('--repeat', type=int, default=3, help='每项重复次数')
+    run_parser.add_argument('--no-cli', action='store_true', help='不测量命令行端到端耗时')
+    run_parser.add_argument('-o', '--output', default='benchmark_results.json', help='结果输出路径（JSON）')
+
+    startup_parser = actions.add_parser('startup', help='测量命令行冷启动耗时')
+    startup_parser.add_argument('--repeat', type=int, default=5, help='重复次数')
+    startup_parser.add_argument('-o', '--output', default=None, help='结果输出路径（JSON），不指定时只打印')
+
+    analyzers_parser = actions.add_parser('analyzers', help='比较 jieba 分词与字符 n-gram 分析器的吞吐率和结果一致性')
+    analyzers_parser.add_argument('--corpus', default=None, help='已有语料目录（只读取，不改写），不指定时生成到临时目录')
+    analyzers_parser.add_argument('--sizes', default=None,
+                                  help=f"逗号分隔的规模，生成语料时默认 {','.join(DEFAULT_SIZES)}，读取已有语料时默认全部")
+    analyzers_parser.add_argument('--repeat', type=int, default=3, help='每项重复次数')
+    analyzers_parser.add_argument('--tolerance', type=float, default=0.05, help='视为结果一致的最大相似度差')
+    analyzers_parser.add_argument('-o', '--output', default=None, help='结果输出路径（JSON），不指定时只打印')
+
+    compare_parser = actions.add_parser('compare', help='比较两次结果')
+    compare_parser.add_argument('old', help='旧结果')
+    compare_parser.add_argument('new', help='新结果')
+    compare_parser.add_argument('--threshold', type=float, default=10.0, help='判定为退化的耗时增长百分比')
+
+    try:
+        args = parser.parse_args(argv)
+
+        if args.action == 'generate':
+            corpus = generate_corpus(args.out_dir, args.sizes.split(','), seed=args.seed)
+            print(f"已生成 {sum(len(files) for files in corpus.values())} 个文件: {args.out_dir}")
+
+        elif args.action == 'run':
+            sizes = args.sizes.split(',') if args.sizes else None
+            if args.corpus:
+                results = run_benchmarks(load_corpus(args.corpus, sizes), args.repeat, include_cli=not args.no_cli)
+            else:
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    corpus = generate_corpus(temp_dir, sizes or DEFAULT_SIZES)
+                    results = run_benchmarks(corpus, args.repeat, include_cli=not args.no_cli)
+            report = {'environment': environment_info(), 'results': results}
+            if not args.no_cli:
+                report['startup'] = measure_startup(args.repeat)
+            with open(args.output, 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            for entry in results:
+                print(f"{entry['size']:>5} {entry['variant']:>4}  相似度 {entry['similarity']:.2f}  "
+                      f"calculate_similarity {entry['calculate_similarity']['seconds_min'] * 1000:.1f}ms")
+            print(f"结果已写入: {args.output}")
+
+        elif args.action == 'startup':
+            startup = measure_startup(args.repeat)
+            for backend, entry in startup.items():
+                heavy = ', '.join(entry['heavy_modules']) or '无'
+                print(f"{backend:>8}  冷启动 {entry['seconds_min'] * 1000:.0f}ms  已加载的重量级模块: {heavy}")
+            if args.output:
+                with open(args.output, 'w', encoding='utf-8') as file:
+                    json.dump({'environment': environment_info(), 'startup': startup}, file,
+                              ensure_ascii=False, indent=2)
+
+        elif args.action == 'analyzers':
+            sizes = args.sizes.split(',') if args.sizes else None
+            if args.corpus:
+                report = compare_analyzers(load_corpus(args.corpus, sizes), args.repeat, args.tolerance)
+            else:
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    corpus = generate_corpus(temp_dir, sizes or DEFAULT_SIZES)
+                    report = compare_analyzers(corpus, args.repeat, args.tolerance)
+            for entry in report['pairs']:
+                jieba_entry, char_entry = entry['jieba'], entry['char']
+                print(f"{entry['size']:>5} {entry['variant']:>4}  "
+                      f"jieba {jieba_entry['similarity']:.2f} {jieba_entry['seconds_min'] * 1000:.1f}ms  "
+                      f"char {char_entry['similarity']:.2f} {char_entry['seconds_min'] * 1000:.1f}ms  "
+                      f"差 {entry['difference']:.2f}")
+            summary = report['summary']
+            if summary['pairs']:
+                print(f"平均差 {summary['mean_difference']:.3f}，最大差 {summary['max_difference']:.2f}，"
+                      f"差值不超过 {summary['tolerance']} 的比例 {summary['within_tolerance']:.0%}")
+            if args.output:
+                with open(args.output, 'w', encoding='utf-8') as file:
+                    json.dump({'environment': environment_info(), **report}, file, ensure_ascii=False, indent=2)
+
+        else:
+            with open(args.old, 'r', encoding='utf-8') as file:
+                old = json.load(file)
+            with open(args.new, 'r', encoding='utf-8') as file:
+                new = json.load(file)
+            regressions = compare_results(old, new, args.threshold)
+            for size, variant, metric, before, after, change in regressions:
+                print(f"{size} {variant} {metric}: {before * 1000:.1f}ms -> {after * 1000:.1f}ms (+{change:.1f}%)")
+            if regressions:
+                sys.exit(1)
+            print("没有发现性能退化")
+    except Exception as e:
+        print(f"错误: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
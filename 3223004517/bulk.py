@@ -0,0 +1,260 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+from collections import Counter, namedtuple
+
+from utils import read_file, write_result
+from vocabulary import DEFAULT_MIN_TERM_LENGTH, Vocabulary
+
+# 清单中的一行：原文、待检测论文、结果输出文件（均为绝对路径）
+Pair = namedtuple('Pair', ['original_file', 'plagiarized_file', 'output_file'])
+
+# 清单列名：兼容常驻服务请求的字段名和简写
+_COLUMNS = {
+    'original_file': ('original_file', 'original', 'orig'),
+    'plagiarized_file': ('plagiarized_file', 'candidate', 'plagiarized', 'plag'),
+    'output_file': ('output_file', 'output', 'out'),
+}
+
+# 同时在处理中的论文对数上限，限制已读入内存的文本和词频数量
+DEFAULT_MAX_PENDING = 256
+
+
+def _pick(row, field):
+    for name in _COLUMNS[field]:
+        if row.get(name):
+            return row[name]
+    raise Exception(f"清单缺少字段: {field}")
+
+
+def read_manifest(manifest_path):
+    """
+    读取批量任务清单，返回 Pair 列表
+    支持 JSONL（每行一个对象）和 CSV（带表头，或不带表头的三列：原文,待检测论文,输出文件）；
+    相对路径以清单所在目录为基准
+    """
+    if not os.path.exists(manifest_path):
+        raise Exception(f"清单文件不存在: {manifest_path}")
+    base = os.path.dirname(os.path.abspath(manifest_path))
+
+    rows = []
+    try:
+        with open(manifest_path, 'r', encoding='utf-8-sig', newline='') as file:
+            if manifest_path.endswith('.jsonl'):
+                for line in file:
+                    if line.strip():
+                        rows.append(json.loads(line))
+            else:
+                records = [record for record in csv.reader(file) if any(cell.strip() for cell in record)]
+                header = [cell.strip() for cell in records[0]] if records else []
+                if any(name in header for names in _COLUMNS.values() for name in names):
+                    rows = [dict(zip(header, record)) for record in records[1:]]
+                else:
+                    rows = [dict(zip(('original_file', 'plagiarized_file', 'output_file'), record))
+                            for record in records]
+    except (OSError, ValueError) as e:
+        raise Exception(f"读取清单失败: {str(e)}")
+
+    return [Pair(*(os.path.normpath(os.path.join(base, _pick(row, field).strip())) for field in Pair._fields))
+            for row in rows]
+
+
+def load_checkpoint(checkpoint_path):
+    """读取检查点，返回已成功完成的论文对集合；中断时写了一半的末行会被忽略"""
+    done = set()
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return done
+    with open(checkpoint_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if 'similarity' in record:
+                done.add(Pair(*(record[field] for field in Pair._fields)))
+    return done
+
+
+def _open_checkpoint(checkpoint_path):
+    """以追加方式打开检查点；上次中断留下的不完整末行先补上换行，避免与新记录粘连"""
+    if os.path.exists(checkpoint_path) and os.path.getsize(checkpoint_path) > 0:
+        with open(checkpoint_path, 'rb+') as file:
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) != b'\n':
+                file.write(b'\n')
+    return open(checkpoint_path, 'a', encoding='utf-8')
+
+
+# --------------------------
+# 工作进程
+# --------------------------
+def _init_worker(cache_dir=None, seg_dict=None):
+    """工作进程初始化：预先加载 jieba 词典（或映射预编译分词词典），进程内串行分词（并行已由进程池提供）"""
+    import main
+    import seg_dict as segmenter
+    segmenter.configure_segment_dictionary(seg_dict)
+    segmenter.initialize()
+    main.configure_segment_cache(cache_dir)
+    main.configure_parallel_segmentation(workers=1)
+
+
+def analyze_text(text):
+    """
+    预处理、分词并统计一篇论文的词频，每个不同的文件只做一次
+    返回 (原文是否为空白, 是否有分词结果, {词: 词频})，词的规则与 Vocabulary.term_ids 相同
+    """
+    from main import preprocess_text, segment_text
+
+    if not text.strip():
+        return True, False, Counter()
+    processed = preprocess_text(text)
+    words = segment_text(processed) if processed else []
+    counts = Counter(word.lower() for word in words if len(word) >= DEFAULT_MIN_TERM_LENGTH)
+    return False, bool(words), counts
+
+
+def score_analyses(original, plagiarized):
+    """由两篇论文的分析结果计算相似度，空文本等边界情况与 calculate_similarity 一致"""
+    from main import similarity_from_counts
+
+    original_blank, original_has_words, original_terms = original
+    plagiarized_blank, plagiarized_has_words, plagiarized_terms = plagiarized
+    if original_blank and plagiarized_blank:
+        return 1.0
+    if original_blank or plagiarized_blank:
+        return 0.0
+    if not original_has_words or not plagiarized_has_words:
+        return 0.0
+    if not original_terms and not plagiarized_terms:
+        raise Exception("文本向量化失败: empty vocabulary; perhaps the documents only contain stop words")
+
+    vocabulary = Vocabulary()
+    original_counts = Counter({vocabulary.intern(term): count for term, count in original_terms.items()})
+    plagiarized_counts = Counter({vocabulary.intern(term): count for term, count in plagiarized_terms.items()})
+    return similarity_from_counts(original_counts, plagiarized_counts, vocabulary)
+
+
+# --------------------------
+# 调度
+# --------------------------
+async def run_bulk(pairs, checkpoint_path=None, executor=None, max_pending=DEFAULT_MAX_PENDING, on_result=None):
+    """
+    批量执行论文对查重
+    文件读取和结果写入交给 asyncio 的线程执行，预处理和分词交给进程池（executor）；
+    每个不同的文件只读取、分词一次，被所有引用它的论文对共享，最后一个论文对用完后释放
+    每完成一对立即写入结果文件，并在检查点追加一行 JSON；重新运行时跳过检查点中已成功的论文对
+    返回 {'completed', 'skipped', 'failed'} 计数
+    """
+    loop = asyncio.get_running_loop()
+    done = load_checkpoint(checkpoint_path)
+    todo = [pair for pair in pairs if pair not in done]
+    summary = {'completed': 0, 'skipped': len(pairs) - len(todo), 'failed': 0}
+
+    # 每个文件还有多少论文对要用，降到0时释放其分析结果
+    remaining = Counter(path for pair in todo for path in pair[:2])
+    analyses = {}
+
+    async def analyze(path):
+        text = await asyncio.to_thread(read_file, path)
+        return await loop.run_in_executor(executor, analyze_text, text)
+
+    def analysis(path):
+        task = analyses.get(path)
+        if task is None:
+            task = analyses[path] = asyncio.ensure_future(analyze(path))
+        return task
+
+    def release(path):
+        remaining[path] -= 1
+        if remaining[path] == 0:
+            analyses.pop(path, None)
+
+    checkpoint = _open_checkpoint(checkpoint_path) if checkpoint_path else None
+    slots = asyncio.Semaphore(max_pending)
+
+    async def check(pair):
+        record = pair._asdict()
+        try:
+            # 两个文件都等待完成，避免一侧出错时另一侧的异常无人读取
+            results = await asyncio.gather(analysis(pair.original_file), analysis(pair.plagiarized_file),
+                                           return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+            similarity = score_analyses(*results)
+            await asyncio.to_thread(write_result, pair.output_file, similarity)
+            record['similarity'] = similarity
+            summary['completed'] += 1
+        except Exception as e:
+            record['error'] = str(e)
+            summary['failed'] += 1
+        finally:
+            release(pair.original_file)
+            release(pair.plagiarized_file)
+            slots.release()
+
+        if checkpoint is not None:
+            checkpoint.write(json.dumps(record, ensure_ascii=False) + '\n')
+            checkpoint.flush()
+        if on_result is not None:
+            on_result(record)
+
+    try:
+        # 只保留未完成的任务，清单很长时已完成的任务对象不会堆积
+        pending = set()
+        for pair in todo:
+            await slots.acquire()
+            task = asyncio.ensure_future(check(pair))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        await asyncio.gather(*pending)
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+    return summary
+
+
+def bulk_main(argv):
+    """
+    批量任务子命令
+    python main.py bulk 清单.csv|清单.jsonl [--checkpoint 检查点] [--workers N] [--cache-dir 目录]
+    """
+    parser = argparse.ArgumentParser(prog='main.py bulk', description='按清单批量查重，可中断后续跑')
+    parser.add_argument('manifest', help='任务清单：CSV（original,candidate,output）或 JSONL')
+    parser.add_argument('--checkpoint', default=None, help='检查点文件，默认为 清单文件名.checkpoint.jsonl')
+    parser.add_argument('--workers', type=int, default=None, help='分词进程数，默认等于CPU核数')
+    parser.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING, help='同时处理的论文对数上限')
+    parser.add_argument('--cache-dir', default=os.environ.get('PAPER_CHECK_CACHE_DIR'),
+                        help='磁盘分词缓存目录，默认读取环境变量 PAPER_CHECK_CACHE_DIR')
+    parser.add_argument('--idf-model', default=os.environ.get('PAPER_CHECK_IDF_MODEL'),
+                        help='语料IDF模型文件，默认读取环境变量 PAPER_CHECK_IDF_MODEL')
+    parser.add_argument('--seg-dict', default=os.environ.get('PAPER_CHECK_SEG_DICT'),
+                        help='预编译分词词典文件，默认读取环境变量 PAPER_CHECK_SEG_DICT')
+
+    try:
+        from concurrent.futures import ProcessPoolExecutor
+        import main
+
+        args = parser.parse_args(argv)
+        main.configure_idf_model(args.idf_model)
+        pairs = read_manifest(args.manifest)
+        checkpoint_path = args.checkpoint or args.manifest + '.checkpoint.jsonl'
+
+        def report(record):
+            if 'error' in record:
+                print(f"失败: {record['original_file']} {record['plagiarized_file']}: {record['error']}")
+
+        workers = args.workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(args.cache_dir, args.seg_dict)) as executor:
+            summary = asyncio.run(run_bulk(pairs, checkpoint_path, executor, args.max_pending, report))
+        print(f"批量查重完成：完成 {summary['completed']} 对，跳过 {summary['skipped']} 对，"
+              f"失败 {summary['failed']} 对；检查点: {checkpoint_path}")
+        if summary['failed']:
+            sys.exit(1)
+    except Exception as e:
+        print(f"错误: {str(e)}")
+        sys.exit(1)
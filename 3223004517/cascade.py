@@ -0,0 +1,148 @@
+import functools
+from collections import namedtuple
+
+import metrics
+from char_ngram import shingle_hashes
+from main import calculate_similarity, preprocess_text
+
+# 查重前的廉价筛查，按顺序执行，任一阶段能下结论时直接返回，否则交给下一阶段，最后才做完整的TF-IDF
+# blank     与 calculate_similarity 相同的空文本判定（精确）
+# identical 预处理后内容相同，相似度为1（精确）
+# length    预处理后长度比低于下限，判为不相似
+# charset   字符集没有交集时相似度为0（精确）；交集比例（Jaccard）低于下限时判为不相似
+# shingle   抽样估计抄袭版字符 n-gram 在原文中的比例，低于下限时以估计值作为结果
+CASCADE_STAGES = ('blank', 'identical', 'length', 'charset', 'shingle')
+
+# 最终的完整计算记为该阶段
+FULL_STAGE = 'tfidf'
+
+DEFAULT_OPTIONS = {
+    'stages': CASCADE_STAGES,
+    'min_length_ratio': 0.02,
+    'min_charset_ratio': 0.1,
+    'shingle_size': 2,
+    # 只保留哈希值能被抽样率整除的 n-gram；两篇文本用同一规则抽样，交集仍是同一批 n-gram
+    'sample_rate': 8,
+    # 抄袭版抽样数少于它时样本不足，不下结论
+    'min_samples': 32,
+    'shingle_low': 0.05,
+}
+
+Decision = namedtuple('Decision', ['similarity', 'stage'])
+
+
+class _Pair:
+    """一对待比较文本，各阶段共用的中间结果按需计算一次"""
+
+    def __init__(self, original_text, plagiarized_text):
+        self.original_text = original_text
+        self.plagiarized_text = plagiarized_text
+
+    @functools.cached_property
+    def original(self):
+        return preprocess_text(self.original_text).lower()
+
+    @functools.cached_property
+    def plagiarized(self):
+        return preprocess_text(self.plagiarized_text).lower()
+
+
+def _blank(pair, options):
+    if not pair.original_text.strip() and not pair.plagiarized_text.strip():
+        return 1.0
+    if not pair.original_text.strip() or not pair.plagiarized_text.strip():
+        return 0.0
+    if not pair.original or not pair.plagiarized:
+        return 0.0
+    return None
+
+
+def _identical(pair, options):
+    if pair.original_text == pair.plagiarized_text or pair.original == pair.plagiarized:
+        return 1.0
+    return None
+
+
+def _length(pair, options):
+    lengths = len(pair.original), len(pair.plagiarized)
+    if min(lengths) < options['min_length_ratio'] * max(lengths):
+        return 0.0
+    return None
+
+
+def _charset(pair, options):
+    original = set(pair.original)
+    plagiarized = set(pair.plagiarized)
+    original.discard(' ')
+    plagiarized.discard(' ')
+    shared = len(original & plagiarized)
+    if not shared or shared < options['min_charset_ratio'] * len(original | plagiarized):
+        return 0.0
+    return None
+
+
+def _shingle(pair, options):
+    import numpy as np
+
+    mask = np.uint64(options['sample_rate'] - 1)
+    samples = []
+    for text in (pair.original, pair.plagiarized):
+        hashes = shingle_hashes(text, options['shingle_size'])
+        samples.append(np.unique(hashes[(hashes & mask) == 0]))
+    original, plagiarized = samples
+    if len(plagiarized) < options['min_samples']:
+        return None
+    containment = len(np.intersect1d(original, plagiarized, assume_unique=True)) / len(plagiarized)
+    if containment < options['shingle_low']:
+        return round(containment, 2)
+    return None
+
+
+_STAGE_FUNCTIONS = {
+    'blank': _blank,
+    'identical': _identical,
+    'length': _length,
+    'charset': _charset,
+    'shingle': _shingle,
+}
+
+
+def cascade_options(stages=None, **overrides):
+    """
+    合并默认配置，stages 为阶段名列表或逗号分隔的字符串，为空时使用全部阶段
+    阶段总是按 CASCADE_STAGES 的顺序执行
+    """
+    options = dict(DEFAULT_OPTIONS, **overrides)
+    if stages:
+        if isinstance(stages, str):
+            stages = [stage.strip() for stage in stages.split(',') if stage.strip()]
+        unknown = [stage for stage in stages if stage not in _STAGE_FUNCTIONS]
+        if unknown:
+            raise Exception(f"不支持的筛查阶段: {', '.join(unknown)}")
+        options['stages'] = tuple(stage for stage in CASCADE_STAGES if stage in stages)
+    if options['sample_rate'] < 1 or options['sample_rate'] & (options['sample_rate'] - 1):
+        raise Exception(f"抽样率必须是2的幂: {options['sample_rate']}")
+    return options
+
+
+def screen(original_text, plagiarized_text, options=None):
+    """
+    依次执行筛查阶段，返回 Decision(相似度, 判定阶段)；所有阶段都无法下结论时返回 None
+    每个阶段的耗时记入指标 cascade_<阶段名>
+    """
+    options = options or DEFAULT_OPTIONS
+    pair = _Pair(original_text, plagiarized_text)
+    for name in options['stages']:
+        with metrics.stage(f'cascade_{name}'):
+            similarity = _STAGE_FUNCTIONS[name](pair, options)
+        if similarity is not None:
+            return Decision(similarity, name)
+    return None
+
+
+def cascade_similarity(original_text, plagiarized_text, options=None, full=calculate_similarity):
+    """筛查无法下结论时用 full（默认 calculate_similarity）做完整计算，返回 Decision(相似度, 判定阶段)"""
+    decision = screen(original_text, plagiarized_text, options)
+    if decision is not None:
+        return decision
+    return Decision(full(original_text, plagiarized_text), FULL_STAGE)
@@ -0,0 +1,94 @@
+import numpy as np
+
+from lite_scoring import pair_cosine
+
+# 默认使用字符二元组和三元组
+DEFAULT_NGRAM_SIZES = (2, 3)
+
+# 哈希桶数（2的幂）；n-gram 哈希取低位作为特征编号，不需要维护词表
+DEFAULT_BUCKETS = 1 << 22
+
+_SPACE = 0x20
+
+# 多项式滚动哈希的乘数
+HASH_BASE = np.uint64(0x100000001B3)
+
+
+def text_codes(text):
+    """文本的 Unicode 码位数组（零拷贝视图）"""
+    return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+
+
+def mix64(hashes):
+    """splitmix64 的混合步骤（原地修改 uint64 数组），打散多项式哈希的各位"""
+    hashes ^= hashes >> np.uint64(30)
+    hashes *= np.uint64(0xBF58476D1CE4E5B9)
+    hashes ^= hashes >> np.uint64(27)
+    hashes *= np.uint64(0x94D049BB133111EB)
+    hashes ^= hashes >> np.uint64(31)
+    return hashes
+
+
+def shingle_hashes(text, size, codes=None):
+    """
+    字符 n-gram 的64位哈希（NumPy 向量化）
+    字符编码按多项式滚动组合，再经 splitmix64 的混合步骤打散各位，低位可直接用于抽样或分桶
+    """
+    codes = (text_codes(text) if codes is None else codes).astype(np.uint64)
+    if len(codes) < size:
+        return np.empty(0, dtype=np.uint64)
+    count = len(codes) - size + 1
+    hashes = codes[:count].copy()
+    for offset in range(1, size):
+        hashes = hashes * HASH_BASE + codes[offset:offset + count]
+    return mix64(hashes)
+
+
+def ngram_counts(text, sizes=DEFAULT_NGRAM_SIZES, buckets=DEFAULT_BUCKETS):
+    """
+    预处理后文本的字符 n-gram 哈希词频，返回 (按编号排列的桶编号数组, 词频数组)
+    跨越空格（原文的换行、英文单词之间）的 n-gram 不计入；英文统一小写，与分词路径的计词规则一致
+    """
+    codes = text_codes(text.lower())
+    # spaces[i]：前 i 个字符中的空格数，用来判断一个窗口内是否含空格
+    spaces = np.concatenate(([0], np.cumsum(codes == _SPACE)))
+    mask = np.uint64(buckets - 1)
+    features = []
+    for size in sizes:
+        hashes = shingle_hashes(text, size, codes)
+        if len(hashes):
+            clean = spaces[size:] == spaces[:-size]
+            features.append(hashes[clean] & mask)
+    if not features:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+    return np.unique(np.concatenate(features), return_counts=True)
+
+
+def ngram_cosine(original, plagiarized):
+    """
+    两篇文档的哈希 n-gram 词频上的TF-IDF余弦相似度，加权方式与分词路径相同：
+    平滑IDF在这两篇文档上拟合，共有特征IDF为1，独有特征为 ln(3/2)+1
+    """
+    original_ids, original_counts = original
+    plagiarized_ids, plagiarized_counts = plagiarized
+    if not len(original_ids) or not len(plagiarized_ids):
+        return 0.0
+    _, original_shared, plagiarized_shared = np.intersect1d(original_ids, plagiarized_ids, assume_unique=True,
+                                                            return_indices=True)
+    original_counts = original_counts.astype(np.float64)
+    plagiarized_counts = plagiarized_counts.astype(np.float64)
+    shared_original = original_counts[original_shared]
+    shared_plagiarized = plagiarized_counts[plagiarized_shared]
+    return round(pair_cosine(float(shared_original @ shared_plagiarized),
+                             float(shared_original @ shared_original),
+                             float(shared_plagiarized @ shared_plagiarized),
+                             float(original_counts @ original_counts),
+                             float(plagiarized_counts @ plagiarized_counts)), 2)
+
+
+def ngram_similarity(original_text, plagiarized_text, sizes=DEFAULT_NGRAM_SIZES, buckets=DEFAULT_BUCKETS):
+    """
+    不分词的相似度：在 preprocess_text 的结果上取字符 n-gram 哈希词频，再计算TF-IDF余弦
+    参数为预处理后的非空文本（calculate_similarity 在 --analyzer char 时调用）
+    """
+    return ngram_cosine(ngram_counts(original_text, sizes, buckets), ngram_counts(plagiarized_text, sizes, buckets))
@@ -0,0 +1,194 @@
+import asyncio
+import contextlib
+import os
+import threading
+
+import main
+
+# 异步方法使用的线程池大小，None 表示由 ThreadPoolExecutor 按CPU核数决定
+DEFAULT_WORKERS = None
+
+
+class PlagiarismChecker:
+    """
+    可嵌入的查重对象（供Web服务等长期运行的程序直接导入使用）
+    创建时加载语料IDF模型、打开磁盘分词缓存，并预热 jieba 词典和打分流程，之后每次调用不再有初始化开销
+    配置只属于这个对象，不读取也不修改 configure_* 设置的进程级配置，同一进程中可以同时存在多个不同配置的对象
+    所有方法都可以被多个线程同时调用；a 开头的方法是 asyncio 版本，在线程池中计算，不阻塞事件循环
+    """
+
+    def __init__(self, backend='auto', analyzer='jieba', idf_model=None, cache_dir=None,
+                 memory_budget=main.DEFAULT_MEMORY_BUDGET, workers=DEFAULT_WORKERS, warm_up=True):
+        if backend not in main.SCORING_BACKENDS:
+            raise Exception(f"不支持的打分后端: {backend}")
+        if analyzer not in main.ANALYZERS:
+            raise Exception(f"不支持的分析器: {analyzer}")
+        if analyzer != 'jieba' and idf_model:
+            raise Exception("字符分析器不能与语料IDF模型同时使用")
+        if memory_budget <= 0:
+            raise Exception(f"无效的内存预算: {memory_budget}")
+
+        model = None
+        if idf_model:
+            from idf_model import IdfModel
+            model = IdfModel(idf_model)
+        segment_cache = None
+        if cache_dir:
+            from seg_cache import SegmentCache
+            segment_cache = SegmentCache(cache_dir)
+        self.options = main.ScoringOptions(backend, analyzer, model, segment_cache)
+        self.memory_budget = memory_budget
+        self._workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        # 进行中的同步调用数；close 等它归零后才释放IDF模型的内存映射
+        self._active = 0
+        self._idle = threading.Condition(self._lock)
+        self._closed = False
+        if warm_up:
+            self.warm_up()
+
+    def warm_up(self):
+        """加载 jieba 词典并走一遍完整流程，让第三方库的惰性初始化都在这里完成"""
+        if self.options.analyzer == 'jieba':
+            from seg_dict import initialize
+            initialize()
+        self.check("预热查重对象的文本内容", "预热查重对象的文本")
+
+    # --------------------------
+    # 同步接口
+    # --------------------------
+    def check(self, original_text, plagiarized_text):
+        """计算两段文本的相似度（保留两位小数），结果与 calculate_similarity 相同"""
+        with self._in_use():
+            return self._check(original_text, plagiarized_text)
+
+    def _check(self, original_text, plagiarized_text):
+        return main.calculate_similarity(original_text, plagiarized_text, options=self.options)
+
+    def check_files(self, original_file, plagiarized_file):
+        """
+        计算两个文件的相似度
+        文件内容按 (路径, 修改时间, 大小) 缓存，文件被修改后自动重新读取；
+        估计内存占用超过内存预算的文件改为流式计算（字符分析器总是整篇读入）
+        """
+        with self._in_use():
+            for file_path in (original_file, plagiarized_file):
+                if not os.path.exists(file_path):
+                    raise Exception(f"文件不存在: {file_path}")
+            largest_file_size = max(os.path.getsize(original_file), os.path.getsize(plagiarized_file))
+            if self.options.analyzer == 'jieba' and largest_file_size * main.IN_MEMORY_FACTOR > self.memory_budget:
+                return main.calculate_similarity_files(original_file, plagiarized_file,
+                                                       main.stream_chunk_size(self.memory_budget), self.options)
+            return self._check(main.cached_read_file(original_file), main.cached_read_file(plagiarized_file))
+
+    def check_many(self, pairs):
+        """逐对计算 [(原文, 抄袭版), ...] 的相似度，返回相似度列表"""
+        with self._in_use():
+            return [self._check(original_text, plagiarized_text) for original_text, plagiarized_text in pairs]
+
+    def iter_rows(self, texts, query_indices=None):
+        """
+        批量相似度矩阵（一对多 / 多对多），所有文本共用一次TF-IDF拟合，与 batch 子命令的结果相同
+        逐行产出 (行号, 相似度列表)，不一次性生成整个矩阵
+        """
+        self._check_open()
+        if self.options.analyzer != 'jieba':
+            raise Exception("字符分析器不支持批量相似度矩阵")
+        return self._iter_rows(main.iter_similarity_rows(texts, query_indices, options=self.options))
+
+    def _iter_rows(self, rows):
+        """逐行计算时登记为进行中的调用；行与行之间不占用，未读完就丢弃的迭代器不会阻塞 close"""
+        done = object()
+        while True:
+            with self._in_use():
+                item = next(rows, done)
+            if item is done:
+                return
+            yield item
+
+    def check_matrix(self, texts, query_indices=None):
+        """批量相似度矩阵，返回相似度列表的列表（按 query_indices 的顺序）"""
+        return [row for _, row in self.iter_rows(texts, query_indices)]
+
+    # --------------------------
+    # asyncio 接口
+    # --------------------------
+    def _get_executor(self):
+        self._check_open()
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(self._workers, thread_name_prefix='paper_check')
+            return self._executor
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), function, *args)
+
+    async def acheck(self, original_text, plagiarized_text):
+        return await self._run(self.check, original_text, plagiarized_text)
+
+    async def acheck_files(self, original_file, plagiarized_file):
+        return await self._run(self.check_files, original_file, plagiarized_file)
+
+    async def acheck_many(self, pairs):
+        """各对文本并发提交到线程池，按输入顺序返回相似度列表"""
+        return list(await asyncio.gather(*(self.acheck(original_text, plagiarized_text)
+                                           for original_text, plagiarized_text in pairs)))
+
+    async def aiter_rows(self, texts, query_indices=None):
+        """iter_rows 的异步版本：每一行在线程池中计算，算完一行产出一行"""
+        rows = await self._run(self.iter_rows, texts, query_indices)
+        done = object()
+        while True:
+            item = await self._run(next, rows, done)
+            if item is done:
+                return
+            yield item
+
+    async def acheck_matrix(self, texts, query_indices=None):
+        return await self._run(self.check_matrix, texts, query_indices)
+
+    # --------------------------
+    # 生命周期
+    # --------------------------
+    def _check_open(self):
+        if self._closed:
+            raise Exception("查重对象已关闭")
+
+    @contextlib.contextmanager
+    def _in_use(self):
+        """登记一次进行中的同步调用：关闭后不再接受新调用，close 等已登记的调用结束"""
+        with self._lock:
+            self._check_open()
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+                if not self._active:
+                    self._idle.notify_all()
+
+    def close(self):
+        """
+        不再接受新调用，等待进行中的同步调用和异步任务结束，关闭线程池并释放IDF模型的内存映射
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._lock:
+            while self._active:
+                self._idle.wait()
+        if self.options.idf_model is not None:
+            self.options.idf_model.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
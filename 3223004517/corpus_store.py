@@ -0,0 +1,432 @@
+import argparse
+import bisect
+import functools
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+from collections import Counter
+
+import numpy as np
+
+import metrics
+from main import (collect_text_files, preprocess_text, segment_text, similarity_from_counts,
+                  similarity_rows_from_matrix)
+from utils import document_labels, read_file, write_similarity_rows
+from vocabulary import Vocabulary, tfidf_matrix
+
+# 语料库目录结构：
+#   corpus.db               文档元数据表、词表和分段列表（SQLite）
+#   segments/000001/        每次收录写入一个只追加的分段，由以下 .npy 数组组成：
+#     token_ids.npy         各文档的词编号序列依次拼接（uint32）
+#     token_indptr.npy      第 i 篇文档的词编号为 token_ids[token_indptr[i]:token_indptr[i + 1]]
+#     count_indptr.npy      词频矩阵（CSR，文档 × 词表）的行偏移
+#     count_indices.npy     每篇文档出现过的词编号，行内升序
+#     count_data.npy        对应的词频
+# 分段写完后才登记到 corpus.db，打开语料库时数组以 mmap 方式按需映射，不读入内存
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    term TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    first_row INTEGER NOT NULL,
+    documents INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    row INTEGER PRIMARY KEY,
+    doc_id TEXT UNIQUE NOT NULL,
+    segment INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    blank INTEGER NOT NULL,
+    has_words INTEGER NOT NULL,
+    tokens INTEGER NOT NULL
+);
+"""
+
+_ARRAYS = ('token_ids', 'token_indptr', 'count_indptr', 'count_indices', 'count_data')
+
+# 命令行收录时每个分段的文档数
+DEFAULT_SEGMENT_SIZE = 10000
+
+
+class _Segment:
+    """一个只读分段，数组在第一次访问时以 mmap 方式映射"""
+
+    def __init__(self, directory, segment_id, first_row, documents):
+        self.directory = directory
+        self.id = segment_id
+        self.first_row = first_row
+        self.documents = documents
+
+    def __getattr__(self, name):
+        if name not in _ARRAYS:
+            raise AttributeError(name)
+        array = np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode='r')
+        setattr(self, name, array)
+        return array
+
+    def count_matrix(self, vocabulary_size):
+        """分段的词频矩阵，直接引用映射的数组，不复制"""
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix((self.count_data, self.count_indices, self.count_indptr),
+                          shape=(self.documents, vocabulary_size), copy=False)
+
+
+class StoreVocabulary:
+    """
+    语料库词表的只读视图，满足 similarity_from_counts / tfidf_matrix 对词表的要求（len 和 terms）
+    terms 在需要按词排序或映射IDF模型时才整体读取
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+
+    @functools.cached_property
+    def terms(self):
+        return [row[0] for row in self.connection.execute("SELECT term FROM terms ORDER BY id")]
+
+    def get(self, term, default=None):
+        row = self.connection.execute("SELECT id FROM terms WHERE term = ?", (term,)).fetchone()
+        return default if row is None else row[0]
+
+
+class CorpusStore:
+    """
+    分词后的论文语料库：词编号序列和词频矩阵按 CSR 布局分段保存为 .npy 文件，元数据保存在 SQLite
+    收录只追加新分段，已有分段从不改写；打开时只读取分段列表，数组按需 mmap，与语料规模无关
+    文档按收录顺序编号（行号），词频与 calculate_similarity 的计词规则一致
+    """
+
+    def __init__(self, directory):
+        try:
+            os.makedirs(os.path.join(directory, 'segments'), exist_ok=True)
+            # 多个进程同时收录时，写锁在写入整个分段期间被持有，等待而不是立即报错
+            self.connection = sqlite3.connect(os.path.join(directory, 'corpus.db'), timeout=600)
+            self.connection.executescript(_SCHEMA)
+        except (OSError, sqlite3.Error) as e:
+            raise Exception(f"打开语料库失败: {str(e)}")
+        self.directory = directory
+        self.vocabulary = StoreVocabulary(self.connection)
+        self._load_segments()
+
+    def _load_segments(self):
+        self.segments = [
+            _Segment(self._segment_directory(segment_id), segment_id, first_row, documents)
+            for segment_id, first_row, documents in self.connection.execute(
+                "SELECT id, first_row, documents FROM segments ORDER BY id")]
+        self._first_rows = [segment.first_row for segment in self.segments]
+
+    def _segment_directory(self, segment_id):
+        return os.path.join(self.directory, 'segments', f"{segment_id:06d}")
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        if not self.segments:
+            return 0
+        return self.segments[-1].first_row + self.segments[-1].documents
+
+    def __contains__(self, doc_id):
+        return self.row(doc_id) is not None
+
+    def row(self, doc_id):
+        """文档编号对应的行号，未收录时返回 None"""
+        found = self.connection.execute("SELECT row FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return None if found is None else found[0]
+
+    def document(self, row):
+        """文档元数据：{'doc_id', 'content_hash', 'blank', 'has_words', 'tokens'}"""
+        found = self.connection.execute(
+            "SELECT doc_id, content_hash, blank, has_words, tokens FROM documents WHERE row = ?", (row,)).fetchone()
+        if found is None:
+            raise Exception(f"语料库中没有第 {row} 篇文档")
+        return {'doc_id': found[0], 'content_hash': found[1], 'blank': bool(found[2]),
+                'has_words': bool(found[3]), 'tokens': found[4]}
+
+    def doc_ids(self):
+        return [row[0] for row in self.connection.execute("SELECT doc_id FROM documents ORDER BY row")]
+
+    def _locate(self, row):
+        if not 0 <= row < len(self):
+            raise Exception(f"语料库中没有第 {row} 篇文档")
+        segment = self.segments[bisect.bisect_right(self._first_rows, row) - 1]
+        return segment, row - segment.first_row
+
+    def token_ids(self, row):
+        """文档的词编号序列（映射数组的视图）"""
+        segment, local = self._locate(row)
+        return segment.token_ids[segment.token_indptr[local]:segment.token_indptr[local + 1]]
+
+    def term_counts(self, row):
+        """文档的 (词编号数组, 词频数组)，均为映射数组的视图"""
+        segment, local = self._locate(row)
+        start, end = segment.count_indptr[local], segment.count_indptr[local + 1]
+        return segment.count_indices[start:end], segment.count_data[start:end]
+
+    def count_matrix(self, rows=None):
+        """
+        词频矩阵（CSR，行对应 rows，默认全部文档）
+        单个分段的全部文档直接引用映射数组；跨分段或选取部分文档时只复制选中的行
+        """
+        from scipy.sparse import csr_matrix, vstack
+
+        vocabulary_size = len(self.vocabulary)
+        if rows is None:
+            blocks = [segment.count_matrix(vocabulary_size) for segment in self.segments]
+            if len(blocks) == 1:
+                return blocks[0]
+            order = None
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+            if len(rows) and (rows.min() < 0 or rows.max() >= len(self)):
+                raise Exception("文档行号越界")
+            segment_of = np.searchsorted(np.asarray(self._first_rows, dtype=np.int64), rows, side='right') - 1
+            blocks, selected = [], []
+            for index, segment in enumerate(self.segments):
+                picked = np.flatnonzero(segment_of == index)
+                if len(picked):
+                    blocks.append(segment.count_matrix(vocabulary_size)[rows[picked] - segment.first_row])
+                    selected.append(picked)
+            order = np.argsort(np.concatenate(selected)) if selected else None
+        if not blocks:
+            return csr_matrix((0, vocabulary_size), dtype=np.int64)
+        matrix = vstack(blocks, format='csr')
+        return matrix if order is None else matrix[order]
+
+    def document_frequencies(self):
+        """每个词出现在多少篇文档中（按词编号排列）"""
+        frequencies = np.zeros(len(self.vocabulary), dtype=np.int64)
+        for segment in self.segments:
+            frequencies += np.bincount(segment.count_indices, minlength=len(frequencies))
+        return frequencies
+
+    def similarity(self, original_row, plagiarized_row):
+        """两篇已收录文档的相似度，直接使用保存的词频，结果与 calculate_similarity 一致"""
+        original = self.document(original_row)
+        plagiarized = self.document(plagiarized_row)
+        if original['blank'] and plagiarized['blank']:
+            return 1.0
+        if original['blank'] or plagiarized['blank']:
+            return 0.0
+        if not original['has_words'] or not plagiarized['has_words']:
+            return 0.0
+        original_counts = Counter(dict(zip(*(array.tolist() for array in self.term_counts(original_row)))))
+        plagiarized_counts = Counter(dict(zip(*(array.tolist() for array in self.term_counts(plagiarized_row)))))
+        if not original_counts and not plagiarized_counts:
+            raise Exception("文本向量化失败: empty vocabulary; perhaps the documents only contain stop words")
+        return similarity_from_counts(original_counts, plagiarized_counts, self.vocabulary)
+
+    def iter_similarity_rows(self, rows=None, query_indices=None, max_features=5000, block_size=256):
+        """
+        与 iter_similarity_rows 相同的批量相似度计算，词频直接取自语料库，不再读取原文和分词
+        rows 为参与比较的文档行号（默认全部），query_indices 为 rows 中的下标
+        """
+        rows = list(range(len(self))) if rows is None else list(rows)
+        if query_indices is None:
+            query_indices = range(len(rows))
+        query_indices = list(query_indices)
+        for index in query_indices:
+            if not 0 <= index < len(rows):
+                raise Exception(f"查询文档序号越界: {index}")
+        blank = [self.document(row)['blank'] for row in rows]
+
+        try:
+            with metrics.stage('vectorize'):
+                counts = self.count_matrix(rows)
+                matrix = tfidf_matrix(counts, self.vocabulary, max_features) if counts.nnz else None
+        except Exception as e:
+            raise Exception(f"文本向量化失败: {str(e)}")
+        yield from similarity_rows_from_matrix(matrix, blank, query_indices, block_size)
+
+    def add_documents(self, documents):
+        """
+        收录 (文档编号, 原文) 序列，写成一个新分段，返回新增文档数
+        已收录或本批重复的文档编号被跳过（语料库只追加，不更新已有文档）
+        """
+        pending, seen = [], set()
+        for doc_id, text in documents:
+            if doc_id in seen or doc_id in self:
+                continue
+            seen.add(doc_id)
+            pending.append((doc_id, text))
+        if not pending:
+            return 0
+
+        # 分词不持有写锁：新词先按快照之后的本地编号记录，登记时再换成语料库中的编号
+        vocabulary = Vocabulary()
+        for (term,) in self.connection.execute("SELECT term FROM terms ORDER BY id"):
+            vocabulary.intern(term)
+        known_terms = len(vocabulary)
+
+        token_arrays, metadata = [], []
+        for doc_id, text in pending:
+            processed = preprocess_text(text) if text.strip() else ''
+            words = segment_text(processed) if processed else []
+            token_ids = np.frombuffer(vocabulary.term_ids(words), dtype=np.uint32)
+            token_arrays.append(token_ids)
+            metadata.append((doc_id, hashlib.sha256(text.encode('utf-8')).hexdigest(),
+                             int(not text.strip()), int(bool(words)), len(token_ids)))
+
+        connection = self.connection
+        try:
+            with connection:
+                # 写锁保证同时只有一个进程登记新词和分段；分词期间其他进程可能已收录相同的文档、
+                # 登记了新词，持锁后重新核对文档编号并分配词编号
+                connection.execute("BEGIN IMMEDIATE")
+                keep = [index for index, item in enumerate(metadata) if item[0] not in self]
+                token_arrays = [token_arrays[index] for index in keep]
+                metadata = [metadata[index] for index in keep]
+                if metadata:
+                    token_arrays, new_terms, vocabulary_size = self._assign_term_ids(
+                        vocabulary, known_terms, token_arrays)
+                    segment_id = (connection.execute("SELECT MAX(id) FROM segments").fetchone()[0] or 0) + 1
+                    first_row = connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+                    self._write_segment(segment_id, _segment_arrays(token_arrays, vocabulary_size))
+                    connection.executemany("INSERT INTO terms (id, term) VALUES (?, ?)", new_terms)
+                    connection.execute("INSERT INTO segments (id, first_row, documents) VALUES (?, ?, ?)",
+                                       (segment_id, first_row, len(metadata)))
+                    connection.executemany(
+                        "INSERT INTO documents (row, doc_id, segment, content_hash, blank, has_words, tokens) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [(first_row + index, doc_id, segment_id, content_hash, blank, has_words, tokens)
+                         for index, (doc_id, content_hash, blank, has_words, tokens) in enumerate(metadata)])
+        except (OSError, sqlite3.Error) as e:
+            raise Exception(f"写入语料库失败: {str(e)}")
+
+        self.vocabulary.__dict__.pop('terms', None)
+        self._load_segments()
+        return len(metadata)
+
+    def _assign_term_ids(self, vocabulary, known_terms, token_arrays):
+        """
+        把本地编号的新词换成语料库中的编号（调用方持有写锁）
+        其他进程在分词期间登记的词沿用已有编号，其余新词接着编号，只登记实际用到的词
+        返回 (换号后的词编号序列, 需要登记的 [(编号, 词)], 登记后的词表大小)
+        """
+        registered = dict(self.connection.execute("SELECT term, id FROM terms WHERE id >= ?", (known_terms,)))
+        next_id = known_terms + len(registered)
+        mapping = np.arange(len(vocabulary), dtype=np.uint32)
+        new_terms = []
+        used = np.unique(_concatenate(token_arrays, np.uint32))
+        for local_id in used[used >= known_terms].tolist():
+            term = vocabulary.terms[local_id]
+            term_id = registered.get(term)
+            if term_id is None:
+                term_id = next_id
+                next_id += 1
+                new_terms.append((term_id, term))
+            mapping[local_id] = term_id
+        return [mapping[token_ids] for token_ids in token_arrays], new_terms, next_id
+
+    def _write_segment(self, segment_id, arrays):
+        """先写入临时目录再整体改名；未登记的残留分段目录（上次写入中断）会被覆盖"""
+        final = self._segment_directory(segment_id)
+        temporary = f"{final}.tmp-{os.getpid()}"
+        if os.path.exists(temporary):
+            shutil.rmtree(temporary)
+        os.makedirs(temporary)
+        for name, array in arrays.items():
+            np.save(os.path.join(temporary, f"{name}.npy"), array)
+        if os.path.exists(final):
+            shutil.rmtree(final)
+        os.replace(temporary, final)
+
+
+def _segment_arrays(token_arrays, vocabulary_size):
+    """由各文档的词编号序列生成分段的全部数组（词频矩阵的行内词编号升序）"""
+    count_indices, count_data = [], []
+    for token_ids in token_arrays:
+        terms, counts = np.unique(token_ids, return_counts=True)
+        count_indices.append(terms)
+        count_data.append(counts)
+    nnz = sum(len(terms) for terms in count_indices)
+    # CSR 的行偏移与列下标类型一致时 scipy 才能直接引用映射数组
+    index_dtype = np.int32 if max(nnz, vocabulary_size) < 2 ** 31 else np.int64
+    return {
+        'token_ids': _concatenate(token_arrays, np.uint32),
+        'token_indptr': _offsets(token_arrays, np.int64),
+        'count_indptr': _offsets(count_indices, index_dtype),
+        'count_indices': _concatenate(count_indices, index_dtype),
+        'count_data': _concatenate(count_data, np.uint32),
+    }
+
+
+def _concatenate(arrays, dtype):
+    if not arrays:
+        return np.empty(0, dtype=dtype)
+    return np.concatenate(arrays).astype(dtype, copy=False)
+
+
+def _offsets(arrays, dtype):
+    offsets = np.zeros(len(arrays) + 1, dtype=dtype)
+    np.cumsum([len(array) for array in arrays], out=offsets[1:])
+    return offsets
+
+
+def corpus_main(argv):
+    """
+    语料库子命令
+    python main.py corpus add 语料库目录 论文文件或目录... [--segment-size N]
+    python main.py corpus info 语料库目录
+    python main.py corpus matrix 语料库目录 [--query 文档] [--format csv|jsonl] [-o 输出文件]
+    """
+    parser = argparse.ArgumentParser(prog='main.py corpus', description='分词后的论文语料库')
+    actions = parser.add_subparsers(dest='action', required=True)
+
+    add_parser = actions.add_parser('add', help='收录论文（只追加，已收录的论文跳过）')
+    add_parser.add_argument('corpus_dir', help='语料库目录')
+    add_parser.add_argument('documents', nargs='+', help='论文文件或目录')
+    add_parser.add_argument('--segment-size', type=int, default=DEFAULT_SEGMENT_SIZE, help='每个分段的文档数')
+
+    info_parser = actions.add_parser('info', help='查看语料库规模')
+    info_parser.add_argument('corpus_dir', help='语料库目录')
+
+    matrix_parser = actions.add_parser('matrix', help='直接用语料库中的词频计算相似度矩阵')
+    matrix_parser.add_argument('corpus_dir', help='语料库目录')
+    matrix_parser.add_argument('--query', help='已收录的论文路径，指定后只输出该论文与其余论文的一行相似度')
+    matrix_parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv', help='输出格式')
+    matrix_parser.add_argument('-o', '--output', default='-', help='输出文件路径，默认输出到标准输出')
+
+    try:
+        args = parser.parse_args(argv)
+        if args.action != 'add' and not os.path.exists(os.path.join(args.corpus_dir, 'corpus.db')):
+            raise Exception(f"语料库不存在: {args.corpus_dir}")
+        store = CorpusStore(args.corpus_dir)
+        try:
+            if args.action == 'add':
+                if args.segment_size <= 0:
+                    raise Exception(f"无效的分段大小: {args.segment_size}")
+                paths = [os.path.abspath(path) for path in collect_text_files(args.documents)]
+                paths = [path for path in paths if path not in store]
+                added = 0
+                for start in range(0, len(paths), args.segment_size):
+                    batch = paths[start:start + args.segment_size]
+                    added += store.add_documents((path, read_file(path)) for path in batch)
+                print(f"收录完成，新增 {added} 篇，共 {len(store)} 篇，{len(store.segments)} 个分段")
+            elif args.action == 'info':
+                print(f"语料库: {args.corpus_dir}，{len(store)} 篇，{len(store.vocabulary)} 个词，"
+                      f"{len(store.segments)} 个分段")
+            else:
+                names = document_labels(store.doc_ids())
+                if args.query:
+                    query = store.row(os.path.abspath(args.query))
+                    if query is None:
+                        raise Exception(f"论文未收录: {args.query}")
+                    rows = ((index, row[:query] + row[query + 1:])
+                            for index, row in store.iter_similarity_rows(query_indices=[query]))
+                    write_similarity_rows(args.output, names, names[:query] + names[query + 1:], rows, args.format)
+                else:
+                    write_similarity_rows(args.output, names, names, store.iter_similarity_rows(), args.format)
+        finally:
+            store.close()
+    except Exception as e:
+        print(f"错误: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,224 @@
+import argparse
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import Counter
+
+from vocabulary import DEFAULT_MIN_TERM_LENGTH
+
+# 模型文件格式：
+#   文件头  魔数(8字节) + 词数、文档数、最短词长、字节序标记（各8字节）
+#   偏移表  uint64 × (词数 + 1)，第 i 个词在词表区中的起止位置
+#   IDF表   float64 × 词数
+#   词表区  按 UTF-8 字节序排列的词语拼接
+# 所有区块都可直接映射为只读视图，多个进程打开同一模型时共享操作系统页缓存
+MAGIC = b'PCIDF\x00\x01\x00'
+_HEADER = struct.Struct('<8sQQQQ')
+_BYTE_ORDER = {'little': 1, 'big': 2}
+
+
+def smooth_idf(document_frequency, document_count):
+    """平滑IDF，与 TfidfVectorizer 默认参数一致"""
+    return math.log((1 + document_count) / (1 + document_frequency)) + 1
+
+
+def build_idf_model(documents, output_path, min_term_length=DEFAULT_MIN_TERM_LENGTH, max_terms=None):
+    """
+    在参考语料上拟合词表和IDF，并写入可内存映射的模型文件
+    documents 为分词结果（词列表）的可迭代对象，逐篇处理，不需要同时持有全部文档
+    max_terms 限制词表大小时保留文档频率最高的词
+    返回加载后的 IdfModel
+    """
+    document_frequencies = Counter()
+    document_count = 0
+    for words in documents:
+        document_count += 1
+        document_frequencies.update({word.lower() for word in words if len(word) >= min_term_length})
+    if not document_frequencies:
+        raise Exception("参考语料中没有可用的词语")
+
+    if max_terms is not None and len(document_frequencies) > max_terms:
+        document_frequencies = dict(document_frequencies.most_common(max_terms))
+
+    entries = sorted((term.encode('utf-8'), frequency) for term, frequency in document_frequencies.items())
+    offsets = array('Q', [0])
+    idf = array('d')
+    for term, frequency in entries:
+        offsets.append(offsets[-1] + len(term))
+        idf.append(smooth_idf(frequency, document_count))
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+        idf.byteswap()
+
+    try:
+        directory = os.path.dirname(output_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temp_path = output_path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(_HEADER.pack(MAGIC, len(entries), document_count, min_term_length, _BYTE_ORDER['little']))
+            file.write(offsets.tobytes())
+            file.write(idf.tobytes())
+            for term, _ in entries:
+                file.write(term)
+        os.replace(temp_path, output_path)
+    except Exception as e:
+        raise Exception(f"保存IDF模型失败: {str(e)}")
+    return IdfModel(output_path)
+
+
+class IdfModel:
+    """
+    预先拟合、内存映射的语料IDF模型
+    加载时只映射文件、不复制数据；查询时在映射的有序词表上二分查找
+    之后的每次查重只做 transform：词频 × IDF，L2归一化，词表外的词不计入（与 TfidfVectorizer.transform 一致）
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise Exception(f"IDF模型文件不存在: {path}")
+        try:
+            with open(path, 'rb') as file:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, term_count, document_count, min_term_length, byte_order = _HEADER.unpack_from(self._mmap, 0)
+        except (OSError, ValueError, struct.error) as e:
+            raise Exception(f"加载IDF模型失败: {str(e)}")
+        if magic != MAGIC:
+            raise Exception(f"不是有效的IDF模型文件: {path}")
+        if byte_order != _BYTE_ORDER[sys.byteorder]:
+            raise Exception(f"IDF模型文件的字节序与本机不一致: {path}")
+
+        self.path = path
+        self.term_count = term_count
+        self.document_count = document_count
+        self.min_term_length = min_term_length
+
+        view = memoryview(self._mmap)
+        start = _HEADER.size
+        self._offsets = view[start:start + 8 * (term_count + 1)].cast('Q')
+        start += 8 * (term_count + 1)
+        self._idf = view[start:start + 8 * term_count].cast('d')
+        self._terms_start = start + 8 * term_count
+
+    def __len__(self):
+        return self.term_count
+
+    def _term_bytes(self, index):
+        start = self._terms_start + self._offsets[index]
+        end = self._terms_start + self._offsets[index + 1]
+        return self._mmap[start:end]
+
+    def term_id(self, term):
+        """二分查找词的编号，词表外返回 -1"""
+        key = term.encode('utf-8')
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term_bytes(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.term_count and self._term_bytes(low) == key:
+            return low
+        return -1
+
+    def idf(self, term):
+        """词的IDF，词表外返回 None"""
+        term_id = self.term_id(term)
+        return self._idf[term_id] if term_id >= 0 else None
+
+    def weights(self, words):
+        """transform 单篇文档：返回 {词编号: 词频 × IDF}，词表外的词被忽略"""
+        return self.count_weights(Counter(word.lower() for word in words if len(word) >= self.min_term_length))
+
+    def count_weights(self, term_counts):
+        """由 {词: 词频} 计算 {词编号: 词频 × IDF}，词表外的词被忽略"""
+        weights = {}
+        for term, count in term_counts.items():
+            term_id = self.term_id(term)
+            if term_id >= 0:
+                weights[term_id] = count * self._idf[term_id]
+        return weights
+
+    @staticmethod
+    def cosine(original, plagiarized):
+        """两个 {词编号: 权重} 向量的余弦相似度，保留两位小数"""
+        if not original or not plagiarized:
+            return 0.0
+        if len(original) > len(plagiarized):
+            original, plagiarized = plagiarized, original
+        dot = sum(weight * plagiarized[term_id] for term_id, weight in original.items() if term_id in plagiarized)
+        norm = math.sqrt(sum(weight * weight for weight in original.values())) * \
+            math.sqrt(sum(weight * weight for weight in plagiarized.values()))
+        return round(min(dot / norm, 1.0), 2)
+
+    def similarity(self, original_words, plagiarized_words):
+        """用模型IDF计算两篇文档的余弦相似度，保留两位小数"""
+        return self.cosine(self.weights(original_words), self.weights(plagiarized_words))
+
+    def transform(self, documents):
+        """transform 多篇文档：返回L2归一化的稀疏矩阵（文档 × 模型词表）"""
+        import numpy as np
+        from scipy.sparse import csr_matrix
+        from sklearn.preprocessing import normalize
+
+        rows = [self.weights(words) for words in documents]
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in rows], out=indptr[1:])
+        indices = np.fromiter((term_id for row in rows for term_id in row), dtype=np.int64, count=int(indptr[-1]))
+        data = np.fromiter((weight for row in rows for weight in row.values()), dtype=np.float64,
+                           count=int(indptr[-1]))
+        matrix = csr_matrix((data, indices, indptr), shape=(len(rows), max(self.term_count, 1)))
+        return normalize(matrix)
+
+    def transform_counts(self, counts):
+        """transform 词频矩阵（CSR，文档 × 模型词表）：词频 × IDF 后L2归一化，结果与 transform 相同"""
+        import numpy as np
+        from sklearn.preprocessing import normalize
+
+        idf = np.frombuffer(self._idf, dtype=np.float64, count=self.term_count)
+        return normalize(counts.multiply(idf[:counts.shape[1]]).tocsr())
+
+    def close(self):
+        """释放内存映射"""
+        self._offsets.release()
+        self._idf.release()
+        self._mmap.close()
+
+
+def model_main(argv):
+    """
+    IDF模型子命令
+    python main.py model build 模型文件 参考论文文件或目录... [--max-terms N]
+    python main.py model info 模型文件
+    """
+    from main import collect_text_files, preprocess_text, segment_text
+    from utils import read_file
+
+    parser = argparse.ArgumentParser(prog='main.py model', description='语料IDF模型')
+    actions = parser.add_subparsers(dest='action', required=True)
+
+    build_parser = actions.add_parser('build', help='在参考语料上拟合IDF模型')
+    build_parser.add_argument('model_file', help='模型文件路径')
+    build_parser.add_argument('documents', nargs='+', help='参考论文文件或目录')
+    build_parser.add_argument('--max-terms', type=int, default=None, help='词表大小上限，保留文档频率最高的词')
+
+    info_parser = actions.add_parser('info', help='查看模型信息')
+    info_parser.add_argument('model_file', help='模型文件路径')
+
+    try:
+        args = parser.parse_args(argv)
+        if args.action == 'build':
+            files = collect_text_files(args.documents)
+            documents = (segment_text(preprocess_text(read_file(path))) for path in files)
+            model = build_idf_model(documents, args.model_file, max_terms=args.max_terms)
+        else:
+            model = IdfModel(args.model_file)
+        print(f"IDF模型: {args.model_file}，文档数 {model.document_count}，词表大小 {len(model)}")
+        model.close()
+    except Exception as e:
+        print(f"错误: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,313 @@
+import argparse
+import hashlib
+import heapq
+import math
+import os
+import sqlite3
+import sys
+from collections import Counter
+
+from lite_scoring import pair_cosine
+from main import calculate_similarity, collect_text_files, preprocess_text, segment_text
+from utils import read_file
+from vocabulary import DEFAULT_MIN_TERM_LENGTH
+
+# 与 calculate_similarity 相同的特征上限；两篇文档的词表并集超过它时 sklearn 会截断特征
+MAX_FEATURES = 5000
+
+# 单条 SQL 语句中 IN (...) 的参数个数上限：旧版 SQLite 的 SQLITE_MAX_VARIABLE_NUMBER 默认为999，
+# 查询词更多时分批查询
+MAX_SQL_VARIABLES = 900
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    doc_id TEXT UNIQUE NOT NULL,
+    content_hash TEXT NOT NULL,
+    term_count INTEGER NOT NULL,
+    sum_squares INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    term TEXT UNIQUE NOT NULL,
+    df INTEGER NOT NULL,
+    max_weight REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term_id INTEGER NOT NULL,
+    doc INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    weight REAL NOT NULL,
+    PRIMARY KEY (term_id, doc)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS documents_term_count ON documents (term_count);
+"""
+
+
+def _batches(values, reserved=0):
+    """把参数列表切分为批次，每批加上另占的 reserved 个参数不超过 MAX_SQL_VARIABLES，对应一条 IN (...) 查询"""
+    values = list(values)
+    size = MAX_SQL_VARIABLES - reserved
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def document_terms(text):
+    """与 calculate_similarity 相同的预处理、分词和计词规则，返回 {词: 词频}"""
+    processed = preprocess_text(text) if text.strip() else ''
+    words = segment_text(processed) if processed else []
+    return Counter(word.lower() for word in words if len(word) >= DEFAULT_MIN_TERM_LENGTH)
+
+
+class InvertedIndex:
+    """
+    SQLite 倒排索引：词 → (文档, 词频, 归一化词频) 的倒排表
+    查询按 MaxScore 剪枝取前K篇，得分与命令行两两查重的结果一致
+
+    剪枝上界：两篇文档单独拟合的TF-IDF中独有词的IDF大于1，只会增大范数，
+    所以余弦相似度不超过原始词频向量的余弦，而后者可以按词拆分为
+    (查询词频 / 查询范数) × (文档词频 / 文档范数)，每个词取倒排表中的最大值即为该词贡献的上界。
+    这些量只与单篇文档有关，新增文档不会让已有倒排表失效
+
+    必要词的倒排表按文档顺序逐行读取，非必要词只对候选文档按 (词, 文档) 主键查询，
+    阈值升高后常见词变为非必要词，其倒排表的剩余部分不再读取
+    """
+
+    def __init__(self, path):
+        try:
+            self.connection = sqlite3.connect(path)
+            self.connection.executescript(_SCHEMA)
+        except sqlite3.Error as e:
+            raise Exception(f"打开倒排索引失败: {str(e)}")
+        self.path = path
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def add(self, doc_id, text):
+        """
+        加入或更新一篇文档，返回是否有变化（内容未变时跳过）
+        更新时旧倒排项被删除；词的最大权重只增不减，仍是有效的上界
+        """
+        content_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        connection = self.connection
+        row = connection.execute("SELECT id, content_hash FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        if row is not None and row[1] == content_hash:
+            return False
+
+        counts = document_terms(text)
+        sum_squares = sum(count * count for count in counts.values())
+        norm = math.sqrt(sum_squares) if sum_squares else 1.0
+
+        with connection:
+            if row is not None:
+                connection.execute("UPDATE terms SET df = df - 1 WHERE id IN "
+                                   "(SELECT term_id FROM postings WHERE doc = ?)", (row[0],))
+                connection.execute("DELETE FROM postings WHERE doc = ?", (row[0],))
+                connection.execute("DELETE FROM documents WHERE id = ?", (row[0],))
+            doc = connection.execute(
+                "INSERT INTO documents (doc_id, content_hash, term_count, sum_squares) VALUES (?, ?, ?, ?)",
+                (doc_id, content_hash, len(counts), sum_squares)).lastrowid
+
+            postings = []
+            for term, count in counts.items():
+                weight = count / norm
+                connection.execute(
+                    "INSERT INTO terms (term, df, max_weight) VALUES (?, 1, ?) "
+                    "ON CONFLICT(term) DO UPDATE SET df = df + 1, max_weight = MAX(max_weight, excluded.max_weight)",
+                    (term, weight))
+                term_id = connection.execute("SELECT id FROM terms WHERE term = ?", (term,)).fetchone()[0]
+                postings.append((term_id, doc, count, weight))
+            connection.executemany("INSERT INTO postings (term_id, doc, tf, weight) VALUES (?, ?, ?, ?)", postings)
+        return True
+
+    def _postings(self, term_id):
+        """按文档编号顺序逐行读取一个词的倒排表：(文档编号, 词频, 归一化词频)，不一次性读入内存"""
+        return self.connection.execute(
+            "SELECT doc, tf, weight FROM postings WHERE term_id = ? ORDER BY doc", (term_id,))
+
+    def search(self, text, top_k=10, loader=read_file):
+        """
+        查询与 text 最相似的前 top_k 篇文档，返回 [(文档编号, 相似度)]，按相似度从高到低排列
+        相似度与 calculate_similarity(原文, text) 相同
+
+        与查询的词表并集可能超过特征上限的文档，sklearn 截断特征后的得分不受原始词频余弦的约束，
+        这些文档不参与剪枝：先用 loader 读取原文调用 calculate_similarity 逐篇计算，其余文档再按 MaxScore 剪枝
+        """
+        query = document_terms(text)
+        if not query or top_k <= 0:
+            return []
+        query_squares = sum(count * count for count in query.values())
+        query_norm = math.sqrt(query_squares)
+
+        # 查询词按贡献上界从小到大排列
+        rows = []
+        for batch in _batches(query):
+            rows.extend(self.connection.execute(
+                f"SELECT id, term, max_weight FROM terms WHERE df > 0 AND term IN ({','.join('?' * len(batch))})",
+                batch))
+        terms = sorted(((query[term] / query_norm * max_weight, term_id, query[term])
+                        for term_id, term, max_weight in rows), key=lambda item: item[0])
+        if not terms:
+            return []
+        bounds = [bound for bound, _, _ in terms]
+        # prefix[i]：上界最小的 i 个词的上界之和
+        prefix = [0.0]
+        for bound in bounds:
+            prefix.append(prefix[-1] + bound)
+
+        documents = {}
+
+        def document(doc):
+            info = documents.get(doc)
+            if info is None:
+                info = documents[doc] = self.connection.execute(
+                    "SELECT doc_id, term_count, sum_squares FROM documents WHERE id = ?", (doc,)).fetchone()
+            return info
+
+        top = []  # (相似度, 文档编号) 的小顶堆
+        threshold = 0.0
+        essential = 0  # 下标小于它的词为非必要词：只含这些词的文档不可能进入前K
+
+        # 可能被截断特征的文档：词数超过 特征上限 - 查询词数（并集 = 两者词数 - 共有词数）
+        large = set()
+        term_ids = [term_id for _, term_id, _ in terms]
+        for doc, in self.connection.execute("SELECT id FROM documents WHERE term_count > ?",
+                                            (MAX_FEATURES - len(query),)).fetchall():
+            if not any(self.connection.execute(
+                    f"SELECT 1 FROM postings WHERE doc = ? AND term_id IN ({','.join('?' * len(batch))}) LIMIT 1",
+                    [doc] + batch).fetchone() is not None for batch in _batches(term_ids, reserved=1)):
+                continue
+            large.add(doc)
+            doc_id = document(doc)[0]
+            similarity = calculate_similarity(loader(doc_id), text)
+            if similarity <= 0:
+                continue
+            if len(top) < top_k:
+                heapq.heappush(top, (similarity, doc_id))
+            elif similarity > top[0][0]:
+                heapq.heapreplace(top, (similarity, doc_id))
+        if len(top) == top_k:
+            threshold = top[0][0]
+            while essential < len(terms) and prefix[essential + 1] <= threshold:
+                essential += 1
+
+        # 必要词倒排表的游标按当前文档编号合并（逐文档处理）；非必要词不读倒排表，对候选文档逐个查询
+        postings = {}
+        current = {}
+        cursors = []
+
+        def advance(index):
+            row = next(postings[index], None)
+            if row is None:
+                del postings[index]
+            else:
+                current[index] = row
+                heapq.heappush(cursors, (row[0], index))
+
+        for index in range(essential, len(terms)):
+            postings[index] = self._postings(terms[index][1])
+            advance(index)
+
+        while cursors:
+            candidate = cursors[0][0]
+            matched = []
+            while cursors and cursors[0][0] == candidate:
+                matched.append(heapq.heappop(cursors)[1])
+            matched = [index for index in matched if index >= essential]
+            if not matched:
+                continue
+
+            # 必要词部分的上界 + 非必要词上界之和，不超过阈值时跳过
+            upper = prefix[essential] + sum(terms[index][2] / query_norm * current[index][2] for index in matched)
+            if candidate not in large and (len(top) < top_k or upper > threshold):
+                similarity, doc_id = self._score(candidate, terms, current, matched, essential,
+                                                 query_squares, document)
+                if len(top) < top_k:
+                    heapq.heappush(top, (similarity, doc_id))
+                elif similarity > top[0][0]:
+                    heapq.heapreplace(top, (similarity, doc_id))
+                if len(top) == top_k:
+                    threshold = top[0][0]
+                    while essential < len(terms) and prefix[essential + 1] <= threshold:
+                        # 变为非必要词后不再读取它的倒排表
+                        cursor = postings.pop(essential, None)
+                        if cursor is not None:
+                            cursor.close()
+                        essential += 1
+
+            for index in matched:
+                if index >= essential and index in postings:
+                    advance(index)
+
+        for cursor in postings.values():
+            cursor.close()
+        return [(doc_id, round(similarity, 2))
+                for similarity, doc_id in sorted(top, key=lambda item: (-item[0], item[1]))]
+
+    def _score(self, candidate, terms, current, matched, essential, query_squares, document):
+        """
+        精确计算一篇候选文档的相似度（词表并集不超过特征上限）
+        必要词取游标处的词频，非必要词按 (词, 文档) 主键逐个查询
+        """
+        found = [(terms[index][2], current[index][1]) for index in matched]
+        if essential:
+            query_counts = {term_id: query_count for _, term_id, query_count in terms[:essential]}
+            for batch in _batches(query_counts, reserved=1):
+                rows = self.connection.execute(
+                    f"SELECT term_id, tf FROM postings WHERE doc = ? AND term_id IN ({','.join('?' * len(batch))})",
+                    [candidate] + batch)
+                found.extend((query_counts[term_id], tf) for term_id, tf in rows)
+
+        dot = 0.0
+        shared_query_squares = 0
+        shared_doc_squares = 0
+        for query_count, tf in found:
+            dot += query_count * tf
+            shared_query_squares += query_count * query_count
+            shared_doc_squares += tf * tf
+
+        doc_id, _, sum_squares = document(candidate)
+        return pair_cosine(dot, shared_query_squares, shared_doc_squares, query_squares, sum_squares), doc_id
+
+
+def search_main(argv):
+    """
+    倒排索引子命令
+    python main.py search add 索引文件 论文文件或目录...
+    python main.py search query 索引文件 待检测论文 [--top-k N]
+    """
+    parser = argparse.ArgumentParser(prog='main.py search', description='倒排索引：查找最相似的已收录论文')
+    actions = parser.add_subparsers(dest='action', required=True)
+
+    add_parser = actions.add_parser('add', help='收录论文（可多次追加，内容变化的论文会被更新）')
+    add_parser.add_argument('index_file', help='索引文件路径（SQLite）')
+    add_parser.add_argument('documents', nargs='+', help='论文文件或目录')
+
+    query_parser = actions.add_parser('query', help='查询最相似的论文')
+    query_parser.add_argument('index_file', help='索引文件路径（SQLite）')
+    query_parser.add_argument('query_file', help='待检测论文路径')
+    query_parser.add_argument('--top-k', type=int, default=10, help='输出前K篇')
+
+    try:
+        args = parser.parse_args(argv)
+        if args.action == 'query' and not os.path.exists(args.index_file):
+            raise Exception(f"索引文件不存在: {args.index_file}")
+        index = InvertedIndex(args.index_file)
+        try:
+            if args.action == 'add':
+                added = 0
+                for path in collect_text_files(args.documents):
+                    added += index.add(os.path.abspath(path), read_file(path))
+                print(f"索引完成，新增或更新 {added} 篇，共 {len(index)} 篇")
+            else:
+                for doc_id, similarity in index.search(read_file(args.query_file), args.top_k):
+                    print(f"{similarity:.2f}\t{doc_id}")
+        finally:
+            index.close()
+    except Exception as e:
+        print(f"错误: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,87 @@
+import numpy as np
+
+from main import DEFAULT_LCS_MAX_CHARS, preprocess_text
+
+
+def _match_masks(text):
+    """
+    为 text 中每个字符构造位向量（Python 大整数），第 i 位为1表示 text[i] 是该字符
+    按字符分组后用 NumPy 置位再整体转换为整数，避免逐位移位产生大量临时大整数
+    """
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    ends = np.r_[starts[1:], len(sorted_codes)]
+
+    byte_count = (len(text) + 7) // 8
+    masks = {}
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        positions = order[start:end]
+        packed = np.zeros(byte_count, dtype=np.uint8)
+        np.bitwise_or.at(packed, positions >> 3, (1 << (positions & 7)).astype(np.uint8))
+        masks[chr(sorted_codes[start])] = int.from_bytes(packed.tobytes(), 'little')
+    return masks
+
+
+def lcs_length(first, second):
+    """
+    最长公共子序列长度，位并行算法（Allison-Dix / Hyyrö）
+    较短的字符串作为位向量，每读入另一字符串的一个字符，用一次加法和几次位运算更新整个列，
+    Python 大整数按机器字（64位）批量运算，复杂度 O(m·n/64)
+    """
+    if len(first) > len(second):
+        first, second = second, first
+    if not first:
+        return 0
+
+    masks = _match_masks(first)
+    all_ones = (1 << len(first)) - 1
+    column = all_ones
+    for char in second:
+        match = masks.get(char)
+        if match is None:
+            continue
+        carry = column & match
+        column = ((column + carry) | (column - carry)) & all_ones
+    # 位向量中为0的位数即为LCS长度
+    return len(first) - bin(column).count('1')
+
+
+def check_size(first, second, max_chars=DEFAULT_LCS_MAX_CHARS, memory_budget=None):
+    """
+    计算前检查文本规模，超出时直接报错而不是运行数小时
+    max_chars 限制较长一篇的字符数（耗时）；memory_budget 限制位向量表的内存：
+    较短一篇的每种字符各占一个与其长度等宽的位向量，约 字符种数 × 长度 / 8 字节
+    """
+    longest = max(len(first), len(second))
+    if max_chars is not None and longest > max_chars:
+        raise Exception(f"文本过长（{longest} 字符），lcs 算法最多支持 {max_chars} 字符，"
+                        f"可用 --lcs-max-chars 调整或改用 tfidf 算法")
+    shorter = first if len(first) <= len(second) else second
+    table_bytes = len(set(shorter)) * ((len(shorter) + 7) // 8)
+    if memory_budget is not None and table_bytes > memory_budget:
+        raise Exception(f"lcs 算法的位向量表约需 {table_bytes / 1024 / 1024:.1f}MB，超出内存预算 "
+                        f"{memory_budget / 1024 / 1024:.1f}MB")
+
+
+def lcs_similarity(original_text, plagiarized_text, max_chars=DEFAULT_LCS_MAX_CHARS, memory_budget=None):
+    """
+    基于字符级最长公共子序列的相似度，对语序敏感
+    相似度为抄袭版（预处理后）中按原顺序出现在原文里的字符比例：LCS / 抄袭版长度，保留两位小数
+    空文本语义与 calculate_similarity 一致；规模超出 max_chars / memory_budget 时报错，见 check_size
+    """
+    if not original_text.strip() and not plagiarized_text.strip():
+        return 1.0
+    if not original_text.strip() or not plagiarized_text.strip():
+        return 0.0
+
+    original = preprocess_text(original_text)
+    plagiarized = preprocess_text(plagiarized_text)
+    if not original or not plagiarized:
+        return 0.0
+    check_size(original, plagiarized, max_chars, memory_budget)
+    try:
+        return round(lcs_length(original, plagiarized) / len(plagiarized), 2)
+    except Exception as e:
+        raise Exception(f"相似度计算失败: {str(e)}")
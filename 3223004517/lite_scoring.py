@@ -0,0 +1,49 @@
+import math
+
+# 两篇文档单独拟合TF-IDF时，共有词的IDF为1，只出现在一篇中的词的IDF为 ln(3/2)+1
+_UNIQUE_IDF = math.log(3 / 2) + 1
+_UNIQUE_IDF_SQUARED = _UNIQUE_IDF ** 2
+
+
+def tfidf_cosine(original_counts, plagiarized_counts, max_features=5000):
+    """
+    两篇文本的TF-IDF余弦相似度，只用标准库在词频字典上做稀疏点积
+    计算方式与 TfidfVectorizer（原始词频 × 平滑IDF，L2归一化）+ cosine_similarity 相同；
+    词表超过 max_features 时需要按 sklearn 的规则截断特征，返回 None 交由 sklearn 计算
+    """
+    if len(original_counts.keys() | plagiarized_counts.keys()) > max_features:
+        return None
+    if not original_counts or not plagiarized_counts:
+        return 0.0
+
+    dot = 0.0
+    original_norm = 0.0
+    for term, count in original_counts.items():
+        if term in plagiarized_counts:
+            dot += count * plagiarized_counts[term]
+            original_norm += count * count
+        else:
+            original_norm += (count * _UNIQUE_IDF) ** 2
+
+    plagiarized_norm = 0.0
+    for term, count in plagiarized_counts.items():
+        weight = count if term in original_counts else count * _UNIQUE_IDF
+        plagiarized_norm += weight * weight
+
+    if original_norm == 0 or plagiarized_norm == 0:
+        return 0.0
+    similarity = dot / (math.sqrt(original_norm) * math.sqrt(plagiarized_norm))
+    # 浮点误差可能让完全相同的文本略大于1
+    return min(similarity, 1.0)
+
+
+def pair_cosine(dot, shared_query_squares, shared_doc_squares, query_squares, doc_squares):
+    """
+    由共有词的统计量还原两篇文档单独拟合TF-IDF后的余弦相似度（与 tfidf_cosine 相同）
+    独有词的权重是词频乘 ln(3/2)+1，因此范数只需要全部词频平方和与共有词的词频平方和
+    """
+    query_norm = _UNIQUE_IDF_SQUARED * query_squares - (_UNIQUE_IDF_SQUARED - 1) * shared_query_squares
+    doc_norm = _UNIQUE_IDF_SQUARED * doc_squares - (_UNIQUE_IDF_SQUARED - 1) * shared_doc_squares
+    if query_norm <= 0 or doc_norm <= 0:
+        return 0.0
+    return min(dot / math.sqrt(query_norm * doc_norm), 1.0)
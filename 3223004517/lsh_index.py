@@ -0,0 +1,264 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+from collections import Counter
+
+import numpy as np
+
+from main import collect_text_files, preprocess_text, segment_text, similarity_from_counts
+from utils import read_file
+from vocabulary import Vocabulary
+
+# 64位乘法-移位哈希族使用的随机种子，保存索引时一并记录
+DEFAULT_SEED = 20250921
+
+# 每次参与向量化运算的 shingle 数量，限制中间矩阵的内存占用
+SHINGLE_BLOCK = 8192
+
+_MAX_HASH = np.uint32(0xFFFFFFFF)
+
+
+def _token_hashes(tokens):
+    """将词语映射为稳定的64位哈希（不使用随进程变化的内置 hash）"""
+    cache = {}
+    hashes = np.empty(len(tokens), dtype=np.uint64)
+    for index, token in enumerate(tokens):
+        value = cache.get(token)
+        if value is None:
+            digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+            value = cache[token] = int.from_bytes(digest, 'little')
+        hashes[index] = value
+    return hashes
+
+
+def shingle_hashes(tokens, shingle_size=3):
+    """
+    计算词语 shingle（连续 shingle_size 个词）的64位哈希
+    用向量化的多项式组合代替逐个拼接字符串
+    """
+    if not tokens:
+        return np.empty(0, dtype=np.uint64)
+
+    hashes = _token_hashes(tokens)
+    if len(tokens) < shingle_size:
+        shingle_size = len(tokens)
+
+    count = len(tokens) - shingle_size + 1
+    combined = np.zeros(count, dtype=np.uint64)
+    # 溢出按2^64取模，正是这里需要的运算
+    multiplier = np.uint64(0x100000001B3)
+    with np.errstate(over='ignore'):
+        for offset in range(shingle_size):
+            combined = combined * multiplier ^ hashes[offset:offset + count]
+    return np.unique(combined)
+
+
+class MinHashLSH:
+    """
+    MinHash 签名 + 分段LSH 候选索引
+    每篇文档计算 num_perm 个最小哈希值，签名切成 bands 段，
+    任意一段完全相同的文档互为候选，候选再交给精确的TF-IDF余弦计算
+    """
+
+    def __init__(self, num_perm=128, bands=32, shingle_size=3, seed=DEFAULT_SEED):
+        if num_perm % bands != 0:
+            raise Exception(f"签名长度 {num_perm} 必须能被分段数 {bands} 整除")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.seed = seed
+
+        rng = np.random.default_rng(seed)
+        # 乘法-移位哈希：乘数取奇数，结果取高32位
+        self._a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+
+        self.doc_ids = []
+        self._id_set = set()
+        self._signatures = []
+        self._buckets = [dict() for _ in range(bands)]
+
+    def tokens(self, text):
+        """与 calculate_similarity 相同的预处理和分词"""
+        text = preprocess_text(text)
+        return segment_text(text) if text else []
+
+    def signature(self, text=None, tokens=None):
+        """计算文档的 MinHash 签名（uint32 数组），空文档的签名各位均为最大值"""
+        if tokens is None:
+            tokens = self.tokens(text)
+        signature = np.full(self.num_perm, _MAX_HASH, dtype=np.uint32)
+        shingles = shingle_hashes(tokens, self.shingle_size)
+
+        with np.errstate(over='ignore'):
+            for start in range(0, len(shingles), SHINGLE_BLOCK):
+                block = shingles[start:start + SHINGLE_BLOCK]
+                permuted = (block[:, None] * self._a[None, :] + self._b[None, :]) >> np.uint64(32)
+                np.minimum(signature, permuted.min(axis=0).astype(np.uint32), out=signature)
+        return signature
+
+    def _band_keys(self, signature):
+        """把签名切段，每段的字节串作为桶键"""
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def add(self, doc_id, text=None, signature=None):
+        """加入一篇文档，已存在的文档编号会被忽略"""
+        if doc_id in self._id_set:
+            return False
+        if signature is None:
+            signature = self.signature(text)
+        index = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        self._id_set.add(doc_id)
+        self._signatures.append(signature)
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(key, []).append(index)
+        return True
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def query(self, text=None, signature=None, max_candidates=20):
+        """
+        查询候选文档
+        返回 [(文档编号, 估计的Jaccard相似度)]，按估计值从高到低排列
+        """
+        if signature is None:
+            signature = self.signature(text)
+        if np.all(signature == _MAX_HASH):
+            return []
+
+        candidates = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            candidates.update(self._buckets[band].get(key, ()))
+        if not candidates:
+            return []
+
+        indices = np.fromiter(candidates, dtype=np.int64)
+        matrix = np.stack([self._signatures[index] for index in indices])
+        estimates = (matrix == signature[None, :]).mean(axis=1)
+        order = np.argsort(-estimates, kind='stable')[:max_candidates]
+        return [(self.doc_ids[indices[i]], float(estimates[i])) for i in order]
+
+    def save(self, file_path):
+        """保存索引：签名矩阵 + 文档编号 + 参数，桶在加载时重建"""
+        try:
+            directory = os.path.dirname(file_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            if self._signatures:
+                signatures = np.stack(self._signatures)
+            else:
+                signatures = np.empty((0, self.num_perm), dtype=np.uint32)
+            params = {
+                'num_perm': self.num_perm,
+                'bands': self.bands,
+                'shingle_size': self.shingle_size,
+                'seed': self.seed,
+            }
+            with open(file_path, 'wb') as file:
+                np.savez(file,
+                         signatures=signatures,
+                         doc_ids=np.array(json.dumps(self.doc_ids, ensure_ascii=False)),
+                         params=np.array(json.dumps(params)))
+        except Exception as e:
+            raise Exception(f"保存索引失败: {str(e)}")
+
+    @classmethod
+    def load(cls, file_path):
+        """加载索引"""
+        if not os.path.exists(file_path):
+            raise Exception(f"索引文件不存在: {file_path}")
+        try:
+            with np.load(file_path, allow_pickle=False) as data:
+                params = json.loads(str(data['params']))
+                doc_ids = json.loads(str(data['doc_ids']))
+                signatures = data['signatures']
+        except Exception as e:
+            raise Exception(f"加载索引失败: {str(e)}")
+
+        index = cls(**params)
+        for doc_id, signature in zip(doc_ids, signatures):
+            index.add(doc_id, signature=signature)
+        return index
+
+
+def search(index, text, top_k=10, max_candidates=50, loader=read_file):
+    """
+    先用LSH取候选，再对候选做精确的TF-IDF余弦计算
+    待检测论文只分词、计数一次，签名和每个候选的打分共用同一份词频
+    loader 用于根据文档编号读取原文，默认把编号当作文件路径
+    返回 [(文档编号, 相似度)]，按相似度从高到低排列
+    """
+    vocabulary = Vocabulary()
+    query_tokens = index.tokens(text)
+    query_counts = Counter(vocabulary.term_ids(query_tokens))
+    query_blank = not text.strip()
+
+    results = []
+    for doc_id, _ in index.query(signature=index.signature(tokens=query_tokens), max_candidates=max_candidates):
+        candidate = loader(doc_id)
+        candidate_blank = not candidate.strip()
+        # 空文本等边界情况的处理与 calculate_similarity 一致
+        if query_blank and candidate_blank:
+            similarity = 1.0
+        elif query_blank or candidate_blank:
+            similarity = 0.0
+        else:
+            candidate_counts = Counter(vocabulary.term_ids(index.tokens(candidate)))
+            similarity = similarity_from_counts(candidate_counts, query_counts, vocabulary)
+        results.append((doc_id, similarity))
+    results.sort(key=lambda item: item[1], reverse=True)
+    return results[:top_k]
+
+
+def index_main(argv):
+    """
+    LSH索引子命令
+    python main.py index build 索引文件 论文文件或目录...
+    python main.py index query 索引文件 待检测论文 [--top-k N]
+    """
+    parser = argparse.ArgumentParser(prog='main.py index', description='MinHash/LSH 候选索引')
+    actions = parser.add_subparsers(dest='action', required=True)
+
+    build_parser = actions.add_parser('build', help='建立或追加索引')
+    build_parser.add_argument('index_file', help='索引文件路径（.npz）')
+    build_parser.add_argument('documents', nargs='+', help='论文文件或目录')
+    build_parser.add_argument('--num-perm', type=int, help='MinHash 签名长度（新建索引默认128）')
+    build_parser.add_argument('--bands', type=int, help='LSH 分段数（新建索引默认32）')
+
+    query_parser = actions.add_parser('query', help='查询最相似的论文')
+    query_parser.add_argument('index_file', help='索引文件路径（.npz）')
+    query_parser.add_argument('query_file', help='待检测论文路径')
+    query_parser.add_argument('--top-k', type=int, default=10, help='输出前K篇')
+    query_parser.add_argument('--max-candidates', type=int, default=50, help='进入精确计算的候选数量上限')
+
+    try:
+        args = parser.parse_args(argv)
+
+        if args.action == 'build':
+            if os.path.exists(args.index_file):
+                index = MinHashLSH.load(args.index_file)
+                # 追加时签名参数必须与已有索引相同，否则新旧签名无法比较
+                for option, value, stored in (('--num-perm', args.num_perm, index.num_perm),
+                                              ('--bands', args.bands, index.bands)):
+                    if value is not None and value != stored:
+                        raise Exception(f"{option} {value} 与已有索引的 {stored} 不一致，请删除索引后重建")
+            else:
+                index = MinHashLSH(num_perm=args.num_perm or 128, bands=args.bands or 32)
+            added = 0
+            for path in collect_text_files(args.documents):
+                added += index.add(os.path.abspath(path), read_file(path))
+            index.save(args.index_file)
+            print(f"索引完成，新增 {added} 篇，共 {len(index)} 篇")
+        else:
+            index = MinHashLSH.load(args.index_file)
+            text = read_file(args.query_file)
+            for doc_id, similarity in search(index, text, args.top_k, args.max_candidates):
+                print(f"{similarity:.2f}\t{doc_id}")
+    except Exception as e:
+        print(f"错误: {str(e)}")
+        sys.exit(1)
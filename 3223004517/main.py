@@ -3,23 +3,133 @@ import sys
 import os
 import functools
 import re
-from utils import read_file, write_result
+import time
+from collections import Counter, namedtuple
+import memory
+import metrics
+from utils import (read_file, write_result, write_similarity_rows, iter_file_text, write_report, document_labels,
+                   detect_file_encoding, EncodingFallback)
+from vocabulary import Vocabulary, count_matrix, counter_matrix, tfidf_matrix
 
 
 # 添加文件内容缓存
+# 按 (路径, 修改时间, 大小, inode) 缓存，文件被修改或替换后键随之变化，不会读到旧内容
 @functools.lru_cache(maxsize=32)
+def _read_file_version(file_path, mtime_ns, size, inode):
+    return read_file(file_path)
+
+
 def cached_read_file(file_path):
     """带缓存的文件读取函数"""
-    return read_file(file_path)
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        # 文件不存在、无权限等情况交给 read_file 给出统一的错误信息
+        return read_file(file_path)
+    return _read_file_version(file_path, stat.st_mtime_ns, stat.st_size, stat.st_ino)
 
 
 # 添加分词结果缓存
 @functools.lru_cache(maxsize=100)
 def cached_cut_text(text):
-    """带缓存的分词函数 - 针对Windows优化"""
-    import jieba
-    # 在Windows上不使用并行模式
-    return ' '.join(jieba.cut(text))
+    """带缓存的分词函数，进程内LRU之外还会经过磁盘分词缓存（若已开启）"""
+    return ' '.join(segment_text(text))
+
+
+# 磁盘分词缓存，默认关闭
+# 通过命令行 --cache-dir 或环境变量 PAPER_CHECK_CACHE_DIR 开启
+_segment_cache = None
+
+
+def configure_segment_cache(cache_dir, max_bytes=None):
+    """
+    开启或关闭跨进程共享的磁盘分词缓存
+    cache_dir 为空时关闭，返回当前使用的缓存对象
+    """
+    global _segment_cache
+    if not cache_dir:
+        _segment_cache = None
+        return None
+
+    from seg_cache import SegmentCache, DEFAULT_MAX_BYTES
+    _segment_cache = SegmentCache(cache_dir, max_bytes or DEFAULT_MAX_BYTES)
+    return _segment_cache
+
+
+# 并行分词配置：文本长度达到阈值（字符数）时分块交给进程池分词
+# workers 为 None 表示使用全部CPU核，为 1 表示始终串行
+_parallel_options = {'workers': None, 'threshold': 1024 * 1024}
+
+
+def configure_parallel_segmentation(workers=None, threshold=None):
+    """设置并行分词的工作进程数和启用阈值"""
+    if workers is not None:
+        _parallel_options['workers'] = workers
+    if threshold is not None:
+        _parallel_options['threshold'] = threshold
+    return dict(_parallel_options)
+
+
+# 打分后端：auto 在词表不超过特征上限时用纯Python稀疏点积（不导入 sklearn / numpy），
+# 否则退回 sklearn；sklearn 表示始终使用 TfidfVectorizer
+SCORING_BACKENDS = ['auto', 'sklearn']
+_scoring_options = {'backend': 'auto'}
+
+
+def configure_scoring_backend(backend):
+    """设置相似度打分后端"""
+    if backend not in SCORING_BACKENDS:
+        raise Exception(f"不支持的打分后端: {backend}")
+    _scoring_options['backend'] = backend
+
+
+# 分析器：jieba 分词（默认），或 char 不分词、直接取字符 n-gram 哈希词频
+ANALYZERS = ['jieba', 'char']
+_analyzer_options = {'analyzer': 'jieba'}
+
+
+def configure_analyzer(analyzer):
+    """设置 calculate_similarity 使用的分析器"""
+    if analyzer not in ANALYZERS:
+        raise Exception(f"不支持的分析器: {analyzer}")
+    _analyzer_options['analyzer'] = analyzer
+
+
+# 预先拟合的语料IDF模型，默认不使用
+# 通过命令行 --idf-model 或环境变量 PAPER_CHECK_IDF_MODEL 指定，之后每次查重只做 transform
+_idf_model = None
+
+
+def configure_idf_model(model_path):
+    """
+    加载或卸载语料IDF模型（python main.py model build 生成）
+    model_path 为空时卸载，返回当前使用的模型对象
+    """
+    global _idf_model
+    if _idf_model is not None and (not model_path or _idf_model.path != model_path):
+        _idf_model.close()
+        _idf_model = None
+    if model_path and _idf_model is None:
+        from idf_model import IdfModel
+        _idf_model = IdfModel(model_path)
+    return _idf_model
+
+
+# 一组打分配置：打分后端、分析器、语料IDF模型（IdfModel 或 None）、磁盘分词缓存（SegmentCache 或 None）
+# 各计算函数的 options 为 None 时使用上面 configure_* 设置的进程级配置；
+# 嵌入使用时（checker.PlagiarismChecker）每个对象持有自己的一组配置，互不影响
+ScoringOptions = namedtuple('ScoringOptions', ['backend', 'analyzer', 'idf_model', 'segment_cache'])
+
+
+def current_options():
+    """当前的进程级打分配置"""
+    return ScoringOptions(_scoring_options['backend'], _analyzer_options['analyzer'], _idf_model, _segment_cache)
+
+
+# 停用词表（模块加载时创建一次，不再每次计算时重建）
+# 目前不参与打分：这些都是单字词，计词时已按 DEFAULT_MIN_TERM_LENGTH 丢弃，去掉它们不影响结果
+STOP_WORDS = frozenset(['的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '上', '也', '很',
+                        '到', '说', '要', '去', '你'])
 
 
 def preprocess_text(text):
@@ -27,19 +137,55 @@ def preprocess_text(text):
     文本预处理函数
     清洗文本，移除标点符号和多余空格
     """
-    # 移除标点符号
-    text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z0-9\s]', '', text)
-    # 移除多余空格
-    text = re.sub(r'\s+', ' ', text)
-    # 移除首尾空格
-    return text.strip()
+    with metrics.stage('preprocess') as sizes:
+        sizes['chars'] = len(text)
+        # 移除标点符号
+        text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z0-9\s]', '', text)
+        # 移除多余空格
+        text = re.sub(r'\s+', ' ', text)
+        # 移除首尾空格
+        return text.strip()
 
 
-def calculate_similarity(original_text, plagiarized_text, fast_mode=False):
+def segment_text(text, options=None):
+    """
+    精确模式分词
+    返回去除空白词后的词列表
+    """
+    cache = _segment_cache if options is None else options.segment_cache
+    if cache is not None:
+        words = cache.get(text)
+        metrics.cache_lookup('segment_disk', words is not None)
+        if words is not None:
+            return words
+
+    with metrics.stage('segment') as sizes:
+        workers = _parallel_options['workers'] or os.cpu_count() or 1
+        if workers > 1 and len(text) >= _parallel_options['threshold']:
+            # 长文本分块并行分词，结果与串行一致
+            from parallel_seg import parallel_segment
+            words = parallel_segment(text, workers)
+        else:
+            # 开启预编译分词词典时使用它，结果与 jieba 相同
+            from seg_dict import cut
+            words = [word for word in cut(text) if word.strip()]
+        sizes['chars'] = len(text)
+        sizes['tokens'] = len(words)
+
+    if cache is not None:
+        cache.put(text, words)
+    return words
+
+
+def calculate_similarity(original_text, plagiarized_text, fast_mode=False, options=None):
     """
     计算两段文本的相似度
     使用TF-IDF向量化和余弦相似度算法 - Windows优化版
+    options 为 ScoringOptions，为 None 时使用进程级配置
     """
+    if options is None:
+        options = current_options()
+
     # 处理空文本情况
     if not original_text.strip() and not plagiarized_text.strip():
         return 1.0
@@ -55,48 +201,63 @@ def calculate_similarity(original_text, plagiarized_text, fast_mode=False):
     if not original_text or not plagiarized_text:
         return 0.0
 
-    # 延迟导入第三方库
-    import numpy as np
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    from sklearn.metrics.pairwise import cosine_similarity
+    # 字符 n-gram 分析器：跳过分词和词典加载
+    if options.analyzer == 'char':
+        from char_ngram import ngram_similarity
+        with metrics.stage('char_ngram') as sizes:
+            sizes['chars'] = len(original_text) + len(plagiarized_text)
+            return ngram_similarity(original_text, plagiarized_text)
 
     try:
-        import jieba
         # 精确模式分词 + 去除分词后空字符串
-        original_words = [word for word in jieba.cut(original_text, cut_all=False) if word.strip()]
-        plagiarized_words = [word for word in jieba.cut(plagiarized_text, cut_all=False) if word.strip()]
+        original_words = segment_text(original_text, options)
+        plagiarized_words = segment_text(plagiarized_text, options)
 
         # 若分词后无有效词汇（极端情况）
         if not original_words or not plagiarized_words:
             return 0.0
 
-        # 转换为空格分隔的字符串（适配TF-IDF输入格式）
-        original_seg = ' '.join(original_words)
-        plagiarized_seg = ' '.join(plagiarized_words)
+        # 语料IDF模型：IDF来自参考语料，不再在两篇文本上重新拟合
+        if options.idf_model is not None:
+            with metrics.stage('idf_model'):
+                return options.idf_model.similarity(original_words, plagiarized_words)
+
+        # 词语驻留为整数编号，文档只保存紧凑的编号数组，不再拼接成字符串
+        with metrics.stage('vectorize') as sizes:
+            vocabulary = Vocabulary()
+            original_ids = vocabulary.term_ids(original_words)
+            plagiarized_ids = vocabulary.term_ids(plagiarized_words)
+            sizes['tokens'] = len(original_ids) + len(plagiarized_ids)
     except Exception as e:
         raise Exception(f"分词处理失败: {str(e)}")
 
+    # 轻量后端：词频上的稀疏点积，结果与下面的 sklearn 流程一致
+    if options.backend == 'auto':
+        with metrics.stage('cosine'):
+            similarity = lite_similarity(Counter(original_ids), Counter(plagiarized_ids))
+        if similarity is not None:
+            return similarity
+
+    # 延迟导入第三方库
+    import numpy as np
+    from sklearn.metrics.pairwise import cosine_similarity
+
     try:
         # 配置TF-IDF参数：
         # - 过滤停用词（减少无意义词汇干扰）
         # - 包含1-gram和2-gram（捕捉短语级相似性）
         # - 过滤低频词（出现次数<2的词不纳入计算）
-        stop_words = ['的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '上', '也', '很',
-                      '到', '说', '要', '去', '你']
-        vectorizer = TfidfVectorizer(
-            max_features=5000,  # 限制特征数量，提高性能
-            min_df=1,  # 词至少在1个文档中出现
-            max_df=1.0  # 词最多在100%的文档中出现
-        )
-
-        # 向量化处理
-        tfidf_matrix = vectorizer.fit_transform([original_seg, plagiarized_seg])
+        # 向量化处理：编号数组直接构造词频矩阵，再计算TF-IDF（max_features=5000，限制特征数量）
+        with metrics.stage('vectorize'):
+            counts = count_matrix([original_ids, plagiarized_ids], len(vocabulary))
+            matrix = tfidf_matrix(counts, vocabulary)
     except Exception as e:
         raise Exception(f"文本向量化失败: {str(e)}")
 
     try:
         # 计算余弦相似度
-        similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
+        with metrics.stage('cosine'):
+            similarity = cosine_similarity(matrix[0:1], matrix[1:2])[0][0]
 
         # 处理可能的NaN值
         if np.isnan(similarity):
@@ -107,11 +268,474 @@ def calculate_similarity(original_text, plagiarized_text, fast_mode=False):
         raise Exception(f"相似度计算失败: {str(e)}")
 
 
+# 预处理用到的正则，流式预处理逐块复用
+_PUNCTUATION = re.compile(r'[^\u4e00-\u9fa5a-zA-Z0-9\s]')
+_WHITESPACE = re.compile(r'\s+')
+
+# 内存预算默认 512MB；文件估计占用超过预算时改走流式计算
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+
+# 整篇读入内存时，文本、预处理结果、词列表等副本的总占用约为文件大小的倍数
+IN_MEMORY_FACTOR = 10
+
+# lcs 算法默认的字符数上限（预处理后较长的一篇）：耗时与两篇长度之积成正比，10万字符约1.6秒，20万字符约5秒
+DEFAULT_LCS_MAX_CHARS = 200000
+
+
+def preprocess_stream(chunks):
+    """
+    流式文本预处理
+    逐块移除标点、合并空白，跨块的空白也只保留一个空格，
+    拼接结果与 preprocess_text 对整篇文本的处理结果一致
+    """
+    emitted = False
+    pending_space = False
+    for chunk in chunks:
+        chunk = _WHITESPACE.sub(' ', _PUNCTUATION.sub('', chunk))
+        if chunk.startswith(' '):
+            pending_space = True
+            chunk = chunk[1:]
+        if not chunk:
+            continue
+        trailing_space = chunk.endswith(' ')
+        chunk = chunk.rstrip(' ')
+        if pending_space and emitted:
+            chunk = ' ' + chunk
+        yield chunk
+        emitted = True
+        pending_space = trailing_space
+
+
+def segment_stream(chunks, max_carry=4 * 1024 * 1024, options=None):
+    """
+    流式分词，输入为预处理后的文本块
+    只在空格处切分（jieba 以空格为分块边界，切分不影响结果），
+    块末尾不完整的片段留到下一块；没有空格的片段超过 max_carry 个字符时强制切分
+    逐块产出词列表
+    """
+    carry = ''
+    for chunk in chunks:
+        text = carry + chunk
+        cut = text.rfind(' ')
+        if cut < 0:
+            if len(text) < max_carry:
+                carry = text
+                continue
+            cut = len(text)
+        carry = text[cut + 1:]
+        if cut > 0:
+            yield segment_text(text[:cut], options)
+    if carry:
+        yield segment_text(carry, options)
+
+
+def count_terms(words, vocabulary, counts=None):
+    """把分词结果驻留到词表中，按词编号累计词频"""
+    if counts is None:
+        counts = Counter()
+    counts.update(vocabulary.term_ids(words))
+    return counts
+
+
+def lite_similarity(original_counts, plagiarized_counts, max_features=5000):
+    """
+    不依赖 sklearn 的TF-IDF余弦相似度，保留两位小数
+    两篇文本都没有可计数的词、或词表超过特征上限时返回 None，由 sklearn 流程处理
+    """
+    if not original_counts and not plagiarized_counts:
+        return None
+    from lite_scoring import tfidf_cosine
+    similarity = tfidf_cosine(original_counts, plagiarized_counts, max_features)
+    if similarity is None:
+        return None
+    return round(similarity, 2)
+
+
+def similarity_from_counts(original_counts, plagiarized_counts, vocabulary, max_features=5000, options=None):
+    """
+    根据两篇文本的词频（{词编号: 词频}）计算TF-IDF余弦相似度
+    直接由词频构造稀疏矩阵，拟合过程与 calculate_similarity 完全相同
+    """
+    if not original_counts or not plagiarized_counts:
+        return 0.0
+    if options is None:
+        options = current_options()
+    idf_model = options.idf_model
+    if idf_model is not None:
+        terms = vocabulary.terms
+        return idf_model.cosine(
+            idf_model.count_weights({terms[term_id]: count for term_id, count in original_counts.items()}),
+            idf_model.count_weights({terms[term_id]: count for term_id, count in plagiarized_counts.items()}))
+    if options.backend == 'auto':
+        similarity = lite_similarity(original_counts, plagiarized_counts, max_features)
+        if similarity is not None:
+            return similarity
+
+    import numpy as np
+    from sklearn.metrics.pairwise import cosine_similarity
+    try:
+        counts = counter_matrix([original_counts, plagiarized_counts], len(vocabulary))
+        matrix = tfidf_matrix(counts, vocabulary, max_features)
+    except Exception as e:
+        raise Exception(f"文本向量化失败: {str(e)}")
+
+    try:
+        similarity = cosine_similarity(matrix[0:1], matrix[1:2])[0][0]
+        if np.isnan(similarity):
+            return 0.0
+        return round(similarity, 2)
+    except Exception as e:
+        raise Exception(f"相似度计算失败: {str(e)}")
+
+
+def stream_file_terms(file_path, chunk_size, vocabulary, options=None):
+    """
+    流式读取、预处理、分词并统计一个文件的词频
+    返回 (原文是否为空白, 是否有分词结果, {词编号: 词频})，峰值内存只与块大小有关
+    开头一块识别出的编码在后面解码失败时，与 read_file 一样改用能解码全文的编码，从头重新统计
+    """
+    state = {'blank': True, 'encoding': None}
+
+    def raw_chunks():
+        for chunk in iter_file_text(file_path, chunk_size, state['encoding']):
+            if state['blank'] and chunk.strip():
+                state['blank'] = False
+            yield chunk
+
+    # 流式处理中读取、预处理、分词交错进行，作为一个阶段整体计时
+    with metrics.stage('stream') as sizes:
+        while True:
+            counts = Counter()
+            has_words = False
+            state['blank'] = True
+            try:
+                for words in segment_stream(preprocess_stream(raw_chunks()), max_carry=chunk_size * 4,
+                                            options=options):
+                    if words:
+                        has_words = True
+                        count_terms(words, vocabulary, counts)
+                break
+            except EncodingFallback:
+                # 回退产生的多余词编号没有词频，构造矩阵时会被忽略
+                state['encoding'] = detect_file_encoding(file_path, chunk_size)
+                if state['encoding'] is None:
+                    raise Exception(f"读取文件失败: 文件编码不支持: {file_path}")
+            except Exception as e:
+                raise Exception(f"分词处理失败: {str(e)}")
+        if metrics.enabled():
+            sizes['bytes'] = os.path.getsize(file_path)
+            sizes['tokens'] = sum(counts.values())
+    return state['blank'], has_words, counts
+
+
+def calculate_similarity_files(original_file, plagiarized_file, chunk_size=None, options=None):
+    """
+    流式计算两个文件的相似度，适用于超出内存预算的大文件
+    空文本等边界情况的处理与 calculate_similarity 一致
+    """
+    from utils import DEFAULT_CHUNK_SIZE
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+
+    vocabulary = Vocabulary()
+    original_blank, original_has_words, original_counts = stream_file_terms(original_file, chunk_size, vocabulary,
+                                                                            options)
+    plagiarized_blank, plagiarized_has_words, plagiarized_counts = stream_file_terms(
+        plagiarized_file, chunk_size, vocabulary, options)
+
+    if original_blank and plagiarized_blank:
+        return 1.0
+    if original_blank or plagiarized_blank:
+        return 0.0
+    if not original_has_words or not plagiarized_has_words:
+        return 0.0
+    if not original_counts and not plagiarized_counts:
+        raise Exception("文本向量化失败: empty vocabulary; perhaps the documents only contain stop words")
+    return similarity_from_counts(original_counts, plagiarized_counts, vocabulary, options=options)
+
+
+def stream_chunk_size(memory_budget):
+    """根据内存预算确定流式处理的块大小（预算的1/64，至少64KB）"""
+    return max(64 * 1024, memory_budget // 64)
+
+
+def iter_similarity_rows(texts, query_indices=None, max_features=5000, block_size=256, options=None):
+    """
+    批量相似度计算（一对多 / 多对多）
+    每篇文本只预处理、分词一次，所有文本共用一次TF-IDF拟合，
+    再用稀疏矩阵乘法按行块计算余弦相似度，避免一次性生成整个稠密矩阵
+    query_indices 为 None 时逐行产出完整相似度矩阵，否则只产出指定行
+    产出 (行号, 相似度列表)，相似度保留两位小数
+    """
+    texts = list(texts)
+    if query_indices is None:
+        query_indices = range(len(texts))
+    query_indices = list(query_indices)
+    for index in query_indices:
+        if not 0 <= index < len(texts):
+            raise Exception(f"查询文档序号越界: {index}")
+
+    # 与 calculate_similarity 保持一致的空文本语义
+    blank = [not text.strip() for text in texts]
+    idf_model = _idf_model if options is None else options.idf_model
+
+    try:
+        # 所有文本共用一个词表，每篇只保存词编号数组；使用语料IDF模型时直接保留分词结果
+        vocabulary = Vocabulary()
+        documents = []
+        for text in texts:
+            words = segment_text(preprocess_text(text), options) if text.strip() else []
+            documents.append(words if idf_model is not None else vocabulary.term_ids(words))
+    except Exception as e:
+        raise Exception(f"分词处理失败: {str(e)}")
+
+    try:
+        # TF-IDF 结果已做L2归一化，矩阵乘法即为余弦相似度
+        with metrics.stage('vectorize'):
+            if idf_model is not None:
+                matrix = idf_model.transform(documents)
+            else:
+                counts = count_matrix(documents, len(vocabulary))
+                matrix = tfidf_matrix(counts, vocabulary, max_features) if counts.nnz else None
+    except Exception as e:
+        raise Exception(f"文本向量化失败: {str(e)}")
+
+    yield from similarity_rows_from_matrix(matrix, blank, query_indices, block_size)
+
+
+def iter_file_similarity_rows(files, query_indices=None, memory_budget=DEFAULT_MEMORY_BUDGET, max_features=5000,
+                              block_size=256, options=None):
+    """
+    在内存预算内计算一组文件的相似度矩阵，产出与 iter_similarity_rows 相同的 (行号, 相似度列表)
+    逐篇读取、分词并立即折叠为词频，不同时保留所有文档的原文和词列表；
+    单篇文件估计占用超过预算时流式分块处理，进程内存超过预算时把已统计的词频写入临时文件，
+    最后由词频构造TF-IDF矩阵（矩阵本身仍需放得下）
+    """
+    from spill import SpilledCounts
+
+    files = list(files)
+    if query_indices is None:
+        query_indices = range(len(files))
+    query_indices = list(query_indices)
+    for index in query_indices:
+        if not 0 <= index < len(files):
+            raise Exception(f"查询文档序号越界: {index}")
+
+    idf_model = _idf_model if options is None else options.idf_model
+    # 使用语料IDF模型时按模型的规则计词，词频直接记在模型词表的编号上，模型外的词不计入
+    vocabulary = Vocabulary(idf_model.min_term_length) if idf_model is not None else Vocabulary()
+    model_ids = []
+    chunk_size = stream_chunk_size(memory_budget)
+    blank = []
+
+    with SpilledCounts() as spilled:
+        for path in files:
+            if os.path.getsize(path) * IN_MEMORY_FACTOR > memory_budget:
+                is_blank, _, counts = stream_file_terms(path, chunk_size, vocabulary, options)
+            else:
+                text = read_file(path)
+                is_blank = not text.strip()
+                try:
+                    words = segment_text(preprocess_text(text), options) if not is_blank else []
+                except Exception as e:
+                    raise Exception(f"分词处理失败: {str(e)}")
+                counts = Counter(vocabulary.term_ids(words))
+                del text, words
+            if idf_model is not None:
+                model_ids.extend(idf_model.term_id(term) for term in vocabulary.terms[len(model_ids):])
+                counts = {model_ids[term_id]: count for term_id, count in counts.items() if model_ids[term_id] >= 0}
+            blank.append(is_blank)
+            spilled.append(counts)
+
+            # 无法读取进程内存时，按尚未落盘的词频估计
+            used = memory.current_memory()
+            if used is None:
+                used = spilled.pending_bytes()
+            if used > memory_budget:
+                spilled.spill()
+
+        try:
+            with metrics.stage('vectorize') as sizes:
+                sizes['spilled'] = spilled.spilled
+                if idf_model is not None:
+                    matrix = idf_model.transform_counts(spilled.matrix(max(idf_model.term_count, 1)))
+                else:
+                    counts = spilled.matrix(len(vocabulary))
+                    matrix = tfidf_matrix(counts, vocabulary, max_features) if counts.nnz else None
+                    del counts
+        except Exception as e:
+            raise Exception(f"文本向量化失败: {str(e)}")
+
+    yield from similarity_rows_from_matrix(matrix, blank, query_indices, block_size)
+
+
+def similarity_rows_from_matrix(matrix, blank, query_indices, block_size=256):
+    """
+    由L2归一化的TF-IDF矩阵按行块计算余弦相似度，产出 (行号, 相似度列表)
+    matrix 为 None 表示所有文档都没有可计数的词；blank 为每篇文档原文是否为空白
+    """
+    import numpy as np
+
+    try:
+        for start in range(0, len(query_indices), block_size):
+            block = query_indices[start:start + block_size]
+            with metrics.stage('cosine'):
+                if matrix is not None:
+                    scores = (matrix[block] @ matrix.T).toarray()
+                else:
+                    scores = np.zeros((len(block), len(blank)))
+            np.nan_to_num(scores, copy=False)
+            np.clip(scores, 0.0, 1.0, out=scores)
+
+            for row_index, scores_row in zip(block, scores):
+                row = [round(float(score), 2) for score in scores_row]
+                for column in range(len(blank)):
+                    if blank[row_index] and blank[column]:
+                        row[column] = 1.0
+                yield row_index, row
+    except Exception as e:
+        raise Exception(f"相似度计算失败: {str(e)}")
+
+
+def calculate_similarity_matrix(texts, query_indices=None, max_features=5000):
+    """
+    批量计算相似度矩阵
+    返回二维列表，行对应 query_indices（默认全部文本），列对应全部文本
+    """
+    return [row for _, row in iter_similarity_rows(texts, query_indices, max_features)]
+
+
+def collect_text_files(paths):
+    """展开路径列表，目录按文件名排序收集其中的 .txt 文件"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                full_path = os.path.join(path, name)
+                if name.endswith('.txt') and os.path.isfile(full_path):
+                    files.append(full_path)
+        else:
+            files.append(path)
+    return files
+
+
+def batch_main(argv):
+    """
+    批量查重子命令
+    python main.py batch [--query 待检测论文] [--format csv|jsonl] [-o 输出文件] 文档或目录...
+    """
+    parser = argparse.ArgumentParser(prog='main.py batch', description='论文批量查重')
+    parser.add_argument('documents', nargs='+', help='参与比对的论文文件或目录（目录下的 .txt 文件）')
+    parser.add_argument('--query', help='待检测论文路径，指定后只输出该论文与其余论文的一行相似度')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv', help='输出格式')
+    parser.add_argument('-o', '--output', default='-', help='输出文件路径，默认输出到标准输出')
+    parser.add_argument('--cache-dir', default=os.environ.get('PAPER_CHECK_CACHE_DIR'),
+                        help='磁盘分词缓存目录，默认读取环境变量 PAPER_CHECK_CACHE_DIR')
+    parser.add_argument('--seg-workers', type=int, default=None,
+                        help='并行分词的进程数，默认使用全部CPU核，1 表示始终串行')
+    parser.add_argument('--seg-threshold', type=int, default=None,
+                        help='文本达到该字符数才启用并行分词，默认 1048576')
+    parser.add_argument('--seg-dict', default=os.environ.get('PAPER_CHECK_SEG_DICT'),
+                        help='预编译分词词典（python main.py segdict build 生成），默认读取环境变量 PAPER_CHECK_SEG_DICT')
+    parser.add_argument('--idf-model', default=os.environ.get('PAPER_CHECK_IDF_MODEL'),
+                        help='语料IDF模型文件（python main.py model build 生成），默认读取环境变量 PAPER_CHECK_IDF_MODEL')
+    parser.add_argument('--metrics', default=os.environ.get('PAPER_CHECK_METRICS'),
+                        help="分阶段计时与计数的 JSON 行输出文件（'-' 为标准错误），默认读取环境变量 PAPER_CHECK_METRICS")
+    parser.add_argument('--memory-budget', type=float, default=DEFAULT_MEMORY_BUDGET / 1024 / 1024,
+                        help='内存预算（MB），超出时把已统计的词频写入临时文件，大文件流式处理，默认 512')
+    parser.add_argument('--memory-trace', choices=memory.MEMORY_TRACKERS,
+                        default=os.environ.get('PAPER_CHECK_MEMORY_TRACE'),
+                        help='跟踪内存峰值，--metrics 记录中每个阶段附带 peak_memory')
+
+    try:
+        args = parser.parse_args(argv)
+        configure_segment_cache(args.cache_dir)
+        configure_parallel_segmentation(args.seg_workers, args.seg_threshold)
+        if args.seg_dict:
+            from seg_dict import configure_segment_dictionary
+            configure_segment_dictionary(args.seg_dict)
+        configure_idf_model(args.idf_model)
+        metrics.configure_metrics(args.metrics)
+        memory.configure_memory_tracking(args.memory_trace)
+        memory_budget = int(args.memory_budget * 1024 * 1024)
+        if memory_budget <= 0:
+            raise Exception(f"无效的内存预算: {args.memory_budget}MB")
+
+        archive_files = collect_text_files(args.documents)
+        if args.query:
+            archive_files = [path for path in archive_files
+                             if os.path.abspath(path) != os.path.abspath(args.query)]
+            files = [args.query] + archive_files
+        else:
+            files = archive_files
+        if not files:
+            raise Exception("没有找到需要比对的论文文件")
+
+        names = document_labels(files)
+
+        # 逐篇读取、分词，不把所有论文同时读入内存
+        if args.query:
+            # 一对多：只计算第0行，并去掉与自身的比较
+            rows = ((0, row[1:]) for _, row in iter_file_similarity_rows(files, [0], memory_budget))
+            write_similarity_rows(args.output, names[:1], names[1:], rows, args.format)
+        else:
+            write_similarity_rows(args.output, names, names, iter_file_similarity_rows(files, None, memory_budget),
+                                  args.format)
+        metrics.emit('batch', documents=len(files), query=args.query)
+    except Exception as e:
+        print(f"错误: {str(e)}")
+        sys.exit(1)
+
+
+def forward_to_server(address, original_file, plagiarized_file, idf_model=None):
+    """
+    尝试把查重请求转发给常驻服务（python main.py serve）
+    未指定地址时使用默认套接字；请求带上本进程的打分配置（分词词典、IDF模型），
+    服务未运行或服务端配置不同时返回 None，由调用方在本进程内计算
+    """
+    from server import DEFAULT_SOCKET, ServerUnavailable, forward_check, scoring_config
+
+    if not address:
+        if not os.path.exists(DEFAULT_SOCKET):
+            return None
+        address = DEFAULT_SOCKET
+    try:
+        return forward_check(address, original_file, plagiarized_file, config=scoring_config(idf_model))
+    except ServerUnavailable:
+        return None
+
+
+def _lazy_command(module_name, function_name):
+    """延迟导入子命令所在模块，普通查重不加载这些模块及其依赖"""
+    def command(argv):
+        import importlib
+        return getattr(importlib.import_module(module_name), function_name)(argv)
+    return command
+
+
+# 子命令表：第一个参数命中时转交给对应的处理函数
+SUBCOMMANDS = {
+    'batch': batch_main,
+    'index': _lazy_command('lsh_index', 'index_main'),
+    'serve': _lazy_command('server', 'serve_main'),
+    'model': _lazy_command('idf_model', 'model_main'),
+    'bulk': _lazy_command('bulk', 'bulk_main'),
+    'search': _lazy_command('inverted_index', 'search_main'),
+    'simhash': _lazy_command('simhash', 'simhash_main'),
+    'cache': _lazy_command('result_cache', 'cache_main'),
+    'corpus': _lazy_command('corpus_store', 'corpus_main'),
+    'shard': _lazy_command('shards', 'shard_main'),
+    'segdict': _lazy_command('seg_dict', 'segdict_main'),
+}
+
+
 def main():
     """
     论文查重系统主函数 - Windows优化版
     从命令行接收三个参数：原文文件、抄袭版论文文件、输出答案文件
     """
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        return SUBCOMMANDS[sys.argv[1]](sys.argv[2:])
+
     # 配置命令行参数（支持默认值，也可手动传入）
     parser = argparse.ArgumentParser(description='论文查重系统')
     parser.add_argument(
@@ -143,9 +767,150 @@ def main():
         help='启用性能分析'
     )
 
+    # 磁盘分词缓存目录
+    parser.add_argument(
+        '--cache-dir',
+        default=os.environ.get('PAPER_CHECK_CACHE_DIR'),
+        help='磁盘分词缓存目录，默认读取环境变量 PAPER_CHECK_CACHE_DIR'
+    )
+
+    # 并行分词
+    parser.add_argument(
+        '--seg-workers',
+        type=int,
+        default=None,
+        help='并行分词的进程数，默认使用全部CPU核，1 表示始终串行'
+    )
+    parser.add_argument(
+        '--seg-threshold',
+        type=int,
+        default=None,
+        help='文本达到该字符数才启用并行分词，默认 1048576'
+    )
+    parser.add_argument(
+        '--seg-dict',
+        default=os.environ.get('PAPER_CHECK_SEG_DICT'),
+        help='预编译分词词典（python main.py segdict build 生成），映射文件即可分词，不再加载 jieba 文本词典；'
+             '默认读取环境变量 PAPER_CHECK_SEG_DICT'
+    )
+
+    # 打分后端
+    parser.add_argument(
+        '--backend',
+        choices=SCORING_BACKENDS,
+        default='auto',
+        help='TF-IDF打分后端：auto（默认，能不导入sklearn时就不导入）或 sklearn'
+    )
+
+    # 分析器
+    parser.add_argument(
+        '--analyzer',
+        choices=ANALYZERS,
+        default='jieba',
+        help='TF-IDF的特征：jieba（分词，默认）或 char（字符二元组和三元组的哈希词频，不分词、不加载词典）'
+    )
+
+    # 语料IDF模型
+    parser.add_argument(
+        '--idf-model',
+        default=os.environ.get('PAPER_CHECK_IDF_MODEL'),
+        help='语料IDF模型文件（python main.py model build 生成），默认读取环境变量 PAPER_CHECK_IDF_MODEL'
+    )
+
+    # 修订版增量查重
+    parser.add_argument(
+        '--revision-store',
+        default=os.environ.get('PAPER_CHECK_REVISION_STORE'),
+        help='修订存储文件（SQLite），默认读取环境变量 PAPER_CHECK_REVISION_STORE；'
+             '同一论文再次提交时只对变化的段落重新分词'
+    )
+
+    # 持久化结果缓存
+    parser.add_argument(
+        '--result-cache',
+        default=os.environ.get('PAPER_CHECK_RESULT_CACHE'),
+        help='查重结果缓存文件（SQLite），默认读取环境变量 PAPER_CHECK_RESULT_CACHE；'
+             '两篇论文内容和算法配置都未变时直接返回上次的结果'
+    )
+
+    # 分阶段指标
+    parser.add_argument(
+        '--metrics',
+        default=os.environ.get('PAPER_CHECK_METRICS'),
+        help="分阶段计时与计数的 JSON 行输出文件（'-' 为标准错误），默认读取环境变量 PAPER_CHECK_METRICS"
+    )
+
+    # 查重算法
+    parser.add_argument(
+        '--engine',
+        choices=['tfidf', 'winnowing', 'lcs'],
+        default='tfidf',
+        help='查重算法：tfidf（词频余弦，默认）、winnowing（指纹匹配，可输出抄袭片段）'
+             '或 lcs（字符级最长公共子序列，对语序敏感）'
+    )
+    parser.add_argument(
+        '--report',
+        default=None,
+        help='匹配片段报告输出路径（JSON，仅 winnowing 算法）'
+    )
+
+    # 廉价筛查
+    parser.add_argument(
+        '--cascade',
+        nargs='?',
+        const='all',
+        default=None,
+        help='TF-IDF前先做廉价筛查（空文本、内容相同、长度比、字符集、抽样 n-gram），能下结论时不再分词；'
+             '可指定逗号分隔的阶段，默认全部阶段（仅 tfidf 算法）'
+    )
+
+    # 内存预算
+    parser.add_argument(
+        '--memory-budget',
+        type=float,
+        default=DEFAULT_MEMORY_BUDGET / 1024 / 1024,
+        help='内存预算（MB），文件超出预算时改为流式分块处理，默认 512'
+    )
+    parser.add_argument(
+        '--memory-trace',
+        choices=memory.MEMORY_TRACKERS,
+        default=os.environ.get('PAPER_CHECK_MEMORY_TRACE'),
+        help='跟踪内存峰值（rss 采样常驻内存，tracemalloc 跟踪Python分配），'
+             '--metrics 记录中每个阶段附带 peak_memory；默认读取环境变量 PAPER_CHECK_MEMORY_TRACE'
+    )
+    parser.add_argument(
+        '--lcs-max-chars',
+        type=int,
+        default=DEFAULT_LCS_MAX_CHARS,
+        help=f'lcs 算法的字符数上限（预处理后较长的一篇），耗时与两篇长度之积成正比，默认 {DEFAULT_LCS_MAX_CHARS}'
+    )
+
+    # 常驻查重服务
+    parser.add_argument(
+        '--server',
+        default=os.environ.get('PAPER_CHECK_SERVER'),
+        help='常驻查重服务地址，默认读取环境变量 PAPER_CHECK_SERVER，未设置时尝试默认套接字'
+    )
+    parser.add_argument(
+        '--no-server',
+        action='store_true',
+        help='不转发给常驻服务，始终在本进程内计算'
+    )
+
 
     try:
         args = parser.parse_args()
+        configure_segment_cache(args.cache_dir)
+        configure_parallel_segmentation(args.seg_workers, args.seg_threshold)
+        if args.seg_dict:
+            from seg_dict import configure_segment_dictionary
+            configure_segment_dictionary(args.seg_dict)
+        configure_scoring_backend(args.backend)
+        configure_idf_model(args.idf_model)
+        configure_analyzer(args.analyzer)
+        metrics.configure_metrics(args.metrics)
+        memory.configure_memory_tracking(args.memory_trace)
+        started = time.perf_counter()
 
         # 验证文件路径
         if not all([args.original_file, args.plagiarized_file, args.output_file]):
@@ -156,18 +921,71 @@ def main():
             if not os.path.exists(file_path):
                 raise Exception(f"文件不存在: {file_path}")
 
-        # 检查文件大小限制（防止内存溢出）
-        max_file_size = 10 * 1024 * 1024  # 10MB
+        # 检查内存预算（防止内存溢出）：超出预算的文件改为流式分块处理
+        memory_budget = int(args.memory_budget * 1024 * 1024)
+        if memory_budget <= 0:
+            raise Exception(f"无效的内存预算: {args.memory_budget}MB")
+        largest_file_size = max(os.path.getsize(args.original_file), os.path.getsize(args.plagiarized_file))
+        streaming = largest_file_size * IN_MEMORY_FACTOR > memory_budget
+        if streaming and args.engine != 'tfidf':
+            # winnowing 的匹配片段需要原文偏移，lcs 需要完整的字符序列，都只能整篇读入
+            raise Exception(f"文件超出内存预算（{args.memory_budget}MB），{args.engine} 算法需要整篇读入，"
+                            f"请提高 --memory-budget 或改用 tfidf 算法")
+        if args.report and args.engine != 'winnowing':
+            raise Exception("--report 仅支持 winnowing 算法")
+        if args.analyzer != 'jieba' and (args.engine != 'tfidf' or args.idf_model or args.revision_store):
+            raise Exception("--analyzer char 仅支持 tfidf 算法，且不能与 --idf-model、--revision-store 同时使用")
+        if args.cascade and args.engine != 'tfidf':
+            raise Exception("--cascade 仅支持 tfidf 算法")
+        if args.cascade:
+            from cascade import cascade_options
+            cascade = cascade_options(None if args.cascade == 'all' else args.cascade)
+        else:
+            cascade = None
 
-        if os.path.getsize(args.original_file) > max_file_size:
-            raise Exception(f"原文文件过大: {os.path.getsize(args.original_file) / 1024 / 1024:.2f}MB > 10MB")
+        # 结果缓存：按两篇论文的内容哈希和算法配置查找上次的结果
+        # （流式处理不整篇读入，报告需要匹配片段，性能分析需要实际计算，这些情况不使用缓存）
+        result_cache = None
+        if args.result_cache and not streaming and not args.report and not args.profile:
+            from result_cache import ResultCache, check_config, content_hash
+            result_cache = ResultCache(args.result_cache)
+            cache_key = (content_hash(cached_read_file(args.original_file)),
+                         content_hash(cached_read_file(args.plagiarized_file)),
+                         check_config(args.engine, args.idf_model, cascade, args.analyzer))
+            similarity = result_cache.get(*cache_key)
+            metrics.cache_lookup('result', similarity is not None)
+            if similarity is not None:
+                result_cache.close()
+                write_result(args.output_file, similarity)
+                metrics.emit('check', engine=args.engine, mode='result_cache', similarity=similarity,
+                             seconds=round(time.perf_counter() - started, 6))
+                print(f"查重完成，重复率为: {similarity:.4f}")
+                return
 
-        if os.path.getsize(args.plagiarized_file) > max_file_size:
-            raise Exception(f"抄袭版文件过大: {os.path.getsize(args.plagiarized_file) / 1024 / 1024:.2f}MB > 10MB")
+        # 廉价筛查能下结论时不再分词（流式处理不整篇读入，直接做完整计算）
+        decided_by = None
+        if cascade is not None and not streaming:
+            from cascade import screen
+            decision = screen(cached_read_file(args.original_file), cached_read_file(args.plagiarized_file), cascade)
+            if decision is not None:
+                similarity, decided_by = decision
 
-        # 读取文件内容 - 使用缓存版本
-        original_text = cached_read_file(args.original_file)
-        plagiarized_text = cached_read_file(args.plagiarized_file)
+        # 常驻服务在运行时直接转发，省去导入第三方库和加载词典的开销
+        # 服务端的分词词典和IDF模型与本进程不同时不转发；修订存储和字符分析器始终在本进程内计算
+        if decided_by is None and not args.no_server and not args.profile and not streaming \
+                and args.engine == 'tfidf' and args.analyzer == 'jieba' and not args.revision_store:
+            similarity = forward_to_server(args.server, args.original_file, args.plagiarized_file, args.idf_model)
+            if similarity is not None:
+                # 服务端只返回相似度，结果文件由本进程写入
+                write_result(args.output_file, similarity)
+                # 服务端已确认打分配置与本进程相同（配置不同时 forward_to_server 返回 None），可以按本地配置缓存
+                if result_cache is not None:
+                    result_cache.put(*cache_key, similarity)
+                    result_cache.close()
+                metrics.emit('check', engine=args.engine, mode='server', similarity=similarity,
+                             seconds=round(time.perf_counter() - started, 6))
+                print(f"查重完成，重复率为: {similarity:.4f}")
+                return
 
         # 性能分析开关
         if args.profile:
@@ -176,21 +994,74 @@ def main():
             profiler = cProfile.Profile()
             profiler.enable()
 
+        if decided_by is not None:
+            pass
+        elif args.engine == 'winnowing':
+            # 指纹匹配需要原文偏移，整篇读入；指纹本身远小于原文
+            from winnowing import winnowing_similarity
+            original_text = cached_read_file(args.original_file)
+            plagiarized_text = cached_read_file(args.plagiarized_file)
+            with metrics.stage('winnowing'):
+                result = winnowing_similarity(original_text, plagiarized_text)
+            similarity = result['similarity']
+            if args.report:
+                write_report(args.report, {
+                    'original_file': args.original_file,
+                    'plagiarized_file': args.plagiarized_file,
+                    'engine': 'winnowing',
+                    'similarity': similarity,
+                    'matches': result['matches'],
+                })
+        elif args.engine == 'lcs':
+            from lcs import lcs_similarity
+            with metrics.stage('lcs'):
+                similarity = lcs_similarity(cached_read_file(args.original_file),
+                                            cached_read_file(args.plagiarized_file),
+                                            args.lcs_max_chars, memory_budget)
+        elif streaming:
+            # 大文件：流式读取、预处理和分词，峰值内存受块大小约束
+            similarity = calculate_similarity_files(args.original_file, args.plagiarized_file,
+                                                    stream_chunk_size(memory_budget))
+        else:
+            # 读取文件内容 - 使用缓存版本
+            original_text = cached_read_file(args.original_file)
+            plagiarized_text = cached_read_file(args.plagiarized_file)
+
             # 计算相似度
-            similarity = calculate_similarity(original_text, plagiarized_text)
+            if args.revision_store:
+                # 按文件绝对路径识别同一篇论文的不同版本，只对变化的段落重新分词
+                from revision import RevisionStore
+                store = RevisionStore(args.revision_store)
+                try:
+                    similarity = store.similarity(os.path.abspath(args.original_file), original_text,
+                                                  os.path.abspath(args.plagiarized_file), plagiarized_text)
+                finally:
+                    store.close()
+            else:
+                similarity = calculate_similarity(original_text, plagiarized_text)
 
+        if args.profile:
             profiler.disable()
             stats = pstats.Stats(profiler)
             stats.sort_stats('cumtime')
             stats.print_stats(20)  # 打印前20个最耗时的函数
-        else:
-            # 计算相似度
-            similarity = calculate_similarity(original_text, plagiarized_text)
+
+        if result_cache is not None:
+            result_cache.put(*cache_key, similarity)
+            result_cache.close()
 
         # 写入结果
         write_result(args.output_file, similarity)
+        if cascade is not None and decided_by is None:
+            decided_by = 'tfidf'
+        metrics.emit('check', engine=args.engine, mode='stream' if streaming else 'memory',
+                     similarity=similarity, seconds=round(time.perf_counter() - started, 6),
+                     **({'decided_by': decided_by} if decided_by else {}))
 
-        print(f"查重完成，重复率为: {similarity:.4f}")
+        if decided_by:
+            print(f"查重完成，重复率为: {similarity:.4f}（判定阶段: {decided_by}）")
+        else:
+            print(f"查重完成，重复率为: {similarity:.4f}")
 
     except Exception as e:
         print(f"错误: {str(e)}")
@@ -198,4 +1069,6 @@ def main():
 
 
 if __name__ == '__main__':
+    # 子命令模块通过 import main 复用这里的函数，让它们拿到同一个模块对象
+    sys.modules.setdefault('main', sys.modules['__main__'])
     main()
\ No newline at end of file
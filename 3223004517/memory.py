@@ -0,0 +1,130 @@
+import os
+import threading
+
+# 内存跟踪方式，默认关闭
+# rss         后台线程按固定间隔采样进程常驻内存，开销很小，包含 jieba 词典、C 扩展等全部内存
+# tracemalloc 跟踪 Python 分配（NumPy 数组也会登记），不受采样间隔影响，但计算会明显变慢，适合定位占内存的阶段
+# 开启后 metrics.stage() 为每个阶段记录 peak_memory（阶段执行期间的内存峰值，字节）
+MEMORY_TRACKERS = ['rss', 'tracemalloc']
+
+# RSS 采样间隔（秒）
+DEFAULT_INTERVAL = 0.005
+
+
+def rss_bytes():
+    """进程当前常驻内存（字节）；Linux 读取 /proc，其他平台需要 psutil，都不可用时返回 None"""
+    try:
+        with open('/proc/self/statm', 'rb') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+class MemoryTracker:
+    """
+    内存峰值跟踪
+    open_window() / close_window() 之间的峰值即为一个阶段的峰值；窗口可以嵌套，
+    外层窗口的峰值包含内层窗口期间的峰值
+    """
+
+    def __init__(self, mode='rss', interval=DEFAULT_INTERVAL):
+        if mode not in MEMORY_TRACKERS:
+            raise Exception(f"不支持的内存跟踪方式: {mode}")
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._windows = []
+        self._stop = threading.Event()
+        self._sampler = None
+        if mode == 'tracemalloc':
+            import tracemalloc
+            self._tracemalloc = tracemalloc
+            # 已由调用方开启时不负责关闭
+            self._owns_tracing = not tracemalloc.is_tracing()
+            if self._owns_tracing:
+                tracemalloc.start()
+        else:
+            if rss_bytes() is None:
+                raise Exception("当前平台无法读取常驻内存，请安装 psutil 或使用 tracemalloc")
+            self._sampler = threading.Thread(target=self._sample_loop, args=(interval,),
+                                             name='memory_sampler', daemon=True)
+            self._sampler.start()
+
+    def current(self):
+        """当前内存占用（字节）"""
+        if self.mode == 'tracemalloc':
+            return self._tracemalloc.get_traced_memory()[0]
+        return rss_bytes()
+
+    def _fold(self):
+        """把当前峰值计入所有打开的窗口（调用方持有锁）"""
+        if self.mode == 'tracemalloc':
+            # tracemalloc 只有一个全局峰值：计入各窗口后清零，嵌套窗口之间互不干扰
+            peak = self._tracemalloc.get_traced_memory()[1]
+            self._tracemalloc.reset_peak()
+        else:
+            peak = rss_bytes()
+        for window in self._windows:
+            if peak > window[0]:
+                window[0] = peak
+
+    def _sample_loop(self, interval):
+        while not self._stop.wait(interval):
+            with self._lock:
+                if self._windows:
+                    self._fold()
+
+    def open_window(self):
+        with self._lock:
+            self._fold()
+            window = [self.current()]
+            self._windows.append(window)
+            return window
+
+    def close_window(self, window):
+        """关闭窗口，返回窗口期间的内存峰值（字节）"""
+        with self._lock:
+            self._fold()
+            # 按对象身份移除：峰值相同的两个窗口按值比较是相等的
+            self._windows = [item for item in self._windows if item is not window]
+            return window[0]
+
+    def close(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if self.mode == 'tracemalloc' and self._owns_tracing:
+            self._tracemalloc.stop()
+
+
+_tracker = None
+
+
+def configure_memory_tracking(mode=None, interval=DEFAULT_INTERVAL):
+    """开启（mode 为 rss / tracemalloc）或关闭（mode 为空）内存跟踪，返回当前使用的跟踪器"""
+    global _tracker
+    if _tracker is not None:
+        _tracker.close()
+        _tracker = None
+    if mode:
+        _tracker = MemoryTracker(mode, interval)
+    return _tracker
+
+
+def tracker():
+    return _tracker
+
+
+def current_memory():
+    """
+    当前内存占用（字节），用于判断是否超出内存预算
+    开启跟踪时使用跟踪器的口径，否则读取常驻内存；无法获取时返回 None
+    """
+    if _tracker is not None:
+        return _tracker.current()
+    return rss_bytes()
+
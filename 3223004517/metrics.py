@@ -0,0 +1,185 @@
+import json
+import os
+import sys
+import threading
+import time
+
+import memory
+
+# 分阶段计时与计数，默认关闭
+# 关闭时 stage() 返回空操作的上下文，热点路径上只多一次函数调用
+# 开启后每个阶段累计调用次数、耗时和处理量（字节、字符、词数等），
+# 每次查重结束时由 emit() 汇总为一条记录，写成 JSON 行或交给钩子函数
+# 开启内存跟踪（memory.configure_memory_tracking）后，每个阶段还记录 peak_memory：各次调用中的最大内存峰值（字节）
+
+
+class MetricsRecorder:
+    """线程安全的阶段计时与缓存命中计数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.caches = {}
+
+    def add_stage(self, name, seconds, amounts, failed=False):
+        with self._lock:
+            entry = self.stages.get(name)
+            if entry is None:
+                entry = self.stages[name] = {'calls': 0, 'seconds': 0.0}
+            entry['calls'] += 1
+            entry['seconds'] += seconds
+            if failed:
+                entry['errors'] = entry.get('errors', 0) + 1
+            for key, value in amounts.items():
+                if key.startswith('peak_'):
+                    # 峰值类的量取最大值，其余累加
+                    entry[key] = max(entry.get(key, 0), value)
+                else:
+                    entry[key] = entry.get(key, 0) + value
+
+    def add_cache(self, name, hit):
+        with self._lock:
+            entry = self.caches.get(name)
+            if entry is None:
+                entry = self.caches[name] = {'hits': 0, 'misses': 0}
+            entry['hits' if hit else 'misses'] += 1
+
+    def snapshot(self, reset=False):
+        """返回 {'stages': ..., 'caches': ...} 的副本，缓存附带命中率"""
+        with self._lock:
+            stages = {name: dict(entry) for name, entry in self.stages.items()}
+            caches = {}
+            for name, entry in self.caches.items():
+                lookups = entry['hits'] + entry['misses']
+                caches[name] = dict(entry, hit_rate=round(entry['hits'] / lookups, 4) if lookups else None)
+            if reset:
+                self.stages = {}
+                self.caches = {}
+        for entry in stages.values():
+            entry['seconds'] = round(entry['seconds'], 6)
+        return {'stages': stages, 'caches': caches}
+
+
+class _Stage:
+    """计时上下文：进入时返回一个字典，调用方把处理量（bytes / chars / tokens 等）写入其中"""
+    __slots__ = ('recorder', 'name', 'amounts', 'start', 'tracker', 'window')
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.amounts = {}
+        self.tracker = memory.tracker()
+        if self.tracker is not None:
+            self.window = self.tracker.open_window()
+        self.start = time.perf_counter()
+        return self.amounts
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self.tracker is not None:
+            self.amounts['peak_memory'] = self.tracker.close_window(self.window)
+        self.recorder.add_stage(self.name, time.perf_counter() - self.start, self.amounts, exc_type is not None)
+        return False
+
+
+class _NullStage:
+    """关闭指标时使用的空操作上下文"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+_recorder = None
+_sinks = []
+
+
+def enabled():
+    return _recorder is not None
+
+
+def configure_metrics(path=None, hooks=()):
+    """
+    开启或关闭指标采集
+    path 为 JSON 行输出文件（追加写入，'-' 表示标准错误），hooks 为接收记录字典的可调用对象；
+    两者都为空时关闭采集
+    """
+    global _recorder
+    _sinks.clear()
+    if path:
+        _sinks.append(_jsonl_sink(path))
+    _sinks.extend(hooks)
+    _recorder = MetricsRecorder() if _sinks else None
+    return _recorder
+
+
+def add_hook(hook):
+    """追加一个钩子函数（如指标收集器的上报函数），同时开启采集"""
+    global _recorder
+    _sinks.append(hook)
+    if _recorder is None:
+        _recorder = MetricsRecorder()
+
+
+def _jsonl_sink(path):
+    def write(record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        if path == '-':
+            sys.stderr.write(line)
+            sys.stderr.flush()
+            return
+        # 每条记录单独以追加方式写入，多个进程可以共用同一个文件
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write(line)
+    return write
+
+
+def stage(name):
+    """
+    阶段计时：
+        with metrics.stage('segment') as sizes:
+            words = ...
+            sizes['tokens'] = len(words)
+    """
+    recorder = _recorder
+    if recorder is None:
+        return _NULL_STAGE
+    return _Stage(recorder, name)
+
+
+def cache_lookup(name, hit):
+    """记录一次缓存查询是否命中"""
+    recorder = _recorder
+    if recorder is not None:
+        recorder.add_cache(name, hit)
+
+
+def reset():
+    """丢弃当前累计的指标（如预热阶段产生的记录）"""
+    if _recorder is not None:
+        _recorder.snapshot(reset=True)
+
+
+def emit(event, **fields):
+    """
+    汇总并清空当前累计的指标，输出一条记录：
+    {'event', 'time', 'pid', 其他字段..., 'stages': {阶段: {calls, seconds, ...}}, 'caches': {缓存: {hits, misses, hit_rate}}}
+    未开启采集时返回 None；输出失败只打印警告，不影响查重结果
+    """
+    recorder = _recorder
+    if recorder is None:
+        return None
+    record = {'event': event, 'time': round(time.time(), 3), 'pid': os.getpid()}
+    record.update(fields)
+    record.update(recorder.snapshot(reset=True))
+    for sink in list(_sinks):
+        try:
+            sink(record)
+        except Exception as e:
+            print(f"警告: 指标输出失败: {str(e)}", file=sys.stderr)
+    return record
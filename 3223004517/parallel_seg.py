@@ -0,0 +1,111 @@
+import atexit
+import os
+import re
+import threading
+
+# 句子、段落边界。jieba 精确模式以非汉字/字母/数字字符为分块边界，
+# 在这些字符之后切分，各块分词结果拼接起来与整体分词完全一致
+_BOUNDARY = re.compile(r'[。！？!?；;\s]')
+
+# 默认每块的最小长度（字符数），块太小时进程间传输的开销会超过分词本身
+MIN_CHUNK_SIZE = 64 * 1024
+
+_pool = None
+_pool_workers = 0
+_pool_dictionary = None
+_pool_lock = threading.Lock()
+
+
+def split_chunks(text, chunk_size):
+    """
+    在句子/段落边界处把文本切成约 chunk_size 个字符的块
+    找不到边界的超长片段整体作为一块，保证切分不改变分词结果
+    """
+    chunks = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = start + chunk_size
+        if end >= length:
+            chunks.append(text[start:])
+            break
+        match = _BOUNDARY.search(text, end)
+        if match is None:
+            chunks.append(text[start:])
+            break
+        chunks.append(text[start:match.end()])
+        start = match.end()
+    return chunks
+
+
+def segment_chunk(chunk):
+    """在工作进程中对单个块做精确模式分词，去除空白词"""
+    from seg_dict import cut
+    return [word for word in cut(chunk) if word.strip()]
+
+
+def _init_worker(dictionary_path=None):
+    """
+    工作进程启动时准备分词器，不在首个任务里付出这部分开销：
+    使用预编译词典时只需映射文件（各进程共享页缓存），否则构建 jieba 前缀词典
+    """
+    import seg_dict
+    seg_dict.configure_segment_dictionary(dictionary_path)
+    seg_dict.initialize()
+
+
+def _shutdown_pool():
+    """进程退出时关闭进程池"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(_shutdown_pool)
+
+
+def _get_pool(workers):
+    """获取（必要时创建）常驻的分词进程池，多次调用之间复用，避免重复加载词典"""
+    global _pool, _pool_workers, _pool_dictionary
+    from concurrent.futures import ProcessPoolExecutor
+    from seg_dict import active_dictionary
+
+    dictionary = active_dictionary()
+    dictionary_path = dictionary.path if dictionary is not None else None
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers or _pool_dictionary != dictionary_path:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(dictionary_path,))
+            _pool_workers = workers
+            _pool_dictionary = dictionary_path
+        return _pool
+
+
+def parallel_segment(text, workers=None, chunk_size=None):
+    """
+    分块并行分词
+    按句子/段落边界切块后交给进程池，结果按原顺序拼接，与串行分词完全一致
+    进程池不可用时（如受限环境、嵌套在守护进程中）退回串行分词
+    """
+    workers = workers or os.cpu_count() or 1
+    if chunk_size is None:
+        # 每个进程分到约4块，便于负载均衡
+        chunk_size = max(MIN_CHUNK_SIZE, len(text) // (workers * 4) + 1)
+
+    chunks = split_chunks(text, chunk_size)
+    if workers <= 1 or len(chunks) <= 1:
+        return segment_chunk(text)
+
+    try:
+        pool = _get_pool(workers)
+        words = []
+        for chunk_words in pool.map(segment_chunk, chunks):
+            words.extend(chunk_words)
+        return words
+    except (OSError, RuntimeError, AssertionError):
+        # BrokenProcessPool 是 RuntimeError 的子类
+        _shutdown_pool()
+        return segment_chunk(text)
@@ -0,0 +1,189 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+# 打分算法版本：任何会改变相似度结果的修改都应递增，旧版本的缓存结果随之失效
+RESULT_CACHE_VERSION = 1
+
+# 默认最多保存的结果条数，超出后按最近使用时间淘汰
+DEFAULT_MAX_ENTRIES = 1000000
+
+# 淘汰时降到上限的比例，避免每次写入都触发淘汰
+_EVICT_RATIO = 0.9
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    original_hash TEXT NOT NULL,
+    plagiarized_hash TEXT NOT NULL,
+    config TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    similarity REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (original_hash, plagiarized_hash, config)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+"""
+
+
+def content_hash(text):
+    """文本内容的 SHA-256；按解码后的文本计算，同一内容不同编码的文件得到相同的键"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def config_key(engine, **options):
+    """
+    由算法和会影响结果的配置生成缓存键，包含 RESULT_CACHE_VERSION
+    options 的值须可 JSON 序列化，None 值会被忽略
+    """
+    options = {key: value for key, value in options.items() if value is not None}
+    return json.dumps({'version': RESULT_CACHE_VERSION, 'engine': engine, **options},
+                      sort_keys=True, ensure_ascii=False)
+
+
+def file_identity(path):
+    """文件的路径、大小和修改时间，用于把外部模型文件纳入缓存键"""
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_size}|{int(stat.st_mtime)}"
+
+
+def check_config(engine, idf_model=None, cascade=None, analyzer='jieba'):
+    """
+    命令行单对查重的缓存键
+    tfidf 带上 jieba 词典版本、IDF模型文件的标识、分析器和廉价筛查的配置（筛查可能给出与完整计算不同的结果）；
+    词典版本和IDF模型取自 server.scoring_config，与转发查重时和服务端核对的配置相同，
+    服务端算出的结果按这个键缓存不会与本进程的结果混淆；
+    winnowing、lcs 和字符分析器只依赖字符，不受词典影响
+    """
+    if engine != 'tfidf' or analyzer == 'jieba':
+        analyzer = None
+    dictionary = model = None
+    if engine == 'tfidf' and analyzer is None:
+        from server import scoring_config
+        identity = scoring_config(idf_model)
+        dictionary, model = identity['dictionary'], identity['idf_model']
+    elif engine == 'tfidf' and idf_model:
+        model = file_identity(idf_model)
+    if engine != 'tfidf':
+        cascade = None
+    elif cascade is not None:
+        cascade = dict(cascade, stages=list(cascade['stages']))
+    return config_key(engine, dictionary=dictionary, idf_model=model, cascade=cascade, analyzer=analyzer)
+
+
+class ResultCache:
+    """
+    持久化的查重结果缓存（SQLite）
+    键为 原文内容哈希 + 抄袭版内容哈希 + 配置，与文件路径无关，进程退出后仍然有效
+    条数超过 max_entries 时按最近使用时间淘汰最旧的条目（LRU）
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        try:
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            # 多个评分脚本可能同时使用同一个缓存，写锁冲突时等待而不是立即报错
+            self.connection = sqlite3.connect(path, timeout=30)
+            self.connection.executescript(_SCHEMA)
+            self._count = self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        except (OSError, sqlite3.Error) as e:
+            raise Exception(f"打开结果缓存失败: {str(e)}")
+        self.path = path
+        self.max_entries = max_entries
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def get(self, original_hash, plagiarized_hash, config):
+        """查询缓存结果，命中时刷新最近使用时间，未命中返回 None"""
+        key = (original_hash, plagiarized_hash, config)
+        row = self.connection.execute(
+            "SELECT similarity FROM results WHERE original_hash = ? AND plagiarized_hash = ? AND config = ?",
+            key).fetchone()
+        if row is None:
+            return None
+        with self.connection:
+            self.connection.execute(
+                "UPDATE results SET last_used = ? WHERE original_hash = ? AND plagiarized_hash = ? AND config = ?",
+                (time.time(),) + key)
+        return row[0]
+
+    def put(self, original_hash, plagiarized_hash, config, similarity):
+        """保存结果，必要时淘汰最久未使用的条目"""
+        engine = json.loads(config).get('engine', '')
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT OR REPLACE INTO results "
+                "(original_hash, plagiarized_hash, config, engine, similarity, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (original_hash, plagiarized_hash, config, engine, similarity, time.time()))
+            self._count += cursor.rowcount
+        if self._count > self.max_entries:
+            self.evict()
+
+    def evict(self):
+        """淘汰最久未使用的条目，直到条数降到上限的90%"""
+        with self.connection:
+            self._count = self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            excess = self._count - int(self.max_entries * _EVICT_RATIO)
+            if excess > 0:
+                self.connection.execute(
+                    "DELETE FROM results WHERE (original_hash, plagiarized_hash, config) IN "
+                    "(SELECT original_hash, plagiarized_hash, config FROM results ORDER BY last_used LIMIT ?)",
+                    (excess,))
+                self._count -= excess
+
+    def invalidate(self, engine=None):
+        """
+        删除缓存结果，返回删除条数
+        engine 为空时删除全部；否则只删除该算法的结果（算法实现或参数变化后使用）；
+        版本号 RESULT_CACHE_VERSION 之外的旧结果也一并删除
+        """
+        current = f'%"version": {RESULT_CACHE_VERSION}%'
+        with self.connection:
+            if engine is None:
+                cursor = self.connection.execute("DELETE FROM results")
+            else:
+                cursor = self.connection.execute(
+                    "DELETE FROM results WHERE engine = ? OR config NOT LIKE ?", (engine, current))
+        self._count = len(self)
+        return cursor.rowcount
+
+
+def cache_main(argv):
+    """
+    结果缓存子命令
+    python main.py cache info 缓存文件
+    python main.py cache invalidate 缓存文件 [--engine 算法]
+    """
+    parser = argparse.ArgumentParser(prog='main.py cache', description='查重结果缓存')
+    actions = parser.add_subparsers(dest='action', required=True)
+
+    info_parser = actions.add_parser('info', help='查看缓存条数')
+    info_parser.add_argument('cache_file', help='结果缓存文件路径（SQLite）')
+
+    invalidate_parser = actions.add_parser('invalidate', help='删除缓存结果')
+    invalidate_parser.add_argument('cache_file', help='结果缓存文件路径（SQLite）')
+    invalidate_parser.add_argument('--engine', default=None, help='只删除该算法的结果，默认删除全部')
+
+    try:
+        args = parser.parse_args(argv)
+        if not os.path.exists(args.cache_file):
+            raise Exception(f"结果缓存文件不存在: {args.cache_file}")
+        cache = ResultCache(args.cache_file)
+        try:
+            if args.action == 'info':
+                print(f"结果缓存: {args.cache_file}，共 {len(cache)} 条")
+            else:
+                print(f"已删除 {cache.invalidate(args.engine)} 条缓存结果")
+        finally:
+            cache.close()
+    except Exception as e:
+        print(f"错误: {str(e)}")
+        sys.exit(1)
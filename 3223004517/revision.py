@@ -0,0 +1,182 @@
+import hashlib
+import json
+import sqlite3
+from collections import Counter
+
+from vocabulary import DEFAULT_MIN_TERM_LENGTH
+
+# 段落按内容哈希保存分词后的词频，文档保存段落哈希列表和总词频
+# 同一段落被多篇文档（或同一文档的多个版本）共用，引用计数为0时删除
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS paragraphs (
+    hash TEXT PRIMARY KEY,
+    refs INTEGER NOT NULL,
+    words INTEGER NOT NULL,
+    counts TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    blank INTEGER NOT NULL,
+    paragraphs TEXT NOT NULL,
+    words INTEGER NOT NULL,
+    counts TEXT NOT NULL
+);
+"""
+
+
+def split_paragraphs(text):
+    """
+    按行切分段落，忽略空白行
+    预处理会把换行变成空格，而空格是 jieba 的切分边界，所以逐段分词的结果拼接起来与整篇分词完全相同
+    """
+    return [line for line in text.split('\n') if line.strip()]
+
+
+def paragraph_hash(paragraph):
+    return hashlib.blake2b(paragraph.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def paragraph_terms(paragraph):
+    """与 calculate_similarity 相同的预处理、分词和计词规则，返回 (分词数, {词: 词频})"""
+    from main import preprocess_text, segment_text
+
+    processed = preprocess_text(paragraph)
+    words = segment_text(processed) if processed else []
+    return len(words), Counter(word.lower() for word in words if len(word) >= DEFAULT_MIN_TERM_LENGTH)
+
+
+class RevisionStore:
+    """
+    论文修订版的增量查重存储（SQLite）
+    同一篇论文再次提交时，只对内容有变化的段落重新分词，
+    文档词频减去删除段落、加上新增段落的词频，开销与修改量成正比
+    """
+
+    def __init__(self, path):
+        try:
+            # 多个进程同时提交修订时等待写锁，而不是立即报错
+            self.connection = sqlite3.connect(path, timeout=600)
+            self.connection.executescript(_SCHEMA)
+        except sqlite3.Error as e:
+            raise Exception(f"打开修订存储失败: {str(e)}")
+        self.path = path
+        # 本进程中实际重新分词的段落数
+        self.segmented = 0
+
+    def close(self):
+        self.connection.close()
+
+    def update(self, doc_id, text):
+        """
+        保存文档的新版本，返回 (原文是否为空白, 是否有分词结果, {词: 词频})，可直接用于 score_analyses
+        新段落先在锁外分词；读取旧版本、计算差量和写入在同一个写事务中完成，
+        多个进程同时提交同一篇论文时不会基于过期的旧版本计算差量
+        """
+        paragraphs = split_paragraphs(text)
+        hashes = [paragraph_hash(paragraph) for paragraph in paragraphs]
+        texts = dict(zip(hashes, paragraphs))
+        blank = not text.strip()
+        connection = self.connection
+
+        # 锁外分词：库中还没有的段落（持锁后仍缺的段落再补分词，只在并发删除时发生）
+        segmented = {}
+        for digest in texts:
+            if connection.execute("SELECT 1 FROM paragraphs WHERE hash = ?", (digest,)).fetchone() is None:
+                segmented[digest] = paragraph_terms(texts[digest])
+                self.segmented += 1
+
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT paragraphs, words, counts FROM documents WHERE doc_id = ?",
+                                     (doc_id,)).fetchone()
+            if row is not None:
+                old_hashes = json.loads(row[0])
+                words = row[1]
+                counts = Counter(json.loads(row[2]))
+            else:
+                old_hashes, words, counts = [], 0, Counter()
+
+            if old_hashes == hashes:
+                return blank, words > 0, counts
+
+            new_paragraphs = Counter(hashes)
+            old_paragraphs = Counter(old_hashes)
+            added = new_paragraphs - old_paragraphs
+            removed = old_paragraphs - new_paragraphs
+
+            for digest, times in added.items():
+                stored = connection.execute("SELECT words, counts FROM paragraphs WHERE hash = ?",
+                                            (digest,)).fetchone()
+                if stored is None:
+                    if digest not in segmented:
+                        segmented[digest] = paragraph_terms(texts[digest])
+                        self.segmented += 1
+                    paragraph_words, paragraph_counts = segmented[digest]
+                    connection.execute("INSERT INTO paragraphs (hash, refs, words, counts) VALUES (?, ?, ?, ?)",
+                                       (digest, times, paragraph_words,
+                                        json.dumps(paragraph_counts, ensure_ascii=False)))
+                else:
+                    paragraph_words, paragraph_counts = stored[0], json.loads(stored[1])
+                    connection.execute("UPDATE paragraphs SET refs = refs + ? WHERE hash = ?", (times, digest))
+                words += paragraph_words * times
+                for term, count in paragraph_counts.items():
+                    counts[term] += count * times
+
+            # 旧版本的段落记录缺失（存储被外部修改）时无法减去它的词频，改为按新版本的段落重新汇总
+            rebuild = False
+            for digest, times in removed.items():
+                stored = connection.execute("SELECT words, counts FROM paragraphs WHERE hash = ?",
+                                            (digest,)).fetchone()
+                if stored is None:
+                    rebuild = True
+                    continue
+                words -= stored[0] * times
+                for term, count in json.loads(stored[1]).items():
+                    counts[term] -= count * times
+                connection.execute("UPDATE paragraphs SET refs = refs - ? WHERE hash = ?", (times, digest))
+            connection.execute("DELETE FROM paragraphs WHERE refs <= 0")
+
+            if rebuild:
+                words, counts = self._total(new_paragraphs, texts, segmented)
+            counts = Counter({term: count for term, count in counts.items() if count > 0})
+            # 文档总词频整体序列化：评分需要完整的词频，读写开销与文档的不同词数成正比，远小于重新分词
+            connection.execute(
+                "INSERT OR REPLACE INTO documents (doc_id, blank, paragraphs, words, counts) VALUES (?, ?, ?, ?, ?)",
+                (doc_id, int(blank), json.dumps(hashes), words, json.dumps(counts, ensure_ascii=False)))
+        return blank, words > 0, counts
+
+    def _total(self, paragraph_times, texts, segmented):
+        """
+        按段落记录重新汇总文档的分词数和词频（调用方持有写锁）
+        记录同样缺失的段落重新分词并补写，引用数为本文档中的出现次数
+        """
+        words = 0
+        counts = Counter()
+        for digest, times in paragraph_times.items():
+            stored = self.connection.execute("SELECT words, counts FROM paragraphs WHERE hash = ?",
+                                             (digest,)).fetchone()
+            if stored is None:
+                if digest not in segmented:
+                    segmented[digest] = paragraph_terms(texts[digest])
+                    self.segmented += 1
+                paragraph_words, paragraph_counts = segmented[digest]
+                self.connection.execute("INSERT INTO paragraphs (hash, refs, words, counts) VALUES (?, ?, ?, ?)",
+                                        (digest, times, paragraph_words,
+                                         json.dumps(paragraph_counts, ensure_ascii=False)))
+            else:
+                paragraph_words, paragraph_counts = stored[0], json.loads(stored[1])
+            words += paragraph_words * times
+            for term, count in paragraph_counts.items():
+                counts[term] += count * times
+        return words, counts
+
+    def similarity(self, original_id, original_text, plagiarized_id, plagiarized_text):
+        """增量更新两篇文档后计算相似度，结果与 calculate_similarity 一致"""
+        from bulk import score_analyses
+
+        try:
+            original = self.update(original_id, original_text)
+            plagiarized = self.update(plagiarized_id, plagiarized_text)
+        except sqlite3.Error as e:
+            raise Exception(f"更新修订存储失败: {str(e)}")
+        return score_analyses(original, plagiarized)
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+# 缓存文件格式版本，分词结果的存储方式变化时递增，使旧缓存自动失效
+CACHE_FORMAT_VERSION = 1
+
+# 默认缓存容量上限：512MB
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def dictionary_version():
+    """
+    计算当前 jieba 词典的版本标识
+    由 jieba 版本号、词典文件路径、大小和修改时间组成，词典变化后缓存键随之变化；
+    使用预编译分词词典时为其内容版本
+    """
+    import jieba
+    from seg_dict import active_dictionary
+
+    compiled = active_dictionary()
+    if compiled is not None:
+        return compiled.version
+
+    dictionary = jieba.dt.dictionary
+    if dictionary is None:
+        dictionary = os.path.join(os.path.dirname(os.path.abspath(jieba.__file__)), jieba.DEFAULT_DICT_NAME)
+
+    try:
+        stat = os.stat(dictionary)
+        identity = f"{jieba.__version__}|{dictionary}|{stat.st_size}|{int(stat.st_mtime)}"
+    except OSError:
+        identity = f"{jieba.__version__}|{dictionary}"
+    return hashlib.sha1(identity.encode('utf-8')).hexdigest()[:16]
+
+
+class SegmentCache:
+    """
+    基于内容哈希的磁盘分词缓存
+    缓存键为 文本内容SHA-256 + 词典版本，多个进程、多次运行之间共享
+    总大小超过 max_bytes 时按最近使用时间淘汰最旧的条目（LRU）
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, min_length=1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # 过短的文本直接分词比读写磁盘更快，不进入缓存
+        self.min_length = min_length
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._version = None
+
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+        except OSError as e:
+            raise Exception(f"无法创建分词缓存目录: {cache_dir} ({str(e)})")
+        self._total_bytes = sum(size for _, _, size in self._scan())
+
+    def _scan(self):
+        """遍历缓存目录，返回 (路径, 最近使用时间, 大小) 列表"""
+        entries = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith('.tok'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _path(self, text):
+        """根据文本内容和词典版本计算缓存文件路径"""
+        if self._version is None:
+            self._version = dictionary_version()
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        key = f"{digest}-{self._version}-v{CACHE_FORMAT_VERSION}"
+        return os.path.join(self.cache_dir, digest[:2], key + '.tok')
+
+    def get(self, text):
+        """读取缓存的分词结果，未命中返回 None"""
+        if len(text) < self.min_length:
+            return None
+        path = self._path(text)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            # 更新修改时间作为LRU的最近使用时间
+            os.utime(path, None)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        if not data:
+            return []
+        # 预处理后的文本不含换行，词语中不会出现 '\n'
+        return data.decode('utf-8').split('\n')
+
+    def put(self, text, words):
+        """写入分词结果，写入后超出容量时触发淘汰"""
+        if len(text) < self.min_length:
+            return
+        path = self._path(text)
+        data = '\n'.join(words).encode('utf-8')
+
+        try:
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            # 先写临时文件再原子替换，避免并发读到半个文件
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            # 缓存写入失败不影响查重结果
+            return
+
+        with self._lock:
+            self._total_bytes += len(data)
+            over_budget = self._total_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def evict(self):
+        """按最近使用时间从旧到新删除缓存，直到总大小回到上限的90%以内"""
+        with self._lock:
+            entries = sorted(self._scan(), key=lambda entry: entry[1])
+            total = sum(size for _, _, size in entries)
+            target = self.max_bytes * 0.9
+            for path, _, size in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    continue
+            self._total_bytes = total
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            for path, _, _ in self._scan():
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+            self._total_bytes = 0
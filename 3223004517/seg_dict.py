@@ -0,0 +1,378 @@
+import argparse
+import hashlib
+import math
+import mmap
+import os
+import struct
+import sys
+
+# 预编译分词词典文件格式（小端）：
+#   文件头  魔数(8字节) + 键数、总词频、最长键长、强制拆分词区字节数（各8字节）+ 词典版本(16字节)
+#   哈希表  uint64 × 键数，jieba 前缀词典（词及其所有前缀）各键的64位哈希，升序排列
+#   词频表  int64 × 键数，与哈希表一一对应，前缀的词频为0
+#   对数表  float64 × 键数，log(词频 or 1)，与 jieba 运行时计算的值逐位相同
+#   强制拆分词区  词频为0的自定义词（UTF-8，换行分隔），加载时登记到 jieba 的 HMM 模块
+# 打开时只映射文件，不解析、不建字典；多个进程（并行分词的工作进程、常驻服务）共享同一份页缓存
+MAGIC = b'PCSEG\x00\x01\x00'
+_HEADER = struct.Struct('<8sQQQQ16s')
+
+
+def _is_block_char(codes):
+    """码位是否属于 jieba 精确模式的分块字符集（re_han_default：汉字、字母、数字和 +#&._%-）"""
+    import numpy as np
+
+    return (((codes >= 0x4E00) & (codes <= 0x9FD5))
+            | ((codes >= ord('a')) & (codes <= ord('z')))
+            | ((codes >= ord('A')) & (codes <= ord('Z')))
+            | ((codes >= ord('0')) & (codes <= ord('9')))
+            | np.isin(codes, [ord(char) for char in '+#&._%-']))
+
+
+def key_hashes(keys):
+    """一组字符串的64位哈希（与分词时在文本上逐字符延长计算的哈希相同），按长度分组向量化计算"""
+    import numpy as np
+    from char_ngram import HASH_BASE, mix64, text_codes
+
+    hashes = np.empty(len(keys), dtype=np.uint64)
+    by_length = {}
+    for index, key in enumerate(keys):
+        by_length.setdefault(len(key), []).append(index)
+    for length, indices in by_length.items():
+        codes = text_codes(''.join(keys[index] for index in indices)).astype(np.uint64).reshape(-1, length)
+        polynomial = codes[:, 0].copy()
+        for offset in range(1, length):
+            polynomial = polynomial * HASH_BASE + codes[:, offset]
+        hashes[indices] = mix64(polynomial)
+    return hashes
+
+
+def build_segment_dictionary(output_path, user_dictionaries=()):
+    """
+    把 jieba 默认词典和自定义词典（jieba 用户词典格式：词 [词频] [词性]）编译为可内存映射的词典文件
+    自定义词典用 jieba 自己的 load_userdict 加载，词频推断等规则与 jieba 完全相同
+    返回加载后的 CompiledDictionary
+    """
+    import jieba
+    import numpy as np
+    from jieba import finalseg
+
+    jieba.setLogLevel(60)
+    tokenizer = jieba.Tokenizer()
+    tokenizer.initialize()
+    force_split = set(finalseg.Force_Split_Words)
+    for path in user_dictionaries:
+        if not os.path.exists(path):
+            raise Exception(f"自定义词典不存在: {path}")
+        tokenizer.load_userdict(path)
+    # load_userdict 中词频为0的词会登记为 HMM 强制拆分词
+    force_split = sorted(set(finalseg.Force_Split_Words) - force_split)
+
+    keys = list(tokenizer.FREQ)
+    hashes = key_hashes(keys)
+    order = np.argsort(hashes, kind='stable')
+    hashes = hashes[order]
+    if len(hashes) > 1 and (hashes[1:] == hashes[:-1]).any():
+        raise Exception("词典中存在哈希冲突的词，无法编译")
+    frequencies = np.array([tokenizer.FREQ[keys[index]] for index in order], dtype='<i8')
+    log_frequencies = np.array([math.log(frequency or 1) for frequency in frequencies.tolist()], dtype='<f8')
+    force_split_bytes = '\n'.join(force_split).encode('utf-8')
+
+    digest = hashlib.sha1()
+    digest.update(hashes.astype('<u8').tobytes())
+    digest.update(frequencies.tobytes())
+    digest.update(force_split_bytes)
+
+    try:
+        directory = os.path.dirname(output_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temp_path = output_path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(_HEADER.pack(MAGIC, len(keys), tokenizer.total, max(map(len, keys), default=0),
+                                    len(force_split_bytes), digest.digest()[:16]))
+            file.write(hashes.astype('<u8').tobytes())
+            file.write(frequencies.tobytes())
+            file.write(log_frequencies.tobytes())
+            file.write(force_split_bytes)
+        os.replace(temp_path, output_path)
+    except Exception as e:
+        raise Exception(f"保存分词词典失败: {str(e)}")
+    return CompiledDictionary(output_path)
+
+
+class CompiledDictionary:
+    """
+    预编译、内存映射的分词词典，cut() 的结果与 jieba.cut(文本, cut_all=False) 相同
+    jieba 在每个分块上逐个位置查字典构建 DAG；这里把所有位置的候选词同时向后延长一个字符，
+    用 NumPy 在有序哈希表上二分查找，直到所有位置的前缀都不在词典中为止。
+    最大概率路径的动态规划、未登录词交给 jieba 的 HMM（finalseg）等步骤与 jieba 逐步相同
+    词典中只保存哈希：不在词典中的片段与某个词的64位哈希恰好相同的概率约为 键数/2^64，可以忽略
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise Exception(f"分词词典文件不存在: {path}")
+        try:
+            with open(path, 'rb') as file:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, key_count, total, max_length, force_split_size, version = _HEADER.unpack_from(self._mmap, 0)
+        except (OSError, ValueError, struct.error) as e:
+            raise Exception(f"加载分词词典失败: {str(e)}")
+        if magic != MAGIC:
+            raise Exception(f"不是有效的分词词典文件: {path}")
+
+        import numpy as np
+        self.path = path
+        self.total = total
+        self.max_length = max_length
+        self.version = version.hex()
+        self._log_total = math.log(total)
+        start = _HEADER.size
+        self._hashes = np.frombuffer(self._mmap, dtype='<u8', count=key_count, offset=start)
+        self._frequencies = np.frombuffer(self._mmap, dtype='<i8', count=key_count, offset=start + 8 * key_count)
+        self._log_frequencies = np.frombuffer(self._mmap, dtype='<f8', count=key_count,
+                                              offset=start + 16 * key_count)
+        start += 24 * key_count
+        self.force_split = self._mmap[start:start + force_split_size].decode('utf-8').split('\n') \
+            if force_split_size else []
+
+        from jieba import finalseg
+        for word in self.force_split:
+            finalseg.add_force_split(word)
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def _lookup(self, hashes):
+        """返回 (是否在词典中, 对应的表下标)"""
+        import numpy as np
+
+        positions = np.searchsorted(self._hashes, hashes)
+        np.minimum(positions, len(self._hashes) - 1, out=positions)
+        return self._hashes[positions] == hashes, positions
+
+    def frequency(self, word):
+        """词频（与 jieba 的 FREQ.get(word) 相同，前缀为0，不在词典中返回 None）"""
+        if not word or len(word) > self.max_length:
+            return None
+        found, positions = self._lookup(key_hashes([word]))
+        return int(self._frequencies[positions[0]]) if found[0] else None
+
+    def _candidates(self, codes, in_block):
+        """
+        所有位置的候选词（jieba 的 DAG），返回按起点排列的 (起点, 终点, log词频) 三个列表
+        起点处没有词频大于0的词时不产出，由调用方按 jieba 的规则补上单字
+        """
+        import numpy as np
+        from char_ngram import HASH_BASE, mix64
+
+        length = len(codes)
+        codes = codes.astype(np.uint64)
+        starts = np.flatnonzero(in_block)
+        polynomial = np.zeros(len(starts), dtype=np.uint64)
+        found_starts, found_ends, found_logs = [], [], []
+        for offset in range(self.max_length):
+            ends = starts + offset
+            # 片段延伸到分块之外时停止（对应 jieba 中 i < N）
+            valid = ends < length
+            valid[valid] = in_block[ends[valid]]
+            starts, ends, polynomial = starts[valid], ends[valid], polynomial[valid]
+            if not len(starts):
+                break
+            polynomial = polynomial * HASH_BASE + codes[ends]
+            found, positions = self._lookup(mix64(polynomial.copy()))
+            # 片段不在前缀词典中时，这个起点不再延长（对应 jieba 中 frag in FREQ）
+            starts, ends, polynomial, positions = starts[found], ends[found], polynomial[found], positions[found]
+            words = self._frequencies[positions] > 0
+            found_starts.append(starts[words])
+            found_ends.append(ends[words])
+            found_logs.append(self._log_frequencies[positions[words]])
+        if not found_starts:
+            return [], [], []
+        starts = np.concatenate(found_starts)
+        order = np.argsort(starts, kind='stable')
+        return (starts[order].tolist(), np.concatenate(found_ends)[order].tolist(),
+                np.concatenate(found_logs)[order].tolist())
+
+    def _route(self, sentence):
+        """
+        每个位置上最大概率路径的下一个词的终点（jieba 的 calc），分块之间互不影响
+        计算顺序、浮点运算顺序和并列时取较长词的规则都与 jieba 相同
+        """
+        from char_ngram import text_codes
+
+        codes = text_codes(sentence)
+        in_block = _is_block_char(codes)
+        starts, ends, logs = self._candidates(codes, in_block)
+        length = len(sentence)
+        log_total = self._log_total
+        values = [0.0] * (length + 1)
+        route = list(range(length))
+        cursor = len(starts) - 1
+        in_block = in_block.tolist()
+        for index in range(length - 1, -1, -1):
+            if not in_block[index]:
+                # 分块外的位置值为0，相当于 jieba 在每个分块末尾的 route[N] = (0, 0)
+                continue
+            best_value = None
+            best_end = index
+            while cursor >= 0 and starts[cursor] == index:
+                end = ends[cursor]
+                value = logs[cursor] - log_total + values[end + 1]
+                if best_value is None or value > best_value or (value == best_value and end > best_end):
+                    best_value, best_end = value, end
+                cursor -= 1
+            if best_value is None:
+                # 没有候选词时取单字，log(1) = 0
+                best_value = 0.0 - log_total + values[index + 1]
+            values[index] = best_value
+            route[index] = best_end
+        return route
+
+    def _cut_block(self, sentence, start, end, route):
+        """一个分块的精确模式分词（jieba 的 __cut_DAG），连续单字交给 HMM 识别未登录词"""
+        from jieba import finalseg
+
+        x = start
+        buffer = ''
+        while x < end:
+            y = route[x] + 1
+            word = sentence[x:y]
+            if y - x == 1:
+                buffer += word
+            else:
+                if buffer:
+                    yield from self._flush(buffer, finalseg)
+                    buffer = ''
+                yield word
+            x = y
+        if buffer:
+            yield from self._flush(buffer, finalseg)
+
+    def _flush(self, buffer, finalseg):
+        if len(buffer) == 1:
+            yield buffer
+        elif not self.frequency(buffer):
+            yield from finalseg.cut(buffer)
+        else:
+            yield from buffer
+
+    def cut(self, sentence):
+        """精确模式分词（带 HMM），产出与 jieba.cut(sentence, cut_all=False) 相同的词序列"""
+        import jieba
+
+        route = self._route(sentence)
+        position = 0
+        for match in jieba.re_han_default.finditer(sentence):
+            if match.start() > position:
+                yield from _cut_skip(sentence[position:match.start()])
+            yield from self._cut_block(sentence, match.start(), match.end(), route)
+            position = match.end()
+        if position < len(sentence):
+            yield from _cut_skip(sentence[position:])
+
+    def close(self):
+        """释放内存映射"""
+        self._hashes = self._frequencies = self._log_frequencies = None
+        self._mmap.close()
+
+
+def _cut_skip(text):
+    """分块之外的文本：空白整体产出，其余字符逐个产出（与 jieba 精确模式相同）"""
+    import jieba
+
+    for piece in jieba.re_skip_default.split(text):
+        if jieba.re_skip_default.match(piece):
+            yield piece
+        else:
+            yield from piece
+
+
+_dictionary = None
+
+
+def configure_segment_dictionary(path):
+    """
+    开启（path 为预编译词典文件）或关闭（path 为空）预编译分词词典，返回当前使用的词典对象
+    开启后 cut() 不再加载 jieba 的文本词典
+    """
+    global _dictionary
+    if _dictionary is not None and (not path or _dictionary.path != path):
+        _dictionary.close()
+        _dictionary = None
+    if path and _dictionary is None:
+        _dictionary = CompiledDictionary(path)
+    return _dictionary
+
+
+def active_dictionary():
+    return _dictionary
+
+
+def cut(text):
+    """精确模式分词：开启预编译词典时使用它，否则使用 jieba 默认词典"""
+    if _dictionary is not None:
+        return _dictionary.cut(text)
+    import jieba
+    return jieba.cut(text, cut_all=False)
+
+
+def initialize():
+    """预热当前使用的分词器（jieba 默认词典时构建前缀词典，预编译词典只需映射文件）"""
+    import jieba
+    jieba.setLogLevel(60)
+    if _dictionary is None:
+        jieba.initialize()
+
+
+def segdict_main(argv):
+    """
+    预编译分词词典子命令
+    python main.py segdict build 词典文件 [--user-dict 自定义词典 ...]
+    python main.py segdict verify 词典文件 论文文件或目录... [--user-dict 自定义词典 ...]
+    """
+    from main import collect_text_files, preprocess_text
+    from utils import read_file
+
+    parser = argparse.ArgumentParser(prog='main.py segdict', description='预编译分词词典')
+    actions = parser.add_subparsers(dest='action', required=True)
+
+    build_parser = actions.add_parser('build', help='编译 jieba 默认词典和自定义词典')
+    build_parser.add_argument('dictionary_file', help='输出的词典文件路径')
+    build_parser.add_argument('--user-dict', action='append', default=[],
+                              help='自定义词典（jieba 用户词典格式），可重复指定')
+
+    verify_parser = actions.add_parser('verify', help='检查分词结果与 jieba 是否一致')
+    verify_parser.add_argument('dictionary_file', help='词典文件路径')
+    verify_parser.add_argument('documents', nargs='+', help='论文文件或目录')
+    verify_parser.add_argument('--user-dict', action='append', default=[],
+                               help='编译时使用的自定义词典，先加载到 jieba 再比较')
+
+    try:
+        args = parser.parse_args(argv)
+        if args.action == 'build':
+            dictionary = build_segment_dictionary(args.dictionary_file, args.user_dict)
+            print(f"分词词典: {args.dictionary_file}，键数 {len(dictionary)}，总词频 {dictionary.total}，"
+                  f"版本 {dictionary.version}")
+            dictionary.close()
+        else:
+            # 与加载了同样自定义词典的 jieba 比较
+            import jieba
+            dictionary = CompiledDictionary(args.dictionary_file)
+            jieba.setLogLevel(60)
+            for path in args.user_dict:
+                jieba.load_userdict(path)
+            mismatches = 0
+            files = collect_text_files(args.documents)
+            for path in files:
+                text = preprocess_text(read_file(path))
+                if list(dictionary.cut(text)) != list(jieba.cut(text, cut_all=False)):
+                    mismatches += 1
+                    print(f"分词结果不一致: {path}")
+            dictionary.close()
+            print(f"检查 {len(files)} 篇论文，{mismatches} 篇不一致")
+            if mismatches:
+                sys.exit(1)
+    except Exception as e:
+        print(f"错误: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,342 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+
+# 默认的Unix套接字路径，客户端在未指定服务地址时会尝试连接它
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), 'paper_check.sock')
+
+# 单个请求/响应的最大长度（只传路径，1MB足够）
+MAX_MESSAGE_SIZE = 1024 * 1024
+
+
+class ServerUnavailable(Exception):
+    """查重服务未运行或无法连接"""
+
+
+class ConfigMismatch(ServerUnavailable):
+    """查重服务的打分配置与客户端不一致，客户端应在本进程内计算"""
+
+
+def parse_address(address):
+    """
+    解析服务地址
+    'http://127.0.0.1:8765' 或 '127.0.0.1:8765' 视为HTTP，其余视为Unix套接字路径
+    返回 ('http', (主机, 端口)) 或 ('unix', 路径)
+    """
+    if address.startswith('http://'):
+        address = address[len('http://'):].rstrip('/')
+        host, _, port = address.rpartition(':')
+        return 'http', (host or '127.0.0.1', int(port))
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and os.sep not in address:
+        return 'http', (host or '127.0.0.1', int(port))
+    return 'unix', address
+
+
+# --------------------------
+# 工作进程
+# --------------------------
+def _warm_up(cache_dir=None, idf_model=None, metrics_path=None, seg_dict=None):
+    """工作进程初始化：导入第三方库并触发 jieba 构建前缀词典（或映射预编译分词词典），映射语料IDF模型"""
+    import main
+    import seg_dict as segmenter
+    segmenter.configure_segment_dictionary(seg_dict)
+    segmenter.initialize()
+    main.configure_segment_cache(cache_dir)
+    # 模型文件以只读方式映射，各工作进程共享同一份页缓存
+    main.configure_idf_model(idf_model)
+    # 走一遍完整流程，让 sklearn / numpy 的惰性初始化都在这里完成
+    main.calculate_similarity("预热查重服务的文本内容", "预热查重服务的文本")
+    # 每个请求在工作进程中输出一条指标记录，预热产生的计时不计入
+    main.metrics.configure_metrics(metrics_path)
+
+
+def scoring_config(idf_model=None):
+    """
+    影响相似度结果的打分配置：分析器、分词词典版本和语料IDF模型文件
+    服务端在工作进程中计算一次，客户端随请求发送自己的配置，不一致时服务端拒绝计算
+    """
+    from result_cache import file_identity
+    from seg_cache import dictionary_version
+    return {
+        'analyzer': 'jieba',
+        'dictionary': dictionary_version(),
+        'idf_model': file_identity(idf_model) if idf_model else None,
+    }
+
+
+def check_paths(original_file, plagiarized_file):
+    """
+    读取两篇论文并计算相似度
+    服务端只读不写：结果文件由客户端自己写入，本机其他用户无法借服务进程写任意路径
+    """
+    import main
+    # 常驻进程中文件可能被修改，不使用按路径缓存的 cached_read_file
+    original_text = main.read_file(original_file)
+    plagiarized_text = main.read_file(plagiarized_file)
+    similarity = main.calculate_similarity(original_text, plagiarized_text)
+    main.metrics.emit('check', engine='tfidf', mode='server', similarity=similarity)
+    return similarity
+
+
+def _handle_request(pool, request, config=None):
+    """
+    校验请求并交给进程池执行，返回响应字典
+    请求带有客户端的打分配置且与服务端不一致时不计算，返回 mismatch 和服务端的配置
+    """
+    try:
+        if config is not None and request.get('config') is not None and request['config'] != config:
+            return {'error': '查重服务的打分配置与客户端不一致', 'mismatch': True, 'config': config}
+        if 'output_file' in request:
+            raise Exception("服务端不写入结果文件，请只提交两篇论文的路径，由客户端写入结果")
+        paths = [request.get(key) for key in ('original_file', 'plagiarized_file')]
+        if not all(isinstance(path, str) and path for path in paths):
+            raise Exception("必须提供两个论文路径参数")
+        for path in paths:
+            if not os.path.exists(path):
+                raise Exception(f"文件不存在: {path}")
+        similarity = pool.submit(check_paths, *paths).result()
+        return {'similarity': similarity, 'config': config}
+    except Exception as e:
+        return {'error': str(e)}
+
+
+# --------------------------
+# 服务端
+# --------------------------
+class _UnixRequestHandler(socketserver.StreamRequestHandler):
+    """Unix套接字协议：每行一个JSON请求，返回一行JSON响应"""
+
+    def handle(self):
+        for line in self.rfile:
+            if len(line) > MAX_MESSAGE_SIZE:
+                response = {'error': '请求过大'}
+            else:
+                try:
+                    response = _handle_request(self.server.pool, json.loads(line), self.server.config)
+                except ValueError:
+                    response = {'error': '请求格式错误'}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+def _make_http_handler():
+    """HTTP协议：POST /check 提交JSON请求，GET /health 检查服务状态并返回打分配置"""
+    from http.server import BaseHTTPRequestHandler
+
+    class HttpRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._reply(200, {'status': 'ok', 'config': self.server.config})
+            else:
+                self._reply(404, {'error': '未知路径'})
+
+        def do_POST(self):
+            if self.path != '/check':
+                self._reply(404, {'error': '未知路径'})
+                return
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > MAX_MESSAGE_SIZE:
+                self._reply(413, {'error': '请求过大'})
+                return
+            try:
+                request = json.loads(self.rfile.read(length))
+            except ValueError:
+                self._reply(400, {'error': '请求格式错误'})
+                return
+            response = _handle_request(self.server.pool, request, self.server.config)
+            if 'similarity' in response:
+                self._reply(200, response)
+            else:
+                self._reply(409 if response.get('mismatch') else 400, response)
+
+        def log_message(self, format, *args):
+            # 不向标准错误输出访问日志
+            pass
+
+    return HttpRequestHandler
+
+
+def create_server(address, pool, config=None):
+    """
+    按地址类型创建多线程服务端，请求线程把计算交给进程池
+    config 为工作进程的打分配置（scoring_config 的结果），为 None 时不检查客户端的配置
+    """
+    kind, target = parse_address(address)
+    if kind == 'http':
+        from http.server import ThreadingHTTPServer
+        server = ThreadingHTTPServer(target, _make_http_handler())
+    else:
+        if not hasattr(socket, 'AF_UNIX'):
+            raise Exception("当前系统不支持Unix套接字，请改用 --address 主机:端口")
+        if os.path.exists(target):
+            # 清理上次异常退出遗留的套接字文件，但不抢占仍在运行的服务
+            if is_running(target):
+                raise Exception(f"查重服务已在运行: {target}")
+            os.remove(target)
+        server = socketserver.ThreadingUnixStreamServer(target, _UnixRequestHandler)
+    server.daemon_threads = True
+    server.pool = pool
+    server.config = config
+    return server
+
+
+def serve(address=DEFAULT_SOCKET, workers=None, cache_dir=None, ready=None, idf_model=None, metrics_path=None,
+          seg_dict=None):
+    """
+    启动常驻查重服务
+    预先在每个工作进程中加载 jieba / sklearn 并预热，之后的请求不再付出启动开销
+    ready 为可调用对象时，服务就绪后调用一次（便于测试和嵌入）
+    idf_model 为语料IDF模型文件路径，指定后所有请求都用该模型打分
+    metrics_path 为指标 JSON 行输出文件，每个请求由处理它的工作进程追加一条记录
+    seg_dict 为预编译分词词典文件路径，各工作进程映射同一个文件
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_warm_up, initargs=(cache_dir, idf_model, metrics_path, seg_dict))
+    # 提前拉起全部工作进程，完成预热后再开始接受请求
+    for future in [pool.submit(os.getpid) for _ in range(workers)]:
+        future.result()
+    # 打分配置以工作进程实际加载的词典和模型为准
+    config = pool.submit(scoring_config, idf_model).result()
+
+    server = create_server(address, pool, config)
+    try:
+        if ready is not None:
+            ready()
+        server.serve_forever()
+    finally:
+        server.server_close()
+        pool.shutdown()
+        kind, target = parse_address(address)
+        if kind == 'unix' and os.path.exists(target):
+            os.remove(target)
+    return server
+
+
+# --------------------------
+# 客户端
+# --------------------------
+def _send_unix(path, request, timeout):
+    """通过Unix套接字发送一条请求"""
+    if not hasattr(socket, 'AF_UNIX'):
+        raise ServerUnavailable("当前系统不支持Unix套接字")
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(path)
+            client.sendall(json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n')
+            with client.makefile('rb') as reader:
+                line = reader.readline(MAX_MESSAGE_SIZE)
+    except OSError as e:
+        raise ServerUnavailable(f"无法连接查重服务: {path} ({str(e)})")
+    if not line:
+        raise ServerUnavailable(f"查重服务无响应: {path}")
+    return json.loads(line)
+
+
+def _send_http(target, request, timeout):
+    """通过本机HTTP发送一条请求"""
+    import http.client
+    connection = http.client.HTTPConnection(*target, timeout=timeout)
+    try:
+        body = json.dumps(request, ensure_ascii=False).encode('utf-8')
+        connection.request('POST', '/check', body, {'Content-Type': 'application/json'})
+        return json.loads(connection.getresponse().read())
+    except OSError as e:
+        raise ServerUnavailable(f"无法连接查重服务: {target[0]}:{target[1]} ({str(e)})")
+    finally:
+        connection.close()
+
+
+def is_running(address=DEFAULT_SOCKET, timeout=1.0):
+    """检查查重服务是否在运行"""
+    kind, target = parse_address(address)
+    if kind == 'unix':
+        if not os.path.exists(target):
+            return False
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.settimeout(timeout)
+                client.connect(target)
+            return True
+        except OSError:
+            return False
+    try:
+        with socket.create_connection(target, timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def forward_check(address, original_file, plagiarized_file, timeout=600.0, config=None):
+    """
+    把查重请求转发给常驻服务
+    路径统一转换为绝对路径，由服务端读取论文并返回相似度，结果文件由调用方写入
+    config 为客户端的打分配置（scoring_config 的结果），服务端的配置与之不同时抛出 ConfigMismatch
+    连接失败抛出 ServerUnavailable，服务端报错抛出 Exception
+    """
+    request = {
+        'original_file': os.path.abspath(original_file),
+        'plagiarized_file': os.path.abspath(plagiarized_file),
+    }
+    if config is not None:
+        request['config'] = config
+    kind, target = parse_address(address)
+    if kind == 'unix':
+        response = _send_unix(target, request, timeout)
+    else:
+        response = _send_http(target, request, timeout)
+    if response.get('mismatch'):
+        raise ConfigMismatch(response['error'])
+    if 'error' in response:
+        raise Exception(response['error'])
+    if config is not None and response.get('config') != config:
+        # 不检查配置的旧版服务：不能确认结果与本地计算一致，由调用方重新计算
+        raise ConfigMismatch("查重服务未返回打分配置")
+    return response['similarity']
+
+
+def serve_main(argv):
+    """
+    常驻服务子命令
+    python main.py serve [--address 套接字路径或 主机:端口] [--workers N]
+    """
+    parser = argparse.ArgumentParser(prog='main.py serve', description='常驻查重服务')
+    parser.add_argument('--address', default=DEFAULT_SOCKET,
+                        help=f'Unix套接字路径或本机HTTP地址（如 127.0.0.1:8765），默认 {DEFAULT_SOCKET}')
+    parser.add_argument('--workers', type=int, default=None, help='工作进程数，默认等于CPU核数')
+    parser.add_argument('--cache-dir', default=os.environ.get('PAPER_CHECK_CACHE_DIR'),
+                        help='磁盘分词缓存目录，默认读取环境变量 PAPER_CHECK_CACHE_DIR')
+    parser.add_argument('--idf-model', default=os.environ.get('PAPER_CHECK_IDF_MODEL'),
+                        help='语料IDF模型文件，默认读取环境变量 PAPER_CHECK_IDF_MODEL')
+    parser.add_argument('--seg-dict', default=os.environ.get('PAPER_CHECK_SEG_DICT'),
+                        help='预编译分词词典文件，默认读取环境变量 PAPER_CHECK_SEG_DICT')
+    parser.add_argument('--metrics', default=os.environ.get('PAPER_CHECK_METRICS'),
+                        help="分阶段指标的 JSON 行输出文件（'-' 为标准错误），默认读取环境变量 PAPER_CHECK_METRICS")
+
+    try:
+        args = parser.parse_args(argv)
+        print(f"查重服务启动中: {args.address}")
+        serve(args.address, args.workers, args.cache_dir, ready=lambda: print("查重服务已就绪"),
+              idf_model=args.idf_model, metrics_path=args.metrics, seg_dict=args.seg_dict)
+    except KeyboardInterrupt:
+        print("查重服务已停止")
+    except Exception as e:
+        print(f"错误: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,323 @@
+import argparse
+import hashlib
+import heapq
+import json
+import math
+import os
+import socket
+import socketserver
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from server import ServerUnavailable, is_running, parse_address
+
+# 分片检索：每个分片是一个语料库目录（python main.py corpus add 建立），由独立的进程加载并监听本机套接字
+# 协调端把查询分发给所有分片，再合并各分片的前K个结果
+#
+# IDF 在所有分片的文档上统一计算：idf = ln((1 + 总文档数) / (1 + 总文档频率)) + 1（与 TfidfVectorizer 相同）
+# 分片集合变化后，协调端重新汇总各分片的文档频率并下发给每个分片，分片据此重新计算文档向量；
+# 分片自身的数据不需要重建。查询向量也用同一套IDF加权，因此各分片的得分可以直接比较
+
+# 协议：每行一个JSON请求，返回一行JSON响应（与常驻查重服务相同），消息中可能包含整个分片的词表，不限制长度
+
+
+# --------------------------
+# 分片端
+# --------------------------
+class ShardIndex:
+    """
+    一个分片的检索状态：词频矩阵常驻本进程内存，文档向量按协调端下发的全局IDF计算
+    文档向量在 configure 时整体替换，查询期间不加锁
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.doc_ids = store.doc_ids()
+        self.terms = store.vocabulary.terms
+        self.term_ids = {term: term_id for term_id, term in enumerate(self.terms)}
+        self.counts = store.count_matrix().tocsr()
+        self.document_frequencies = store.document_frequencies()
+        self._state = (None, None)
+        self._lock = threading.Lock()
+
+    def info(self):
+        """分片的规模标识，文档或词表变化后随之变化"""
+        return {'documents': len(self.doc_ids), 'generation': f"{len(self.doc_ids)}:{len(self.terms)}"}
+
+    def frequencies(self, terms):
+        """指定词在本分片中的文档频率"""
+        return {'documents': len(self.doc_ids),
+                'df': [int(self.document_frequencies[self.term_ids[term]]) if term in self.term_ids else 0
+                       for term in terms]}
+
+    def stats(self):
+        """本分片的完整词表和文档频率，供协调端汇总全局IDF"""
+        return {'documents': len(self.doc_ids), 'terms': self.terms,
+                'df': self.document_frequencies.tolist()}
+
+    def configure(self, version, documents, document_frequencies):
+        """按全局文档数和文档频率（与本分片词表对齐）计算L2归一化的TF-IDF文档向量，按列存储"""
+        import numpy as np
+        from sklearn.preprocessing import normalize
+
+        frequencies = np.asarray(document_frequencies, dtype=np.float64)
+        if len(frequencies) != len(self.terms):
+            raise Exception("文档频率与分片词表长度不一致")
+        idf = np.log((1 + documents) / (1 + frequencies)) + 1
+        weights = normalize(self.counts.astype(np.float64).multiply(idf).tocsr()).tocsc()
+        with self._lock:
+            self._state = (version, weights)
+
+    def search(self, version, query, top_k):
+        """
+        query 为 {词: 已归一化的查询权重}，返回本分片前 top_k 篇 [(文档编号, 得分)]
+        分片的全局IDF版本与协调端不一致时返回 None
+        """
+        import numpy as np
+
+        configured, weights = self._state
+        if configured != version:
+            return None
+        columns = [self.term_ids[term] for term in query if term in self.term_ids]
+        if not columns or top_k <= 0:
+            return []
+        values = np.array([query[self.terms[column]] for column in columns])
+        scores = weights[:, columns] @ values
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        return [(self.doc_ids[index], float(scores[index])) for index in candidates.tolist()]
+
+
+def _handle_shard_request(shard, request):
+    try:
+        operation = request.get('op')
+        if operation == 'info':
+            return shard.info()
+        if operation == 'df':
+            return shard.frequencies(request['terms'])
+        if operation == 'stats':
+            return shard.stats()
+        if operation == 'configure':
+            shard.configure(request['version'], request['documents'], request['df'])
+            return {'ok': True}
+        if operation == 'search':
+            results = shard.search(request['version'], request['query'], request['top_k'])
+            return {'stale': True} if results is None else {'results': results}
+        raise Exception(f"未知请求: {operation}")
+    except Exception as e:
+        return {'error': str(e)}
+
+
+class _ShardRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = _handle_shard_request(self.server.shard, json.loads(line))
+            except ValueError:
+                response = {'error': '请求格式错误'}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+
+
+def create_shard_server(address, shard):
+    """为分片创建多线程服务端：Unix套接字路径，或 主机:端口 的本机TCP"""
+    kind, target = parse_address(address)
+    if kind == 'unix':
+        if not hasattr(socket, 'AF_UNIX'):
+            raise Exception("当前系统不支持Unix套接字，请改用 --address 主机:端口")
+        if os.path.exists(target):
+            if is_running(target):
+                raise Exception(f"分片服务已在运行: {target}")
+            os.remove(target)
+        server = socketserver.ThreadingUnixStreamServer(target, _ShardRequestHandler)
+    else:
+        server = _ThreadingTCPServer(target, _ShardRequestHandler)
+    server.daemon_threads = True
+    server.shard = shard
+    return server
+
+
+def serve_shard(directory, address, ready=None):
+    """加载分片语料库并开始服务，ready 为可调用对象时就绪后调用一次"""
+    from corpus_store import CorpusStore
+
+    if not os.path.exists(os.path.join(directory, 'corpus.db')):
+        raise Exception(f"语料库不存在: {directory}")
+    store = CorpusStore(directory)
+    server = create_shard_server(address, ShardIndex(store))
+    try:
+        if ready is not None:
+            ready()
+        server.serve_forever()
+    finally:
+        server.server_close()
+        store.close()
+        kind, target = parse_address(address)
+        if kind == 'unix' and os.path.exists(target):
+            os.remove(target)
+
+
+# --------------------------
+# 协调端
+# --------------------------
+def _request(address, message, timeout=600.0):
+    """向分片发送一条请求并读取响应；连接失败抛出 ServerUnavailable，分片报错抛出 Exception"""
+    kind, target = parse_address(address)
+    try:
+        if kind == 'unix':
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.settimeout(timeout)
+            client.connect(target)
+        else:
+            client = socket.create_connection(target, timeout=timeout)
+        with client:
+            client.sendall(json.dumps(message, ensure_ascii=False).encode('utf-8') + b'\n')
+            with client.makefile('rb') as reader:
+                line = reader.readline()
+    except OSError as e:
+        raise ServerUnavailable(f"无法连接分片: {address} ({str(e)})")
+    if not line:
+        raise ServerUnavailable(f"分片无响应: {address}")
+    response = json.loads(line)
+    if 'error' in response:
+        raise Exception(f"分片 {address} 出错: {response['error']}")
+    return response
+
+
+class ShardCoordinator:
+    """
+    分片检索协调端：并发向各分片发送请求，合并前K个结果
+    分片可随时加入或移除；分片集合或分片规模变化后，第一次查询时重新汇总全局文档频率并下发
+    """
+
+    def __init__(self, addresses, timeout=600.0):
+        self.addresses = list(dict.fromkeys(addresses))
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max(len(self.addresses), 1))
+
+    def close(self):
+        self._pool.shutdown()
+
+    def add_shard(self, address):
+        if address not in self.addresses:
+            self.addresses.append(address)
+            self._resize_pool()
+
+    def remove_shard(self, address):
+        if address in self.addresses:
+            self.addresses.remove(address)
+            self._resize_pool()
+
+    def _resize_pool(self):
+        self._pool.shutdown()
+        self._pool = ThreadPoolExecutor(max_workers=max(len(self.addresses), 1))
+
+    def _broadcast(self, messages):
+        """messages 为 {地址: 请求}，并发发送，返回 {地址: 响应}"""
+        futures = {address: self._pool.submit(_request, address, message, self.timeout)
+                   for address, message in messages.items()}
+        return {address: future.result() for address, future in futures.items()}
+
+    def _version(self):
+        """全局IDF版本：由分片地址和各分片的规模标识决定"""
+        infos = self._broadcast({address: {'op': 'info'} for address in self.addresses})
+        identity = json.dumps([[address, infos[address]['generation']] for address in sorted(self.addresses)])
+        return hashlib.sha1(identity.encode('utf-8')).hexdigest()[:16]
+
+    def configure(self, version=None):
+        """汇总所有分片的文档频率，按各分片词表对齐后下发，返回全局IDF版本"""
+        version = version or self._version()
+        stats = self._broadcast({address: {'op': 'stats'} for address in self.addresses})
+        documents = sum(entry['documents'] for entry in stats.values())
+        frequencies = {}
+        for entry in stats.values():
+            for term, frequency in zip(entry['terms'], entry['df']):
+                frequencies[term] = frequencies.get(term, 0) + frequency
+        self._broadcast({address: {'op': 'configure', 'version': version, 'documents': documents,
+                                   'df': [frequencies[term] for term in entry['terms']]}
+                         for address, entry in stats.items()})
+        return version
+
+    def search(self, text, top_k=10):
+        """
+        查询与 text 最相似的前 top_k 篇文档，返回 [(文档编号, 相似度)]，按相似度从高到低排列
+        相似度为全部分片统一IDF下的TF-IDF余弦，保留两位小数；查询文本不计入文档频率
+        """
+        from inverted_index import document_terms
+
+        if not self.addresses:
+            raise Exception("没有可用的分片")
+        query = document_terms(text)
+        if not query or top_k <= 0:
+            return []
+
+        version = self._version()
+        terms = list(query)
+        responses = self._broadcast({address: {'op': 'df', 'terms': terms} for address in self.addresses})
+        documents = sum(response['documents'] for response in responses.values())
+        frequencies = [sum(response['df'][index] for response in responses.values()) for index in range(len(terms))]
+        # 与 transform 相同，没有出现在任何分片中的词不计入查询向量
+        weights = {term: query[term] * (math.log((1 + documents) / (1 + frequency)) + 1)
+                   for term, frequency in zip(terms, frequencies) if frequency > 0}
+        if not weights:
+            return []
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        request = {'op': 'search', 'version': version, 'top_k': top_k,
+                   'query': {term: weight / norm for term, weight in weights.items()}}
+
+        results = self._broadcast({address: request for address in self.addresses})
+        if any('stale' in response for response in results.values()):
+            self.configure(version)
+            results = self._broadcast({address: request for address in self.addresses})
+            if any('stale' in response for response in results.values()):
+                raise Exception("分片在查询期间发生变化，请重试")
+
+        merged = heapq.nsmallest(top_k, (item for response in results.values() for item in response['results']),
+                                 key=lambda item: (-item[1], item[0]))
+        return [(doc_id, round(min(score, 1.0), 2)) for doc_id, score in merged]
+
+
+def shard_main(argv):
+    """
+    分片检索子命令
+    python main.py shard serve 语料库目录 --address 套接字路径或 主机:端口
+    python main.py shard query 待检测论文 --shards 地址1,地址2... [--top-k N]
+    """
+    parser = argparse.ArgumentParser(prog='main.py shard', description='分片检索：多进程分片 + 前K合并')
+    actions = parser.add_subparsers(dest='action', required=True)
+
+    serve_parser = actions.add_parser('serve', help='加载一个分片（语料库目录）并监听本机套接字')
+    serve_parser.add_argument('corpus_dir', help='语料库目录（python main.py corpus add 建立）')
+    serve_parser.add_argument('--address', required=True, help='Unix套接字路径或本机TCP地址（如 127.0.0.1:9001）')
+
+    query_parser = actions.add_parser('query', help='向所有分片查询最相似的论文')
+    query_parser.add_argument('query_file', help='待检测论文路径')
+    query_parser.add_argument('--shards', required=True, help='逗号分隔的分片地址')
+    query_parser.add_argument('--top-k', type=int, default=10, help='输出前K篇')
+
+    try:
+        args = parser.parse_args(argv)
+        if args.action == 'serve':
+            print(f"分片服务启动中: {args.address}")
+            serve_shard(args.corpus_dir, args.address, ready=lambda: print("分片服务已就绪", flush=True))
+        else:
+            from utils import read_file
+            addresses = [address.strip() for address in args.shards.split(',') if address.strip()]
+            coordinator = ShardCoordinator(addresses)
+            try:
+                for doc_id, similarity in coordinator.search(read_file(args.query_file), args.top_k):
+                    print(f"{similarity:.2f}\t{doc_id}")
+            finally:
+                coordinator.close()
+    except KeyboardInterrupt:
+        print("分片服务已停止")
+    except Exception as e:
+        print(f"错误: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,302 @@
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+import numpy as np
+
+from lsh_index import _token_hashes
+from main import collect_text_files, preprocess_text, segment_text
+from utils import read_file
+from vocabulary import DEFAULT_MIN_TERM_LENGTH
+
+FINGERPRINT_BITS = 64
+
+# 默认判定为近似重复的最大汉明距离
+DEFAULT_MAX_DISTANCE = 3
+
+# 每次参与向量化运算的词数，限制 (词数 × 64) 中间矩阵的内存占用
+TERM_BLOCK = 65536
+
+# 建库时每批计算指纹的文档数：只有这一批文档的词频同时留在内存中
+BUILD_BATCH = 1000
+
+_BIT_POSITIONS = np.arange(FINGERPRINT_BITS, dtype=np.uint64)
+
+
+def document_terms(text):
+    """与 calculate_similarity 相同的预处理、分词和计词规则，返回 {词: 词频}"""
+    processed = preprocess_text(text)
+    words = segment_text(processed) if processed else []
+    return Counter(word.lower() for word in words if len(word) >= DEFAULT_MIN_TERM_LENGTH)
+
+
+def fingerprints(term_counts):
+    """
+    批量计算 SimHash 指纹（uint64 数组）
+    term_counts 为每篇文档的 {词: 词频}；每个词的64位哈希按位展开为 ±1，乘词频后按文档累加，
+    各位之和为正则该位置1。所有文档的词拼接后分块做向量化运算，相同的词只哈希一次
+    没有词的文档指纹为0
+    """
+    term_counts = list(term_counts)
+    result = np.zeros(len(term_counts), dtype=np.uint64)
+
+    terms = {}
+    owners, term_indices, weights = [], [], []
+    for document, counts in enumerate(term_counts):
+        for term, count in counts.items():
+            owners.append(document)
+            term_indices.append(terms.setdefault(term, len(terms)))
+            weights.append(count)
+    if not owners:
+        return result
+
+    hashes = _token_hashes(list(terms))[np.array(term_indices, dtype=np.int64)]
+    owners = np.array(owners, dtype=np.int64)
+    weights = np.array(weights, dtype=np.float64)
+    totals = np.zeros((len(term_counts), FINGERPRINT_BITS), dtype=np.float64)
+    for start in range(0, len(hashes), TERM_BLOCK):
+        block = slice(start, start + TERM_BLOCK)
+        bits = ((hashes[block, None] >> _BIT_POSITIONS) & np.uint64(1)).astype(np.float64)
+        contributions = (bits * 2 - 1) * weights[block, None]
+        # 词按文档顺序排列，同一文档的词相邻，用 reduceat 按文档求和
+        block_owners = owners[block]
+        starts = np.flatnonzero(np.r_[True, block_owners[1:] != block_owners[:-1]])
+        totals[block_owners[starts]] += np.add.reduceat(contributions, starts, axis=0)
+
+    set_bits = (totals > 0).astype(np.uint64) << _BIT_POSITIONS
+    return np.bitwise_or.reduce(set_bits, axis=1)
+
+
+def fingerprint(text):
+    """单篇文档的 SimHash 指纹"""
+    return int(fingerprints([document_terms(text)])[0])
+
+
+def hamming_distance(left, right):
+    """两个（或两组）指纹之间的汉明距离"""
+    return np.bitwise_count(np.bitwise_xor(np.asarray(left, dtype=np.uint64), np.asarray(right, dtype=np.uint64)))
+
+
+def _blocks(max_distance):
+    """
+    把64位分成 max_distance + 1 段，返回每段的 (右移位数, 掩码)
+    抽屉原理：汉明距离不超过 max_distance 的两个指纹至少有一段完全相同
+    """
+    count = max_distance + 1
+    if not 1 <= count <= FINGERPRINT_BITS:
+        raise Exception(f"无效的汉明距离阈值: {max_distance}")
+    sizes = [FINGERPRINT_BITS // count + (1 if index < FINGERPRINT_BITS % count else 0) for index in range(count)]
+    blocks, shift = [], 0
+    for size in sizes:
+        blocks.append((np.uint64(shift), np.uint64((1 << size) - 1)))
+        shift += size
+    return blocks
+
+
+class SimHashStore:
+    """
+    SimHash 指纹库：指纹保存为 uint64 数组，每篇文档只占8字节
+    近似重复查找用分段置换表：每段各按段值排序一次，段值相同的指纹才比较汉明距离，
+    不做全量两两比较
+    """
+
+    def __init__(self):
+        self.doc_ids = []
+        self._id_set = set()
+        self._chunks = []
+        self._fingerprints = np.empty(0, dtype=np.uint64)
+        self._tables = {}
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @property
+    def fingerprints(self):
+        if self._chunks:
+            self._fingerprints = np.concatenate([self._fingerprints] + self._chunks)
+            self._chunks = []
+        return self._fingerprints
+
+    def add_many(self, doc_ids, values):
+        """追加一批文档指纹，已存在的文档编号会被忽略，返回新增数量"""
+        keep = []
+        for index, doc_id in enumerate(doc_ids):
+            if doc_id not in self._id_set:
+                self._id_set.add(doc_id)
+                self.doc_ids.append(doc_id)
+                keep.append(index)
+        if keep:
+            self._chunks.append(np.asarray(values, dtype=np.uint64)[keep])
+            self._tables = {}
+        return len(keep)
+
+    def add(self, doc_id, text):
+        return self.add_many([doc_id], [fingerprint(text)]) == 1
+
+    def add_files(self, paths, batch_size=BUILD_BATCH):
+        """
+        按批读取、分词并计算论文文件的指纹，以文件路径为文档编号追加到库中，返回新增数量
+        已收录的文件不再读取；每批算完即加入指纹库，内存占用与文件总数无关
+        """
+        added = 0
+        batch = []
+        for path in paths:
+            if path in self._id_set:
+                continue
+            batch.append(path)
+            if len(batch) >= batch_size:
+                added += self.add_many(batch, fingerprints(document_terms(read_file(item)) for item in batch))
+                batch = []
+        if batch:
+            added += self.add_many(batch, fingerprints(document_terms(read_file(item)) for item in batch))
+        return added
+
+    def _sorted_tables(self, max_distance):
+        """
+        每段一张置换表：(右移位数, 掩码, 排序后的段值, 对应的文档下标)，指纹库变化前重复使用
+        没有词的文档（指纹为0）在每段都会互相命中，不放入置换表
+        """
+        tables = self._tables.get(max_distance)
+        if tables is None:
+            values = self.fingerprints
+            valid = np.flatnonzero(values != 0)
+            tables = []
+            for shift, mask in _blocks(max_distance):
+                keys = (values[valid] >> shift) & mask
+                order = np.argsort(keys, kind='stable')
+                tables.append((shift, mask, keys[order], valid[order]))
+            self._tables[max_distance] = tables
+        return tables
+
+    def query(self, value, max_distance=DEFAULT_MAX_DISTANCE):
+        """
+        查找与指纹 value 的汉明距离不超过 max_distance 的文档，返回 [(文档编号, 距离)]，按距离排列
+        每段在置换表中二分查找段值相同的区间，只对这些候选计算汉明距离
+        没有词的文档（指纹为0）既不作为查询也不作为结果，与 near_duplicates 一致
+        """
+        values = self.fingerprints
+        value = np.uint64(value)
+        if value == 0:
+            return []
+        candidates = set()
+        for shift, mask, keys, order in self._sorted_tables(max_distance):
+            key = (value >> shift) & mask
+            start, end = np.searchsorted(keys, key, side='left'), np.searchsorted(keys, key, side='right')
+            candidates.update(order[start:end].tolist())
+        if not candidates:
+            return []
+        indices = np.fromiter(candidates, dtype=np.int64)
+        distances = hamming_distance(values[indices], value)
+        order = np.lexsort((indices, distances))
+        return [(self.doc_ids[indices[i]], int(distances[i])) for i in order if distances[i] <= max_distance]
+
+    def near_duplicates(self, max_distance=DEFAULT_MAX_DISTANCE):
+        """
+        找出库中所有汉明距离不超过 max_distance 的文档对
+        返回 [(文档编号1, 文档编号2, 距离)]；没有词的文档（指纹为0）不参与比较
+        """
+        values = self.fingerprints
+        valid = np.flatnonzero(values != 0)
+        blocks = _blocks(max_distance)
+        found = []
+        for block_index, (shift, mask) in enumerate(blocks):
+            keys = (values[valid] >> shift) & mask
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+            sorted_indices = valid[order]
+            # 段值相同的指纹在排序后相邻：依次比较相隔 offset 个位置的指纹，直到不再有相同段值
+            offset = 1
+            while offset < len(sorted_keys):
+                same = np.flatnonzero(sorted_keys[offset:] == sorted_keys[:-offset])
+                if len(same) == 0:
+                    break
+                left = sorted_indices[same]
+                right = sorted_indices[same + offset]
+                xor = values[left] ^ values[right]
+                distances = np.bitwise_count(xor)
+                close = distances <= max_distance
+                # 同一对可能在多段相同，只在第一个相同的段里记录
+                for earlier_shift, earlier_mask in blocks[:block_index]:
+                    close &= ((xor >> earlier_shift) & earlier_mask) != 0
+                first, second = np.minimum(left, right)[close], np.maximum(left, right)[close]
+                found.append(np.stack([first, second, distances[close].astype(np.int64)], axis=1))
+                offset += 1
+
+        if not found:
+            return []
+        pairs = np.concatenate(found)
+        pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0], pairs[:, 2]))]
+        return [(self.doc_ids[first], self.doc_ids[second], int(distance)) for first, second, distance in pairs]
+
+    def save(self, file_path):
+        """保存指纹库：指纹数组 + 文档编号"""
+        try:
+            directory = os.path.dirname(file_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(file_path, 'wb') as file:
+                np.savez(file,
+                         fingerprints=self.fingerprints,
+                         doc_ids=np.array(json.dumps(self.doc_ids, ensure_ascii=False)))
+        except Exception as e:
+            raise Exception(f"保存指纹库失败: {str(e)}")
+
+    @classmethod
+    def load(cls, file_path):
+        """加载指纹库"""
+        if not os.path.exists(file_path):
+            raise Exception(f"指纹库文件不存在: {file_path}")
+        try:
+            with np.load(file_path, allow_pickle=False) as data:
+                doc_ids = json.loads(str(data['doc_ids']))
+                values = data['fingerprints']
+        except Exception as e:
+            raise Exception(f"加载指纹库失败: {str(e)}")
+        store = cls()
+        store.add_many(doc_ids, values)
+        return store
+
+
+def simhash_main(argv):
+    """
+    SimHash 子命令
+    python main.py simhash build 指纹库文件 论文文件或目录...
+    python main.py simhash pairs 指纹库文件 [--distance 3]
+    python main.py simhash query 指纹库文件 待检测论文 [--distance 3]
+    """
+    parser = argparse.ArgumentParser(prog='main.py simhash', description='SimHash 近似重复筛查')
+    actions = parser.add_subparsers(dest='action', required=True)
+
+    build_parser = actions.add_parser('build', help='计算指纹并建立或追加指纹库')
+    build_parser.add_argument('store_file', help='指纹库文件路径（.npz）')
+    build_parser.add_argument('documents', nargs='+', help='论文文件或目录')
+
+    pairs_parser = actions.add_parser('pairs', help='列出库中所有近似重复的文档对')
+    pairs_parser.add_argument('store_file', help='指纹库文件路径（.npz）')
+    pairs_parser.add_argument('--distance', type=int, default=DEFAULT_MAX_DISTANCE, help='汉明距离阈值')
+
+    query_parser = actions.add_parser('query', help='查找与待检测论文近似重复的文档')
+    query_parser.add_argument('store_file', help='指纹库文件路径（.npz）')
+    query_parser.add_argument('query_file', help='待检测论文路径')
+    query_parser.add_argument('--distance', type=int, default=DEFAULT_MAX_DISTANCE, help='汉明距离阈值')
+
+    try:
+        args = parser.parse_args(argv)
+        if args.action == 'build':
+            store = SimHashStore.load(args.store_file) if os.path.exists(args.store_file) else SimHashStore()
+            added = store.add_files(os.path.abspath(path) for path in collect_text_files(args.documents))
+            store.save(args.store_file)
+            print(f"指纹库更新完成，新增 {added} 篇，共 {len(store)} 篇")
+        elif args.action == 'pairs':
+            store = SimHashStore.load(args.store_file)
+            for first, second, distance in store.near_duplicates(args.distance):
+                print(f"{distance}\t{first}\t{second}")
+        else:
+            store = SimHashStore.load(args.store_file)
+            for doc_id, distance in store.query(fingerprint(read_file(args.query_file)), args.distance):
+                print(f"{distance}\t{doc_id}")
+    except Exception as e:
+        print(f"错误: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+from array import array
+
+import metrics
+
+# 词编号和词频在内存中的类型码（与写入临时文件的格式相同）
+_INDEX_TYPECODE = 'i'
+_COUNT_TYPECODE = 'q'
+
+
+class SpilledCounts:
+    """
+    按文档逐行追加的词频（CSR 的一行：{词编号: 词频}）
+    内存紧张时调用 spill() 把尚未落盘的行写入临时文件并释放，matrix() 以内存映射方式拼成词频矩阵，
+    所有文档的词频不需要同时放在内存里
+    """
+
+    def __init__(self, directory=None):
+        self.directory = tempfile.mkdtemp(prefix='paper_check_spill_', dir=directory)
+        self._indices = array(_INDEX_TYPECODE)
+        self._counts = array(_COUNT_TYPECODE)
+        # 每行的非零元个数，文档数远小于词频条目数，始终留在内存中
+        self._lengths = []
+        self.spilled = 0
+        self.spills = 0
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def pending_bytes(self):
+        """尚未落盘的词频占用的字节数"""
+        return self._indices.itemsize * len(self._indices) + self._counts.itemsize * len(self._counts)
+
+    def append(self, counts):
+        """追加一篇文档的 {词编号: 词频}"""
+        # 行内按词编号排序写入，拼成的矩阵已是规范格式，scipy 不需要在（只读映射的）数组上原地排序
+        term_ids = sorted(counts)
+        self._indices.extend(term_ids)
+        self._counts.extend(counts[term_id] for term_id in term_ids)
+        self._lengths.append(len(counts))
+
+    def spill(self):
+        """把尚未落盘的词频追加写入临时文件"""
+        if not self._indices:
+            return
+        with metrics.stage('spill') as sizes:
+            sizes['bytes'] = self.pending_bytes()
+            for name, values in (('indices', self._indices), ('counts', self._counts)):
+                with open(os.path.join(self.directory, name), 'ab') as file:
+                    values.tofile(file)
+            self.spilled += len(self._indices)
+            self.spills += 1
+            self._indices = array(_INDEX_TYPECODE)
+            self._counts = array(_COUNT_TYPECODE)
+
+    def matrix(self, columns):
+        """
+        词频矩阵（CSR，文档 × columns）
+        发生过落盘时，词编号和词频数组直接映射临时文件，不读入内存
+        """
+        import numpy as np
+        from scipy.sparse import csr_matrix
+
+        indptr = np.zeros(len(self._lengths) + 1, dtype=np.int64)
+        np.cumsum(self._lengths, out=indptr[1:])
+        if self.spilled:
+            self.spill()
+            indices = np.memmap(os.path.join(self.directory, 'indices'), dtype=np.intc, mode='r')
+            data = np.memmap(os.path.join(self.directory, 'counts'), dtype=np.longlong, mode='r')
+        else:
+            indices = np.frombuffer(self._indices, dtype=np.intc)
+            data = np.frombuffer(self._counts, dtype=np.longlong)
+        if indptr[-1] < np.iinfo(np.int32).max:
+            # 索引类型一致时 scipy 不再复制词编号数组
+            indptr = indptr.astype(np.int32)
+        counts = csr_matrix((data, indices, indptr), shape=(len(self._lengths), columns))
+        counts.has_sorted_indices = True
+        counts.has_canonical_format = True
+        return counts
+
+    def close(self):
+        """删除临时文件（已映射的数组在 POSIX 系统上仍可继续使用）"""
+        self._indices = array(_INDEX_TYPECODE)
+        self._counts = array(_COUNT_TYPECODE)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
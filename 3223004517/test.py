@@ -6,11 +6,48 @@ import sys
 from unittest.mock import patch, mock_open, MagicMock
 from main import (
     calculate_similarity,
+    calculate_similarity_matrix,
+    calculate_similarity_files,
+    iter_similarity_rows,
+    iter_file_similarity_rows,
+    preprocess_text,
+    preprocess_stream,
+    configure_scoring_backend,
+    configure_segment_cache,
+    configure_idf_model,
+    configure_analyzer,
+    segment_text,
     read_file,
     write_result,
     main
 )
 from sklearn.feature_extraction.text import TfidfVectorizer
+from seg_cache import SegmentCache
+from lsh_index import MinHashLSH, search
+import server
+from parallel_seg import split_chunks, parallel_segment
+from utils import iter_file_text
+from winnowing import winnowing_similarity, winnow
+import benchmark
+from lite_scoring import tfidf_cosine
+from vocabulary import Vocabulary, count_matrix, tfidf_matrix
+from idf_model import IdfModel, build_idf_model
+import metrics
+import bulk
+from inverted_index import InvertedIndex
+import simhash
+from simhash import SimHashStore, fingerprint, fingerprints
+from lcs import lcs_length, lcs_similarity
+from revision import RevisionStore
+from result_cache import ResultCache, check_config, config_key, content_hash
+from cascade import cascade_options, cascade_similarity, screen, shingle_hashes
+from char_ngram import ngram_counts, ngram_similarity
+from corpus_store import CorpusStore
+import shards
+from checker import PlagiarismChecker
+import memory
+from spill import SpilledCounts
+import seg_dict
 
 
 class TestPlagiarismChecker(unittest.TestCase):
@@ -376,5 +413,1874 @@ class TestPlagiarismChecker(unittest.TestCase):
 
 
 
+class TestBatchSimilarity(unittest.TestCase):
+    """批量查重（一对多 / 多对多）单元测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.texts = [
+            "自然语言处理是人工智能领域中的一个重要方向。",
+            "自然语言处理是人工智能领域中的一个重要方向。",
+            "今天是星期天，天气晴，今天晚上我要去看电影。",
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_matrix_is_symmetric(self):
+        """测试相似度矩阵对称且对角线为1"""
+        matrix = calculate_similarity_matrix(self.texts)
+        self.assertEqual(len(matrix), 3)
+        for i in range(3):
+            self.assertEqual(matrix[i][i], 1.0)
+            for j in range(3):
+                self.assertEqual(matrix[i][j], matrix[j][i])
+        self.assertEqual(matrix[0][1], 1.0)
+        self.assertLess(matrix[0][2], 0.3)
+
+    def test_matrix_single_row_and_empty_text(self):
+        """测试只计算一行以及空文本语义"""
+        rows = calculate_similarity_matrix(self.texts + ["", "  "], query_indices=[3])
+        self.assertEqual(rows, [[0.0, 0.0, 0.0, 1.0, 1.0]])
+
+    def test_batch_subcommand_writes_csv(self):
+        """测试 batch 子命令输出一对多CSV结果"""
+        paths = []
+        for index, text in enumerate(self.texts):
+            path = os.path.join(self.test_dir, f"doc{index}.txt")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            paths.append(path)
+        output = os.path.join(self.test_dir, "matrix.csv")
+
+        test_args = ["main.py", "batch", "--query", paths[0], self.test_dir, "-o", output]
+        with patch('sys.argv', test_args):
+            main()
+
+        with open(output, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], "document,doc1.txt,doc2.txt")
+        self.assertTrue(lines[1].startswith("doc0.txt,1.00,"))
+
+    def test_duplicate_basenames_get_unique_labels(self):
+        """测试不同目录下的同名论文使用互不相同的行列名，JSONL 不丢列"""
+        import json
+        from utils import document_labels
+        paths = []
+        for directory, text in (("a", self.texts[0]), ("b", self.texts[2])):
+            os.makedirs(os.path.join(self.test_dir, directory))
+            paths.append(os.path.join(self.test_dir, directory, "x.txt"))
+            with open(paths[-1], 'w', encoding='utf-8') as f:
+                f.write(text)
+        query = os.path.join(self.test_dir, "q.txt")
+        with open(query, 'w', encoding='utf-8') as f:
+            f.write(self.texts[1])
+        self.assertEqual(document_labels(paths + [query, query]), ["a/x.txt", "b/x.txt", "q.txt#1", "q.txt#2"])
+
+        output = os.path.join(self.test_dir, "matrix.jsonl")
+        with patch('sys.argv', ["main.py", "batch", paths[0], paths[1], query, "--format", "jsonl", "-o", output]):
+            main()
+        with open(output, 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([record['document'] for record in records], ["a/x.txt", "b/x.txt", "q.txt"])
+        self.assertEqual(records[0]['similarities'], {"a/x.txt": 1.0, "b/x.txt": records[1]['similarities']["a/x.txt"],
+                                                      "q.txt": 1.0})
+
+
+class TestSegmentCache(unittest.TestCase):
+    """磁盘分词缓存单元测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.text = "自然语言处理是人工智能领域中的一个重要方向 " * 50
+
+    def tearDown(self):
+        configure_segment_cache(None)
+        shutil.rmtree(self.test_dir)
+
+    def test_cache_shared_across_instances(self):
+        """测试分词结果写入磁盘后可被新的缓存实例读回"""
+        cache = configure_segment_cache(self.test_dir)
+        words = segment_text(self.text)
+        self.assertEqual(cache.misses, 1)
+
+        # 模拟新进程：重新创建缓存对象
+        cache = configure_segment_cache(self.test_dir)
+        self.assertEqual(segment_text(self.text), words)
+        self.assertEqual(cache.hits, 1)
+
+    def test_short_text_not_cached(self):
+        """测试过短文本不进入缓存"""
+        cache = SegmentCache(self.test_dir)
+        cache.put("短文本", ["短", "文本"])
+        self.assertIsNone(cache.get("短文本"))
+
+    def test_lru_eviction(self):
+        """测试超过容量后淘汰最久未使用的条目"""
+        cache = SegmentCache(self.test_dir, max_bytes=3000, min_length=0)
+        texts = [f"第{index}篇" for index in range(3)]
+        for index, text in enumerate(texts):
+            cache.put(text, ["词" * 300])
+            # 拉开修改时间，保证淘汰顺序确定
+            path = cache._path(text)
+            os.utime(path, (1000 + index, 1000 + index))
+        cache.get(texts[0])
+        cache.put("第3篇", ["词" * 300])
+
+        self.assertIsNotNone(cache.get(texts[0]))
+        self.assertIsNone(cache.get(texts[1]))
+        self.assertIsNotNone(cache.get("第3篇"))
+
+
+class TestMinHashLSH(unittest.TestCase):
+    """MinHash + LSH 候选索引单元测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.original = "自然语言处理是人工智能领域中的一个重要方向。它研究能实现人与计算机之间用自然语言进行有效通信的各种理论和方法。" * 5
+        self.other = "今天是星期天，天气晴，今天晚上我要去看电影。明天是星期一，天气雨，我明天要去上学。" * 5
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_query_returns_near_duplicate(self):
+        """测试近似重复的文档成为候选，无关文档不会"""
+        index = MinHashLSH()
+        index.add("original", self.original)
+        index.add("other", self.other)
+
+        candidates = index.query(self.original.replace("重要", "关键"))
+        self.assertEqual([doc_id for doc_id, _ in candidates], ["original"])
+        self.assertGreater(candidates[0][1], 0.5)
+        self.assertEqual(index.query(""), [])
+
+    def test_save_and_load(self):
+        """测试索引保存后重新加载，签名与查询结果一致"""
+        index = MinHashLSH(num_perm=64, bands=16)
+        index.add("original", self.original)
+        index.add("other", self.other)
+        path = os.path.join(self.test_dir, "index.npz")
+        index.save(path)
+
+        loaded = MinHashLSH.load(path)
+        self.assertEqual(loaded.doc_ids, ["original", "other"])
+        self.assertEqual(loaded.num_perm, 64)
+        self.assertEqual(loaded.query(self.other), index.query(self.other))
+
+    def test_search_scores_candidates_exactly(self):
+        """测试候选经过精确的TF-IDF余弦计算"""
+        index = MinHashLSH()
+        index.add("original", self.original)
+        texts = {"original": self.original}
+        results = search(index, self.original, loader=texts.get)
+        self.assertEqual(results, [("original", 1.0)])
+
+    def test_search_segments_query_once(self):
+        """测试待检测论文只分词一次，候选得分与两两查重一致"""
+        from main import calculate_similarity
+        query = self.original.replace("重要", "关键")
+        index = MinHashLSH()
+        index.add("original", self.original)
+        index.add("copy", self.original + "补充一句。")
+        texts = {"original": self.original, "copy": self.original + "补充一句。"}
+
+        tokens = MinHashLSH.tokens
+        with patch.object(MinHashLSH, 'tokens', autospec=True, side_effect=tokens) as mock_tokens:
+            results = search(index, query, loader=texts.get)
+        segmented = [call.args[1] for call in mock_tokens.call_args_list]
+        self.assertEqual(segmented.count(query), 1)
+        self.assertEqual(dict(results), {doc_id: calculate_similarity(text, query) for doc_id, text in texts.items()})
+
+    def test_build_rejects_mismatched_parameters(self):
+        """测试追加到已有索引时，签名参数不一致直接报错，不悄悄沿用旧参数"""
+        from lsh_index import index_main
+        paper = os.path.join(self.test_dir, "paper.txt")
+        with open(paper, 'w', encoding='utf-8') as f:
+            f.write(self.original)
+        path = os.path.join(self.test_dir, "index.npz")
+        index_main(['build', path, paper, '--num-perm', '64', '--bands', '16'])
+
+        with patch('builtins.print') as mock_print:
+            with self.assertRaises(SystemExit):
+                index_main(['build', path, paper, '--num-perm', '128'])
+        self.assertIn("--num-perm", mock_print.call_args[0][0])
+        with patch('builtins.print'):
+            index_main(['build', path, paper])
+        self.assertEqual(MinHashLSH.load(path).num_perm, 64)
+
+
+class TestCheckServer(unittest.TestCase):
+    """常驻查重服务单元测试"""
+
+    def setUp(self):
+        from concurrent.futures import ThreadPoolExecutor
+        self.test_dir = tempfile.mkdtemp()
+        # 测试中用线程池代替进程池，避免在测试进程里 fork
+        self.pool = ThreadPoolExecutor(max_workers=2)
+        self.original = os.path.join(self.test_dir, "orig.txt")
+        self.plagiarized = os.path.join(self.test_dir, "plag.txt")
+        with open(self.original, 'w', encoding='utf-8') as f:
+            f.write("自然语言处理是人工智能领域中的一个重要方向。")
+        with open(self.plagiarized, 'w', encoding='utf-8') as f:
+            f.write("自然语言处理是人工智能领域中的一个重要方向！")
+
+    def tearDown(self):
+        self.pool.shutdown()
+        shutil.rmtree(self.test_dir)
+
+    def _start(self, address, config=None):
+        import threading
+        check_server = server.create_server(address, self.pool, config)
+        threading.Thread(target=check_server.serve_forever, daemon=True).start()
+        self.addCleanup(check_server.server_close)
+        self.addCleanup(check_server.shutdown)
+        return check_server
+
+    def test_parse_address(self):
+        """测试服务地址解析"""
+        self.assertEqual(server.parse_address("127.0.0.1:8765"), ('http', ('127.0.0.1', 8765)))
+        self.assertEqual(server.parse_address("http://localhost:80/"), ('http', ('localhost', 80)))
+        self.assertEqual(server.parse_address("/tmp/check.sock"), ('unix', "/tmp/check.sock"))
+
+    def test_unix_socket_round_trip(self):
+        """测试通过Unix套接字转发查重请求，服务端只返回相似度"""
+        if not hasattr(__import__('socket'), 'AF_UNIX'):
+            self.skipTest("当前系统不支持Unix套接字")
+        address = os.path.join(self.test_dir, "check.sock")
+        self._start(address)
+
+        self.assertTrue(server.is_running(address))
+        similarity = server.forward_check(address, self.original, self.plagiarized)
+        self.assertEqual(similarity, 1.0)
+
+        with self.assertRaises(Exception) as context:
+            server.forward_check(address, "missing.txt", self.plagiarized)
+        self.assertTrue("文件不存在" in str(context.exception))
+
+    def test_http_round_trip(self):
+        """测试通过本机HTTP转发查重请求"""
+        check_server = self._start("127.0.0.1:0")
+        address = f"127.0.0.1:{check_server.server_address[1]}"
+        self.assertEqual(server.forward_check(address, self.original, self.plagiarized), 1.0)
+
+    def test_rejects_client_output_path(self):
+        """测试服务端拒绝客户端提交的输出路径，不替客户端写文件；结果文件由命令行进程写入"""
+        import json
+        import urllib.request
+        check_server = self._start("127.0.0.1:0", server.scoring_config())
+        address = f"127.0.0.1:{check_server.server_address[1]}"
+        target = os.path.join(self.test_dir, "victim.txt")
+        request = urllib.request.Request(f"http://{address}/check", data=json.dumps({
+            'original_file': self.original, 'plagiarized_file': self.plagiarized, 'output_file': target,
+        }).encode('utf-8'), method='POST')
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            urllib.request.urlopen(request)
+        self.assertEqual(context.exception.code, 400)
+        self.assertFalse(os.path.exists(target))
+
+        output = os.path.join(self.test_dir, "result.txt")
+        with patch('sys.argv', ["main.py", self.original, self.plagiarized, output, "--server", address]):
+            with patch('server.check_paths', return_value=0.5) as mock_check:
+                main()
+        mock_check.assert_called_once()
+        with open(output, 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), "0.50")
+
+    def test_config_mismatch(self):
+        """测试服务端的打分配置（如IDF模型）与客户端不同时拒绝计算，命令行改为在本进程内计算"""
+        import json
+        import urllib.request
+        local_config = server.scoring_config()
+        server_config = dict(local_config, idf_model="/srv/reference.idf|1024|0")
+        check_server = self._start("127.0.0.1:0", server_config)
+        address = f"127.0.0.1:{check_server.server_address[1]}"
+        output = os.path.join(self.test_dir, "result.txt")
+
+        with urllib.request.urlopen(f"http://{address}/health") as response:
+            self.assertEqual(json.loads(response.read())['config'], server_config)
+        with self.assertRaises(server.ConfigMismatch):
+            server.forward_check(address, self.original, self.plagiarized, config=local_config)
+        self.assertEqual(server.forward_check(address, self.original, self.plagiarized, config=server_config), 1.0)
+
+        with patch('sys.argv', ["main.py", self.original, self.plagiarized, output, "--server", address]):
+            with patch('server.check_paths') as mock_check:
+                main()
+        mock_check.assert_not_called()
+        with open(output, 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), "1.00")
+
+    def test_unavailable_server(self):
+        """测试服务未运行时客户端抛出 ServerUnavailable"""
+        address = os.path.join(self.test_dir, "missing.sock")
+        self.assertFalse(server.is_running(address))
+        with self.assertRaises(server.ServerUnavailable):
+            server.forward_check(address, self.original, self.plagiarized)
+
+
+class TestParallelSegmentation(unittest.TestCase):
+    """分块并行分词单元测试"""
+
+    def setUp(self):
+        self.text = ("自然语言处理是人工智能领域中的一个重要方向。Python3.14与C++的100%兼容！\n"
+                     "它研究能实现人与计算机之间用自然语言进行有效通信的各种理论和方法？ ") * 40
+
+    def tearDown(self):
+        from main import configure_parallel_segmentation
+        configure_parallel_segmentation(workers=None, threshold=1024 * 1024)
+
+    def test_split_chunks_at_boundaries(self):
+        """测试只在句子/段落边界切分且不丢字符"""
+        chunks = split_chunks(self.text, 100)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunks), self.text)
+        for chunk in chunks[:-1]:
+            self.assertIn(chunk[-1], "。！？!?；; \n")
+
+    def test_parallel_matches_serial(self):
+        """测试并行分词与串行分词结果完全一致"""
+        serial = segment_text(self.text)
+        self.assertEqual(parallel_segment(self.text, workers=2, chunk_size=200), serial)
+
+    def test_threshold_keeps_short_text_serial(self):
+        """测试低于阈值的文本不进入进程池"""
+        from main import configure_parallel_segmentation
+        configure_parallel_segmentation(workers=2, threshold=len(self.text) + 1)
+        with patch('parallel_seg.parallel_segment') as mock_parallel:
+            segment_text(self.text)
+        mock_parallel.assert_not_called()
+
+
+class TestStreamingIngestion(unittest.TestCase):
+    """流式读取与流式查重单元测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.text = "自然语言处理是人工智能领域中的一个重要方向。\n\n  它研究人与计算机之间的通信，Hello World！\n" * 20
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, name, content, encoding='utf-8'):
+        path = os.path.join(self.test_dir, name)
+        with open(path, 'w', encoding=encoding) as f:
+            f.write(content)
+        return path
+
+    def test_chunks_split_multibyte_characters(self):
+        """测试块边界落在多字节字符中间时解码结果不变"""
+        path = self._write("utf8.txt", self.text)
+        chunks = list(iter_file_text(path, chunk_size=7))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunks), self.text)
+
+    def test_bom_and_gbk_detection(self):
+        """测试BOM识别和GBK编码识别"""
+        bom_path = self._write("bom.txt", self.text, encoding='utf-8-sig')
+        self.assertEqual(''.join(iter_file_text(bom_path, chunk_size=16)), self.text)
+        utf16_path = self._write("utf16.txt", self.text, encoding='utf-16')
+        self.assertEqual(read_file(utf16_path), self.text)
+        gbk_path = self._write("gbk.txt", self.text, encoding='gbk')
+        self.assertEqual(''.join(iter_file_text(gbk_path, chunk_size=16)), self.text)
+
+    def test_preprocess_stream_matches_preprocess_text(self):
+        """测试流式预处理与整篇预处理结果一致"""
+        for size in (1, 5, 64):
+            chunks = [self.text[i:i + size] for i in range(0, len(self.text), size)]
+            self.assertEqual(''.join(preprocess_stream(chunks)), preprocess_text(self.text))
+
+    def test_streaming_similarity_matches_in_memory(self):
+        """测试流式计算与整篇读入计算的相似度一致"""
+        original = self._write("orig.txt", self.text)
+        plagiarized = self._write("plag.txt", self.text.replace("重要", "关键"), encoding='gbk')
+        expected = calculate_similarity(read_file(original), read_file(plagiarized))
+        self.assertEqual(calculate_similarity_files(original, plagiarized, chunk_size=64), expected)
+
+        empty = self._write("empty.txt", "  \n")
+        self.assertEqual(calculate_similarity_files(empty, empty), 1.0)
+        self.assertEqual(calculate_similarity_files(original, empty), 0.0)
+
+    def test_streaming_falls_back_when_non_ascii_starts_late(self):
+        """测试第一块只有ASCII、后面才出现GBK字节时，流式计算与 read_file 一样改用能解码全文的编码"""
+        from utils import EncodingFallback
+        content = "Hello World, plagiarism check. " * 8 + self.text
+        path = self._write("late_gbk.txt", content, encoding='gbk')
+        with self.assertRaises(EncodingFallback):
+            list(iter_file_text(path, chunk_size=64))
+        self.assertEqual(''.join(iter_file_text(path, chunk_size=64, encoding='gbk')), content)
+        self.assertEqual(read_file(path), content)
+
+        original = self._write("orig.txt", content)
+        expected = calculate_similarity(content, content)
+        self.assertEqual(calculate_similarity_files(original, path, chunk_size=64), expected)
+        self.assertEqual(calculate_similarity_files(path, path, chunk_size=64), expected)
+
+
+class TestWinnowing(unittest.TestCase):
+    """winnowing 指纹算法单元测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.original = "自然语言处理是人工智能领域中的一个重要方向。它研究能实现人与计算机之间用自然语言进行有效通信的各种理论和方法。"
+        self.copied = "前言部分。" + self.original[:22] + "完全不同的插入内容在这里出现！" + self.original[22:]
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_winnow_selects_rightmost_minimum(self):
+        """测试每个窗口选取最右侧的最小哈希，且不重复记录同一位置"""
+        import numpy as np
+        hashes = np.array([5, 1, 3, 1, 4, 2, 6], dtype=np.uint64)
+        values, positions = winnow(hashes, 3)
+        self.assertEqual(positions.tolist(), [1, 3, 5])
+        self.assertEqual(values.tolist(), [1, 1, 2])
+
+    def test_matched_spans_map_to_original_offsets(self):
+        """测试匹配片段的偏移对应两篇原始文本中相同的内容"""
+        result = winnowing_similarity(self.original, self.copied)
+        self.assertGreater(result['similarity'], 0.6)
+        self.assertGreaterEqual(len(result['matches']), 2)
+        for match in result['matches']:
+            original_part = preprocess_text(self.original[slice(*match['original'])])
+            copied_part = preprocess_text(self.copied[slice(*match['plagiarized'])])
+            self.assertEqual(original_part, copied_part)
+
+    def test_empty_and_unrelated_texts(self):
+        """测试空文本语义与无关文本"""
+        self.assertEqual(winnowing_similarity("", " "), {'similarity': 1.0, 'matches': []})
+        self.assertEqual(winnowing_similarity(self.original, "")['similarity'], 0.0)
+        result = winnowing_similarity(self.original, "今天是星期天，天气晴，今天晚上我要去看电影。")
+        self.assertEqual(result, {'similarity': 0.0, 'matches': []})
+
+    def test_main_winnowing_engine_writes_report(self):
+        """测试命令行选择 winnowing 算法并输出匹配片段报告"""
+        import json
+        original = os.path.join(self.test_dir, "orig.txt")
+        copied = os.path.join(self.test_dir, "copy.txt")
+        with open(original, 'w', encoding='utf-8') as f:
+            f.write(self.original)
+        with open(copied, 'w', encoding='utf-8') as f:
+            f.write(self.copied)
+        output = os.path.join(self.test_dir, "result.txt")
+        report = os.path.join(self.test_dir, "report.json")
+
+        test_args = ["main.py", original, copied, output, "--engine", "winnowing",
+                     "--report", report, "--no-server"]
+        with patch('sys.argv', test_args):
+            main()
+
+        with open(report, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        with open(output, 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), f"{data['similarity']:.2f}")
+        self.assertTrue(data['matches'])
+
+
+class TestBenchmark(unittest.TestCase):
+    """基准测试语料生成与结果比较单元测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.vocabulary = ['研究', '方法', '系统', '数据', '分析', '模型']
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_parse_size(self):
+        """测试规模字符串解析"""
+        self.assertEqual(benchmark.parse_size("1K"), 1024)
+        self.assertEqual(benchmark.parse_size("50M"), 50 * 1024 * 1024)
+        self.assertEqual(benchmark.parse_size("2048"), 2048)
+
+    def test_generate_text_size_and_determinism(self):
+        """测试生成文本达到指定大小且相同种子结果相同"""
+        text = benchmark.generate_text(4096, self.vocabulary, seed=1)
+        self.assertGreaterEqual(len(text.encode('utf-8')), 4096)
+        self.assertEqual(text, benchmark.generate_text(4096, self.vocabulary, seed=1))
+
+    def test_variants(self):
+        """测试各修改方式的效果"""
+        text = benchmark.generate_text(20000, self.vocabulary, seed=2)
+        deleted = benchmark.make_variant(text, 'del', 0.8, self.vocabulary)
+        added = benchmark.make_variant(text, 'add', 0.8, self.vocabulary)
+        shuffled = benchmark.make_variant(text, 'dis', 0.8, self.vocabulary)
+        duplicated = benchmark.make_variant(text, 'dup', 0.8, self.vocabulary)
+        self.assertLess(len(deleted), len(text))
+        self.assertGreater(len(added), len(text))
+        self.assertEqual(sorted(shuffled), sorted(text))
+        self.assertNotEqual(shuffled, text)
+        self.assertGreater(len(duplicated), len(text))
+        with self.assertRaises(Exception):
+            benchmark.make_variant(text, 'unknown')
+
+    def test_generate_corpus_file_names(self):
+        """测试语料文件命名与默认测试文本一致"""
+        corpus = benchmark.generate_corpus(self.test_dir, ['1K'], kinds=['del'])
+        self.assertTrue(corpus['1K']['del'].endswith("orig_1K_0.8_del.txt"))
+        self.assertTrue(os.path.exists(corpus['1K']['orig']))
+
+    def test_run_reads_existing_corpus_unchanged(self):
+        """测试 run --corpus 读取已有语料目录中的论文对，不重新生成、不改写其中的文件"""
+        import json
+        with open(os.path.join(self.test_dir, "orig.txt"), 'w', encoding='utf-8') as f:
+            f.write("今天是星期天，天气晴，今天晚上我要去看电影。")
+        with open(os.path.join(self.test_dir, "orig_0.8_del.txt"), 'w', encoding='utf-8') as f:
+            f.write("今天是周天，天气晴朗，我晚上要去看电影。")
+        with open(os.path.join(self.test_dir, "orig_1K.txt"), 'w', encoding='utf-8') as f:
+            f.write("自然语言处理是人工智能领域中的一个重要方向。")
+        with open(os.path.join(self.test_dir, "orig_1K_0.8_dup.txt"), 'w', encoding='utf-8') as f:
+            f.write("自然语言处理是人工智能领域中的一个重要方向。重要方向。")
+        before = {}
+        for name in os.listdir(self.test_dir):
+            with open(os.path.join(self.test_dir, name), 'rb') as f:
+                before[name] = f.read()
+
+        output = os.path.join(tempfile.mkdtemp(), "results.json")
+        self.addCleanup(shutil.rmtree, os.path.dirname(output))
+        with patch('builtins.print'):
+            benchmark.main(['run', '--corpus', self.test_dir, '--repeat', '1', '--no-cli', '-o', output])
+
+        after = {}
+        for name in os.listdir(self.test_dir):
+            with open(os.path.join(self.test_dir, name), 'rb') as f:
+                after[name] = f.read()
+        self.assertEqual(after, before)
+        with open(output, 'r', encoding='utf-8') as f:
+            results = json.load(f)['results']
+        self.assertEqual([(entry['size'], entry['variant']) for entry in results],
+                         [(str(len(before["orig.txt"])), 'del'), ('1K', 'dup')])
+
+    def test_compare_results(self):
+        """测试只报告超过阈值的耗时增长"""
+        def report(seconds):
+            return {'results': [{'size': '1K', 'variant': 'del',
+                                 'calculate_similarity': {'seconds_min': seconds}}]}
+        self.assertEqual(benchmark.compare_results(report(1.0), report(1.05)), [])
+        regressions = benchmark.compare_results(report(1.0), report(1.5))
+        self.assertEqual(regressions[0][:3], ('1K', 'del', 'calculate_similarity'))
+
+
+class TestLiteScoring(unittest.TestCase):
+    """不依赖 sklearn 的轻量打分后端单元测试"""
+
+    def tearDown(self):
+        configure_scoring_backend('auto')
+
+    def _both_backends(self, original, plagiarized):
+        configure_scoring_backend('auto')
+        lite = calculate_similarity(original, plagiarized)
+        configure_scoring_backend('sklearn')
+        full = calculate_similarity(original, plagiarized)
+        return lite, full
+
+    def test_matches_sklearn_backend(self):
+        """测试轻量后端与 sklearn 后端结果一致"""
+        vocabulary = ['研究', '方法', '系统', '数据', '分析', '模型', '实验', 'Python', '算法']
+        for seed in range(5):
+            original = benchmark.generate_text(3000, vocabulary, seed=seed)
+            for kind in benchmark.VARIANT_KINDS:
+                plagiarized = benchmark.make_variant(original, kind, 0.8, vocabulary, seed)
+                lite, full = self._both_backends(original, plagiarized)
+                self.assertEqual(lite, full)
+
+    def test_raw_cosine_matches_tfidf_vectorizer(self):
+        """测试未舍入的余弦值与 TfidfVectorizer 计算结果一致"""
+        from collections import Counter
+        from sklearn.metrics.pairwise import cosine_similarity
+        original = Counter({'自然语言': 3, '处理': 2, '重要': 1})
+        plagiarized = Counter({'自然语言': 1, '处理': 4, '方向': 2})
+        vectorizer = TfidfVectorizer(analyzer=Counter.elements)
+        matrix = vectorizer.fit_transform([original, plagiarized])
+        expected = cosine_similarity(matrix[0:1], matrix[1:2])[0][0]
+        self.assertAlmostEqual(tfidf_cosine(original, plagiarized), expected, places=12)
+
+    def test_falls_back_when_vocabulary_exceeds_limit(self):
+        """测试词表超过特征上限时交给 sklearn 计算"""
+        from collections import Counter
+        original = Counter({f"词{index}": 1 for index in range(6)})
+        self.assertIsNone(tfidf_cosine(original, Counter({'词0': 1}), max_features=5))
+        self.assertEqual(tfidf_cosine(original, Counter()), 0.0)
+
+    def test_only_single_character_words(self):
+        """测试两篇文本都只有单字时与 sklearn 流程一样报错"""
+        for backend in ('auto', 'sklearn'):
+            configure_scoring_backend(backend)
+            with self.assertRaises(Exception) as context:
+                calculate_similarity("我", "你")
+            self.assertTrue("文本向量化失败" in str(context.exception))
+
+
+class TestVocabulary(unittest.TestCase):
+    """词编号数组与向量化单元测试"""
+
+    def test_term_ids_follow_vectorizer_rules(self):
+        """测试驻留时转小写并丢弃单字词，重复词共用编号"""
+        from array import array
+        vocabulary = Vocabulary()
+        ids = vocabulary.term_ids(["Python", "是", "编程", "语言", "python", "编程"])
+        self.assertIsInstance(ids, array)
+        self.assertEqual(list(ids), [0, 1, 2, 0, 1])
+        self.assertEqual(vocabulary.terms, ["python", "编程", "语言"])
+        self.assertEqual(list(Vocabulary(min_term_length=1).term_ids(["是"])), [0])
+
+    def test_count_matrix_from_id_arrays(self):
+        """测试编号数组直接构造词频矩阵"""
+        vocabulary = Vocabulary()
+        documents = [vocabulary.term_ids(["自然", "语言", "自然"]), vocabulary.term_ids([]),
+                     vocabulary.term_ids(["语言"])]
+        counts = count_matrix(documents, len(vocabulary)).toarray().tolist()
+        self.assertEqual(counts, [[2, 1], [0, 0], [0, 1]])
+
+    def test_tfidf_matrix_matches_vectorizer_with_feature_limit(self):
+        """测试截断特征后的TF-IDF矩阵与 TfidfVectorizer 结果一致"""
+        import numpy as np
+        words = [["词%02d" % (index % 7) for index in range(seed, seed + 40)] for seed in range(3)]
+        vocabulary = Vocabulary()
+        documents = [vocabulary.term_ids(item) for item in words]
+        matrix = tfidf_matrix(count_matrix(documents, len(vocabulary)), vocabulary, max_features=4)
+
+        expected = TfidfVectorizer(max_features=4).fit_transform([' '.join(item) for item in words])
+        self.assertTrue(np.allclose((matrix @ matrix.T).toarray(), (expected @ expected.T).toarray()))
+
+    def test_empty_vocabulary(self):
+        """测试没有任何可计数的词时报错"""
+        vocabulary = Vocabulary()
+        documents = [vocabulary.term_ids(["我"]), vocabulary.term_ids(["你"])]
+        with self.assertRaises(Exception):
+            tfidf_matrix(count_matrix(documents, len(vocabulary)), vocabulary)
+
+
+class TestIdfModel(unittest.TestCase):
+    """语料IDF模型单元测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.model_path = os.path.join(self.test_dir, 'corpus.idf')
+        self.corpus = [
+            ["自然", "语言", "处理", "自然"],
+            ["机器", "学习", "语言"],
+            ["深度", "学习", "Python"],
+        ]
+
+    def tearDown(self):
+        configure_idf_model(None)
+        shutil.rmtree(self.test_dir)
+
+    def test_idf_matches_vectorizer(self):
+        """测试持久化的IDF与 TfidfVectorizer 在同一语料上拟合的结果一致"""
+        model = build_idf_model(iter(self.corpus), self.model_path)
+        vectorizer = TfidfVectorizer().fit([' '.join(words) for words in self.corpus])
+        self.assertEqual(len(model), len(vectorizer.vocabulary_))
+        self.assertEqual(model.document_count, 3)
+        for term, column in vectorizer.vocabulary_.items():
+            self.assertAlmostEqual(model.idf(term), vectorizer.idf_[column])
+        self.assertIsNone(model.idf("不存在"))
+        model.close()
+
+    def test_transform_matches_vectorizer(self):
+        """测试重新加载的模型只做 transform，结果与 TfidfVectorizer.transform 一致"""
+        import numpy as np
+        build_idf_model(iter(self.corpus), self.model_path).close()
+        model = IdfModel(self.model_path)
+        documents = [["自然", "语言", "未知"], ["学习", "语言", "语言"], ["未知"]]
+
+        vectorizer = TfidfVectorizer().fit([' '.join(words) for words in self.corpus])
+        expected = vectorizer.transform([' '.join(words) for words in documents])
+        matrix = model.transform(documents)
+        self.assertTrue(np.allclose((matrix @ matrix.T).toarray(), (expected @ expected.T).toarray()))
+        expected_similarity = (expected[0] @ expected[1].T).toarray()[0][0]
+        self.assertEqual(model.similarity(documents[0], documents[1]), round(expected_similarity, 2))
+        self.assertEqual(model.similarity(documents[0], documents[2]), 0.0)
+        model.close()
+
+    def test_calculate_similarity_uses_model(self):
+        """测试配置模型后 calculate_similarity 使用语料IDF"""
+        build_idf_model(iter(self.corpus), self.model_path).close()
+        configure_idf_model(self.model_path)
+        self.assertEqual(calculate_similarity("自然语言处理", "自然语言处理"), 1.0)
+        self.assertEqual(calculate_similarity("自然语言", "深度学习"), 0.0)
+        matrix = calculate_similarity_matrix(["自然语言处理", "机器学习语言", ""])
+        self.assertEqual(matrix[0][0], 1.0)
+        self.assertEqual(matrix[2][2], 1.0)
+
+    def test_invalid_model_file(self):
+        """测试加载不存在或格式错误的模型文件"""
+        with self.assertRaises(Exception):
+            IdfModel(os.path.join(self.test_dir, 'missing.idf'))
+        with open(self.model_path, 'wb') as file:
+            file.write(b'not a model' * 10)
+        with self.assertRaises(Exception):
+            IdfModel(self.model_path)
+
+
+class TestMetrics(unittest.TestCase):
+    """分阶段指标单元测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.records = []
+
+    def tearDown(self):
+        metrics.configure_metrics()
+        configure_segment_cache(None)
+        shutil.rmtree(self.test_dir)
+
+    def test_disabled_by_default(self):
+        """测试未开启时不记录任何内容"""
+        metrics.configure_metrics()
+        self.assertFalse(metrics.enabled())
+        with metrics.stage('segment') as sizes:
+            sizes['tokens'] = 3
+        self.assertIsNone(metrics.emit('check'))
+
+    def test_stages_and_hook(self):
+        """测试阶段计时累加、缓存命中率，并通过钩子输出后清空"""
+        metrics.configure_metrics(hooks=[self.records.append])
+        for _ in range(2):
+            with metrics.stage('segment') as sizes:
+                sizes['tokens'] = 5
+        metrics.cache_lookup('segment_disk', True)
+        metrics.cache_lookup('segment_disk', False)
+        with self.assertRaises(ValueError):
+            with metrics.stage('write_result'):
+                raise ValueError("失败")
+
+        record = metrics.emit('check', similarity=0.5)
+        self.assertEqual(self.records, [record])
+        self.assertEqual(record['event'], 'check')
+        self.assertEqual(record['similarity'], 0.5)
+        self.assertEqual(record['stages']['segment']['calls'], 2)
+        self.assertEqual(record['stages']['segment']['tokens'], 10)
+        self.assertEqual(record['stages']['write_result']['errors'], 1)
+        self.assertEqual(record['caches']['segment_disk']['hit_rate'], 0.5)
+        self.assertEqual(metrics.emit('check')['stages'], {})
+
+    def test_calculate_similarity_stages(self):
+        """测试查重流程记录读取、预处理、分词、向量化和余弦阶段"""
+        metrics.configure_metrics(hooks=[self.records.append])
+        configure_segment_cache(os.path.join(self.test_dir, 'cache'))
+        path = os.path.join(self.test_dir, 'a.txt')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write("今天是星期天，天气晴，今天晚上我要去看电影。")
+        text = read_file(path)
+        calculate_similarity(text, "今天是周天，天气晴朗，我晚上要去看电影。")
+        record = metrics.emit('check')
+        for name in ('read', 'preprocess', 'segment', 'vectorize', 'cosine'):
+            self.assertIn(name, record['stages'])
+        self.assertEqual(record['stages']['read']['chars'], len(text))
+        self.assertGreater(record['stages']['segment']['tokens'], 0)
+        self.assertEqual(record['caches']['segment_disk']['misses'], 2)
+
+    def test_main_writes_json_lines(self):
+        """测试命令行 --metrics 追加写入 JSON 行"""
+        import json
+        original = os.path.join(self.test_dir, 'orig.txt')
+        plagiarized = os.path.join(self.test_dir, 'copy.txt')
+        output = os.path.join(self.test_dir, 'result.txt')
+        metrics_file = os.path.join(self.test_dir, 'metrics.jsonl')
+        for path in (original, plagiarized):
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write("自然语言处理是人工智能的重要方向")
+        argv = ['main.py', original, plagiarized, output, '--no-server', '--metrics', metrics_file]
+        with patch('sys.argv', argv), patch('builtins.print'):
+            main()
+            main()
+        with open(metrics_file, encoding='utf-8') as file:
+            records = [json.loads(line) for line in file]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['similarity'], 1.0)
+        self.assertIn('write_result', records[0]['stages'])
+
+
+class TestBulkRunner(unittest.TestCase):
+    """清单批量查重单元测试"""
+
+    def setUp(self):
+        from concurrent.futures import ThreadPoolExecutor
+        self.test_dir = tempfile.mkdtemp()
+        # 测试中用线程池代替进程池，避免在测试进程里 fork
+        self.pool = ThreadPoolExecutor(max_workers=2)
+        self.texts = {
+            'orig.txt': "自然语言处理是人工智能领域中的一个重要方向。",
+            'copy.txt': "自然语言处理是人工智能领域的重要方向！",
+            'other.txt': "今天天气晴朗，我们一起去公园散步。",
+            'blank.txt': "   ",
+        }
+        for name, text in self.texts.items():
+            with open(os.path.join(self.test_dir, name), 'w', encoding='utf-8') as f:
+                f.write(text)
+        self.manifest = os.path.join(self.test_dir, 'manifest.csv')
+        with open(self.manifest, 'w', encoding='utf-8') as f:
+            f.write("original,candidate,output\n"
+                    "orig.txt,copy.txt,out/copy.txt\n"
+                    "orig.txt,other.txt,out/other.txt\n"
+                    "orig.txt,blank.txt,out/blank.txt\n"
+                    "orig.txt,missing.txt,out/missing.txt\n")
+        self.checkpoint = os.path.join(self.test_dir, 'checkpoint.jsonl')
+
+    def tearDown(self):
+        self.pool.shutdown()
+        shutil.rmtree(self.test_dir)
+
+    def _run(self, pairs):
+        import asyncio
+        return asyncio.run(bulk.run_bulk(pairs, self.checkpoint, self.pool))
+
+    def test_read_manifest_formats(self):
+        """测试 CSV（带/不带表头）和 JSONL 清单，相对路径以清单目录为基准"""
+        pairs = bulk.read_manifest(self.manifest)
+        self.assertEqual(len(pairs), 4)
+        self.assertEqual(pairs[0].original_file, os.path.join(self.test_dir, 'orig.txt'))
+        self.assertEqual(pairs[0].output_file, os.path.join(self.test_dir, 'out', 'copy.txt'))
+
+        plain = os.path.join(self.test_dir, 'plain.csv')
+        with open(plain, 'w', encoding='utf-8') as f:
+            f.write("orig.txt,copy.txt,out/copy.txt\n")
+        self.assertEqual(bulk.read_manifest(plain), pairs[:1])
+
+        jsonl = os.path.join(self.test_dir, 'manifest.jsonl')
+        with open(jsonl, 'w', encoding='utf-8') as f:
+            f.write('{"original_file": "orig.txt", "plagiarized_file": "copy.txt", "output_file": "out/copy.txt"}\n')
+        self.assertEqual(bulk.read_manifest(jsonl), pairs[:1])
+
+    def test_results_match_single_checks(self):
+        """测试结果与逐对 calculate_similarity 一致，失败的论文对不影响其他论文对"""
+        pairs = bulk.read_manifest(self.manifest)
+        summary = self._run(pairs)
+        self.assertEqual(summary, {'completed': 3, 'skipped': 0, 'failed': 1})
+        for pair in pairs[:3]:
+            expected = calculate_similarity(self.texts['orig.txt'],
+                                            self.texts[os.path.basename(pair.plagiarized_file)])
+            with open(pair.output_file, 'r', encoding='utf-8') as f:
+                self.assertEqual(f.read(), f"{expected:.2f}")
+
+    def test_each_file_analyzed_once(self):
+        """测试被多个论文对引用的文件只分词一次"""
+        pairs = bulk.read_manifest(self.manifest)[:3]
+        with patch('bulk.analyze_text', side_effect=bulk.analyze_text) as analyze:
+            self._run(pairs)
+        self.assertEqual(analyze.call_count, 4)
+
+    def test_rerun_skips_completed_pairs(self):
+        """测试重新运行时跳过检查点中已完成的论文对，只重试失败的"""
+        pairs = bulk.read_manifest(self.manifest)
+        self._run(pairs[:2])
+        with open(self.checkpoint, 'a', encoding='utf-8') as f:
+            f.write('{"original_file": "截断的')
+        summary = self._run(pairs)
+        self.assertEqual(summary, {'completed': 1, 'skipped': 2, 'failed': 1})
+        self.assertEqual(len(bulk.load_checkpoint(self.checkpoint)), 3)
+        self.assertEqual(self._run(pairs), {'completed': 0, 'skipped': 3, 'failed': 1})
+
+
+class TestInvertedIndex(unittest.TestCase):
+    """倒排索引单元测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.index = InvertedIndex(os.path.join(self.test_dir, 'index.db'))
+        self.texts = {
+            'a': "自然语言处理是人工智能领域中的一个重要方向，研究计算机理解人类语言。",
+            'b': "自然语言处理是人工智能的重要方向，研究如何让计算机理解语言。",
+            'c': "今天天气晴朗，我们一起去公园散步，晚上看电影。",
+            'd': "机器学习和深度学习推动了语音识别与图像识别的发展。",
+            'e': "人工智能研究让计算机理解图像和语言，深度学习是重要方法。",
+        }
+        for doc_id, text in self.texts.items():
+            self.index.add(doc_id, text)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.test_dir)
+
+    def _brute_force(self, query, top_k):
+        scores = [(doc_id, calculate_similarity(text, query)) for doc_id, text in self.texts.items()]
+        return sorted([item for item in scores if item[1] > 0], key=lambda item: (-item[1], item[0]))[:top_k]
+
+    def test_scores_match_pairwise_similarity(self):
+        """测试查询得分与两两查重一致，前K篇与逐篇计算的结果相同"""
+        query = "自然语言处理是人工智能中的重要方向，让计算机理解人类语言。"
+        for top_k in (1, 2, 5):
+            results = self.index.search(query, top_k, loader=self.texts.get)
+            self.assertEqual([score for _, score in results],
+                             [score for _, score in self._brute_force(query, top_k)])
+            for doc_id, score in results:
+                self.assertEqual(score, calculate_similarity(self.texts[doc_id], query))
+        self.assertEqual(self.index.search(query, 1)[0][0], 'a')
+
+    def test_query_terms_batched_under_variable_limit(self):
+        """测试查询词数超过 SQLite 参数个数上限时分批查询，结果不变"""
+        import sqlite3
+        import inverted_index
+        query = "自然语言处理是人工智能中的重要方向，让计算机理解人类语言。"
+        expected = self._brute_force(query, 5)
+        self.index.connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 4)
+        with patch.object(inverted_index, 'MAX_SQL_VARIABLES', 4):
+            for top_k in (1, 2, 5):
+                results = self.index.search(query, top_k, loader=self.texts.get)
+                self.assertEqual([score for _, score in results], [score for _, score in expected[:top_k]])
+            # 特征上限很小时所有文档都按大文档处理，走逐篇探测共有词的分支
+            with patch.object(inverted_index, 'MAX_FEATURES', 10):
+                results = self.index.search(query, 5, loader=self.texts.get)
+        self.assertEqual([score for _, score in results], [score for _, score in expected])
+
+    def test_large_document_not_pruned(self):
+        """
+        测试词表并集超过特征上限的文档不参与剪枝：截断特征后的得分（0.62）高于原始词频余弦上界（约0.56），
+        按上界剪枝会漏掉它
+        """
+        import jieba
+        jieba.dt.check_initialized()
+        words = [word for word, frequency in sorted(jieba.dt.FREQ.items())
+                 if frequency > 50 and len(word) == 2 and all('一' <= char <= '鿿' for char in word)][:16000]
+        texts = {'small': "计算机和网络", 'large': "计算机。" * 80 + "。".join(words)}
+        index = InvertedIndex(os.path.join(self.test_dir, 'large.db'))
+        for doc_id, text in texts.items():
+            index.add(doc_id, text)
+        expected = calculate_similarity(texts['large'], "计算机")
+        self.assertGreater(expected, calculate_similarity(texts['small'], "计算机"))
+        self.assertEqual(index.search("计算机", 1, loader=texts.get), [('large', expected)])
+        index.close()
+
+    def test_incremental_add_and_update(self):
+        """测试追加新文档、更新已有文档，内容未变时跳过"""
+        self.assertEqual(len(self.index), 5)
+        self.assertFalse(self.index.add('a', self.texts['a']))
+        self.texts['c'] = "自然语言处理是人工智能领域中的一个重要方向，研究计算机理解人类语言。"
+        self.assertTrue(self.index.add('c', self.texts['c']))
+        self.texts['f'] = "公园里的天气晴朗，适合散步。"
+        self.assertTrue(self.index.add('f', self.texts['f']))
+        self.assertEqual(len(self.index), 6)
+
+        results = self.index.search(self.texts['a'], 2)
+        self.assertEqual(sorted(doc_id for doc_id, _ in results), ['a', 'c'])
+        self.assertEqual([score for _, score in results], [1.0, 1.0])
+        self.assertEqual(self.index.search("天气晴朗去公园散步", 1)[0][0], 'f')
+
+    def test_query_without_known_terms(self):
+        """测试查询中没有已收录的词时返回空列表"""
+        self.assertEqual(self.index.search("完全无关的内容"), [])
+        self.assertEqual(self.index.search("   "), [])
+
+
+class TestSimHash(unittest.TestCase):
+    """SimHash 指纹单元测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_fingerprint_properties(self):
+        """测试相同文本指纹相同，空文档指纹为0，批量计算与逐篇计算一致"""
+        import numpy as np
+        from collections import Counter
+        documents = [Counter({"自然": 2, "语言": 1}), Counter(), Counter({"机器": 1, "学习": 3})]
+        batch = fingerprints(documents)
+        self.assertEqual(batch.dtype, np.uint64)
+        self.assertEqual(batch[1], 0)
+        for document, value in zip(documents, batch):
+            self.assertEqual(fingerprints([document])[0], value)
+
+        text = "自然语言处理是人工智能领域中的一个重要方向。"
+        self.assertEqual(fingerprint(text), fingerprint(text))
+        self.assertEqual(fingerprint("   "), 0)
+
+    def test_near_duplicates_match_brute_force(self):
+        """测试分段置换表找出的近似重复对与两两比较的结果一致"""
+        import numpy as np
+        rng = np.random.default_rng(1)
+        values = rng.integers(1, 2 ** 62, size=400, dtype=np.uint64)
+        for index in range(0, 100, 2):
+            value = int(values[index])
+            for bit in rng.choice(64, size=index % 5, replace=False):
+                value ^= 1 << int(bit)
+            values[index + 1] = value
+        store = SimHashStore()
+        store.add_many([str(index) for index in range(len(values))], values)
+
+        distances = np.bitwise_count(values[:, None] ^ values[None, :])
+        for max_distance in (0, 3, 5):
+            expected = {(str(i), str(j)) for i in range(len(values)) for j in range(i + 1, len(values))
+                        if distances[i, j] <= max_distance}
+            found = store.near_duplicates(max_distance)
+            self.assertEqual({(first, second) for first, second, _ in found}, expected)
+            self.assertEqual(len(found), len(expected))
+
+        matches = store.query(values[6], 3)
+        self.assertEqual(matches[:2], [('6', 0), ('7', 1)])
+
+    def test_add_files_in_batches(self):
+        """测试建库按批计算指纹，结果与一次计算全部文件相同，已收录的文件被跳过"""
+        import numpy as np
+        texts = ["自然语言处理是人工智能领域中的一个重要方向。", "机器学习推动了语音识别的发展。",
+                 "今天天气晴朗，适合去公园散步。", "深度学习是图像识别的重要方法。", ""]
+        paths = []
+        for index, text in enumerate(texts):
+            paths.append(os.path.join(self.test_dir, f"{index}.txt"))
+            with open(paths[-1], 'w', encoding='utf-8') as f:
+                f.write(text)
+
+        store = SimHashStore()
+        with patch('simhash.fingerprints', side_effect=fingerprints) as batches:
+            self.assertEqual(store.add_files(paths, batch_size=2), len(paths))
+        self.assertEqual(batches.call_count, 3)
+        self.assertEqual(store.doc_ids, paths)
+        expected = fingerprints([simhash.document_terms(text) for text in texts])
+        self.assertTrue(np.array_equal(store.fingerprints, expected))
+        self.assertEqual(store.add_files(paths, batch_size=2), 0)
+
+    def test_empty_documents_never_match(self):
+        """测试没有词的文档（指纹为0）不会互相判为近似重复，查询和列出论文对都跳过它们"""
+        store = SimHashStore()
+        store.add('text', "自然语言处理是人工智能领域中的一个重要方向。")
+        store.add('empty', "")
+        store.add('stop_words', "的 了 是")
+        self.assertEqual(store.fingerprints[1], 0)
+
+        self.assertEqual(store.query(0, 3), [])
+        self.assertEqual(store.query(1, 3), [])
+        self.assertEqual(store.near_duplicates(3), [])
+        text_value = store.fingerprints[0]
+        self.assertEqual(store.query(text_value, 3), [('text', 0)])
+
+    def test_save_and_load(self):
+        """测试指纹库保存后加载一致，重复的文档编号被忽略"""
+        import numpy as np
+        store = SimHashStore()
+        self.assertTrue(store.add('a', "自然语言处理是人工智能领域中的一个重要方向。"))
+        self.assertFalse(store.add('a', "其他内容"))
+        path = os.path.join(self.test_dir, 'store.npz')
+        store.save(path)
+        loaded = SimHashStore.load(path)
+        self.assertEqual(loaded.doc_ids, ['a'])
+        self.assertTrue(np.array_equal(loaded.fingerprints, store.fingerprints))
+
+
+class TestLcsEngine(unittest.TestCase):
+    """位并行最长公共子序列单元测试"""
+
+    @staticmethod
+    def _dynamic_programming(first, second):
+        previous = [0] * (len(second) + 1)
+        for char in first:
+            current = [0]
+            for index, other in enumerate(second):
+                current.append(previous[index] + 1 if char == other else max(previous[index + 1], current[index]))
+            previous = current
+        return previous[-1]
+
+    def test_matches_dynamic_programming(self):
+        """测试位并行结果与动态规划一致（含跨越多个机器字的长度）"""
+        import random
+        rng = random.Random(0)
+        for length in (0, 1, 7, 63, 64, 65, 200):
+            first = ''.join(rng.choice("自然语言abc") for _ in range(length))
+            second = ''.join(rng.choice("自然语言处理abcd") for _ in range(rng.randrange(0, 150)))
+            self.assertEqual(lcs_length(first, second), self._dynamic_programming(first, second))
+            self.assertEqual(lcs_length(second, first), self._dynamic_programming(first, second))
+
+    def test_order_aware_similarity(self):
+        """测试语序打乱后相似度下降，而词频余弦不变"""
+        original = "自然语言处理是人工智能的重要方向。机器学习推动了语音识别的发展。"
+        shuffled = "机器学习推动了语音识别的发展。自然语言处理是人工智能的重要方向。"
+        self.assertEqual(lcs_similarity(original, original), 1.0)
+        self.assertLess(lcs_similarity(original, shuffled), 1.0)
+        self.assertEqual(calculate_similarity(original, shuffled), 1.0)
+        self.assertEqual(lcs_similarity("", " "), 1.0)
+        self.assertEqual(lcs_similarity(original, "！？"), 0.0)
+
+    def test_size_limits(self):
+        """测试超出字符数上限或位向量表超出内存预算时在计算前报错"""
+        original = "自然语言处理是人工智能的重要方向。" * 20
+        with patch('lcs.lcs_length') as mock_length:
+            with self.assertRaises(Exception) as context:
+                lcs_similarity(original, original, max_chars=100)
+            self.assertTrue("--lcs-max-chars" in str(context.exception))
+            with self.assertRaises(Exception) as context:
+                lcs_similarity(original, original, memory_budget=64)
+            self.assertTrue("内存预算" in str(context.exception))
+        mock_length.assert_not_called()
+        self.assertEqual(lcs_similarity(original, original, max_chars=len(original), memory_budget=4096), 1.0)
+
+    def test_whole_file_engines_respect_memory_budget(self):
+        """测试文件超出内存预算时 winnowing / lcs 直接报错，不整篇读入"""
+        test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, test_dir)
+        original = os.path.join(test_dir, "orig.txt")
+        with open(original, 'w', encoding='utf-8') as f:
+            f.write("自然语言处理是人工智能的重要方向。" * 200)
+        for engine in ('winnowing', 'lcs'):
+            test_args = ["main.py", original, original, os.path.join(test_dir, "result.txt"),
+                         "--engine", engine, "--memory-budget", "0.01", "--no-server"]
+            with patch('sys.argv', test_args):
+                with patch('sys.exit') as mock_exit:
+                    with patch('builtins.print') as mock_print:
+                        with patch('main.cached_read_file') as mock_read:
+                            main()
+            mock_exit.assert_called_once_with(1)
+            mock_read.assert_not_called()
+            self.assertTrue("--memory-budget" in mock_print.call_args[0][0])
+
+
+class TestRevisionStore(unittest.TestCase):
+    """修订版增量查重单元测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.store = RevisionStore(os.path.join(self.test_dir, 'revisions.db'))
+        self.original = ("自然语言处理是人工智能领域中的一个重要方向。\n"
+                         "它研究能实现人与计算机之间用自然语言进行有效通信的各种理论和方法。\n\n"
+                         "机器学习推动了语音识别与图像识别的发展。\n")
+        self.draft = ("自然语言处理是人工智能的一个重要方向。\n"
+                      "它研究人与计算机之间用自然语言有效通信的理论和方法。\n"
+                      "今天天气晴朗，我们一起去公园散步。\n")
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_matches_full_recheck(self):
+        """测试增量结果与整篇重新计算一致"""
+        similarity = self.store.similarity('orig', self.original, 'draft', self.draft)
+        self.assertEqual(similarity, calculate_similarity(self.original, self.draft))
+        self.assertEqual(self.store.similarity('orig', "", 'draft', "  "), 1.0)
+
+    def test_revision_only_segments_changed_paragraphs(self):
+        """测试再次提交时只对修改过的段落分词，词频按差量更新"""
+        self.store.similarity('orig', self.original, 'draft', self.draft)
+        segmented = self.store.segmented
+
+        revised = self.draft.replace("今天天气晴朗，我们一起去公园散步。", "机器学习推动了语音识别的发展。")
+        similarity = self.store.similarity('orig', self.original, 'draft', revised)
+        self.assertEqual(self.store.segmented, segmented + 1)
+        self.assertEqual(similarity, calculate_similarity(self.original, revised))
+
+        _, _, counts = self.store.update('draft', revised)
+        _, _, expected = RevisionStore(os.path.join(self.test_dir, 'fresh.db')).update('draft', revised)
+        self.assertEqual(counts, expected)
+        self.assertNotIn("天气晴朗", counts)
+
+    def _assert_refs_consistent(self):
+        import json
+        from collections import Counter
+        references = Counter()
+        for paragraphs, in self.store.connection.execute("SELECT paragraphs FROM documents"):
+            references.update(json.loads(paragraphs))
+        stored = dict(self.store.connection.execute("SELECT hash, refs FROM paragraphs"))
+        self.assertEqual(stored, dict(references))
+
+    def test_concurrent_revision_diffs_against_latest_version(self):
+        """测试分词期间另一个进程提交了同一论文时，差量基于持锁后读到的最新版本，段落引用数保持一致"""
+        import revision
+        other = RevisionStore(self.store.path)
+        self.addCleanup(other.close)
+        self.store.update('draft', self.draft)
+        revised = self.draft + "机器学习推动了语音识别的发展。\n"
+        segment = revision.paragraph_terms
+        raced = []
+
+        def racing(paragraph):
+            if not raced:
+                raced.append(paragraph)
+                other.update('draft', self.original)
+            return segment(paragraph)
+
+        with patch('revision.paragraph_terms', side_effect=racing):
+            _, _, counts = self.store.update('draft', revised)
+        self.assertTrue(raced)
+        _, _, expected = RevisionStore(os.path.join(self.test_dir, 'fresh.db')).update('draft', revised)
+        self.assertEqual(counts, expected)
+        self._assert_refs_consistent()
+
+    def test_missing_paragraph_record_rebuilds_counts(self):
+        """测试旧版本的段落记录缺失时按新版本重新汇总词频，而不是报错"""
+        self.store.update('draft', self.draft)
+        with self.store.connection:
+            self.store.connection.execute("DELETE FROM paragraphs")
+        revised = self.draft.replace("今天天气晴朗，我们一起去公园散步。", "机器学习推动了语音识别的发展。")
+        _, _, counts = self.store.update('draft', revised)
+        _, _, expected = RevisionStore(os.path.join(self.test_dir, 'fresh.db')).update('draft', revised)
+        self.assertEqual(counts, expected)
+        self._assert_refs_consistent()
+
+
+class TestResultCache(unittest.TestCase):
+    """持久化结果缓存单元测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.test_dir, 'results.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_keyed_by_content_and_config(self):
+        """测试结果按内容哈希和配置保存，重新打开后仍然有效"""
+        cache = ResultCache(self.cache_path)
+        original, plagiarized = content_hash("原文内容"), content_hash("抄袭版内容")
+        cache.put(original, plagiarized, config_key('tfidf'), 0.82)
+        self.assertIsNone(cache.get(original, plagiarized, config_key('lcs')))
+        self.assertIsNone(cache.get(plagiarized, original, config_key('tfidf')))
+        cache.close()
+
+        cache = ResultCache(self.cache_path)
+        self.assertEqual(cache.get(original, plagiarized, config_key('tfidf')), 0.82)
+        self.assertNotEqual(check_config('tfidf'), check_config('winnowing'))
+        cache.close()
+
+    def test_evicts_least_recently_used(self):
+        """测试超出容量时淘汰最久未使用的结果"""
+        cache = ResultCache(self.cache_path, max_entries=10)
+        config = config_key('tfidf')
+        for index in range(10):
+            cache.put(f'a{index}', 'b', config, index / 10)
+        cache.get('a0', 'b', config)
+        cache.put('a10', 'b', config, 1.0)
+        self.assertEqual(len(cache), 9)
+        self.assertEqual(cache.get('a0', 'b', config), 0.0)
+        self.assertIsNone(cache.get('a1', 'b', config))
+        cache.close()
+
+    def test_invalidate_by_engine(self):
+        """测试按算法删除缓存结果"""
+        cache = ResultCache(self.cache_path)
+        cache.put('a', 'b', config_key('tfidf'), 0.5)
+        cache.put('a', 'b', config_key('lcs'), 0.4)
+        self.assertEqual(cache.invalidate('tfidf'), 1)
+        self.assertIsNone(cache.get('a', 'b', config_key('tfidf')))
+        self.assertEqual(cache.get('a', 'b', config_key('lcs')), 0.4)
+        self.assertEqual(cache.invalidate(), 1)
+        self.assertEqual(len(cache), 0)
+        cache.close()
+
+    def test_main_uses_result_cache(self):
+        """测试命令行第二次查重相同内容时直接返回缓存结果"""
+        original_path = os.path.join(self.test_dir, 'orig.txt')
+        plagiarized_path = os.path.join(self.test_dir, 'copy.txt')
+        output_path = os.path.join(self.test_dir, 'result.txt')
+        with open(original_path, 'w', encoding='utf-8') as file:
+            file.write("今天是星期天，天气晴，今天晚上我要去看电影。")
+        with open(plagiarized_path, 'w', encoding='utf-8') as file:
+            file.write("今天是周天，天气晴朗，我晚上要去看电影。")
+        test_args = ["main.py", original_path, plagiarized_path, output_path,
+                     "--no-server", "--result-cache", self.cache_path]
+
+        with patch('sys.argv', test_args):
+            main()
+            with open(output_path, 'r', encoding='utf-8') as file:
+                expected = file.read()
+            os.remove(output_path)
+            with patch('main.calculate_similarity') as mock_calculate:
+                main()
+        mock_calculate.assert_not_called()
+        with open(output_path, 'r', encoding='utf-8') as file:
+            self.assertEqual(file.read(), expected)
+
+    def test_server_with_other_config_does_not_poison_cache(self):
+        """测试服务端打分配置（IDF模型）不同时不转发，缓存中是本进程的结果；配置相同时服务端的结果按同一个键缓存"""
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        original_path = os.path.join(self.test_dir, 'orig.txt')
+        plagiarized_path = os.path.join(self.test_dir, 'copy.txt')
+        output_path = os.path.join(self.test_dir, 'result.txt')
+        with open(original_path, 'w', encoding='utf-8') as file:
+            file.write("今天是星期天，天气晴，今天晚上我要去看电影。")
+        with open(plagiarized_path, 'w', encoding='utf-8') as file:
+            file.write("今天是周天，天气晴朗，我晚上要去看电影。")
+        expected = calculate_similarity("今天是星期天，天气晴，今天晚上我要去看电影。", "今天是周天，天气晴朗，我晚上要去看电影。")
+        key = (content_hash("今天是星期天，天气晴，今天晚上我要去看电影。"),
+               content_hash("今天是周天，天气晴朗，我晚上要去看电影。"), check_config('tfidf'))
+
+        def server_score(original_file, plagiarized_file):
+            # 模拟服务端用另一个IDF模型打出的不同分数
+            return 0.47
+
+        pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(pool.shutdown)
+        for config, cached in ((dict(server.scoring_config(), idf_model="/srv/m2.idf|1|0"), expected),
+                               (server.scoring_config(), 0.47)):
+            check_server = server.create_server("127.0.0.1:0", pool, config)
+            threading.Thread(target=check_server.serve_forever, daemon=True).start()
+            address = f"127.0.0.1:{check_server.server_address[1]}"
+            test_args = ["main.py", original_path, plagiarized_path, output_path,
+                         "--server", address, "--result-cache", self.cache_path]
+            with patch('sys.argv', test_args), patch('server.check_paths', side_effect=server_score):
+                main()
+            check_server.shutdown()
+            check_server.server_close()
+
+            cache = ResultCache(self.cache_path)
+            self.assertEqual(cache.get(*key), cached)
+            cache.invalidate()
+            cache.close()
+
+
+class TestCascade(unittest.TestCase):
+    """廉价筛查级联单元测试"""
+
+    def setUp(self):
+        self.original = "自然语言处理是人工智能领域中的一个重要方向，它研究人与计算机之间用自然语言进行有效通信的理论和方法。" * 3
+        self.plagiarized = "自然语言处理是人工智能中的重要方向，研究人与计算机之间用自然语言有效通信的各种理论和方法。" * 3
+
+    def test_exact_stages(self):
+        """测试空文本、内容相同和字符集不相交的判定与完整计算一致"""
+        self.assertEqual(screen("", "  "), (1.0, 'blank'))
+        self.assertEqual(screen("！？", self.original), (0.0, 'blank'))
+        self.assertEqual(screen(self.original, self.original.replace("，", "。")), (1.0, 'identical'))
+        self.assertEqual(screen("今天天气晴朗", "hello world"), (0.0, 'charset'))
+        self.assertEqual(calculate_similarity("今天天气晴朗", "hello world"), 0.0)
+
+    def test_escalates_to_full_calculation(self):
+        """测试相近的文本逐级上交，由完整计算给出结果"""
+        decision = cascade_similarity(self.original, self.plagiarized)
+        self.assertEqual(decision, (calculate_similarity(self.original, self.plagiarized), 'tfidf'))
+
+    def test_length_and_shingle_screens(self):
+        """测试长度比和抽样 n-gram 的筛查可以单独开启"""
+        self.assertEqual(screen(self.original, "自然语言", cascade_options('length', min_length_ratio=0.05)), (0.0, 'length'))
+        self.assertIsNone(screen(self.original, "自然语言", cascade_options('identical')))
+
+        unrelated = "今天是星期天，天气晴朗，我们一家人早上去公园散步，下午在家里看电影，晚上吃了火锅。" * 4
+        options = cascade_options('shingle', sample_rate=1, min_samples=8)
+        similarity, stage = screen(self.original, unrelated, options)
+        self.assertEqual(stage, 'shingle')
+        self.assertLess(similarity, options['shingle_low'])
+        self.assertIsNone(screen(self.original, self.plagiarized, options))
+
+        self.assertEqual(len(shingle_hashes("abcd", 2)), 3)
+        with self.assertRaises(Exception):
+            cascade_options('unknown')
+
+
+class TestCharNgram(unittest.TestCase):
+    """字符 n-gram 分析器单元测试"""
+
+    def tearDown(self):
+        configure_analyzer('jieba')
+
+    def test_ngram_counts_skip_spaces(self):
+        """测试跨空格的 n-gram 不计入，英文统一小写"""
+        ids, counts = ngram_counts("ab AB", sizes=(2,))
+        self.assertEqual(len(ids), 1)
+        self.assertEqual(counts.tolist(), [2])
+        self.assertEqual(len(ngram_counts("a b", sizes=(2, 3))[0]), 0)
+
+    def test_similarity(self):
+        """测试相同文本为1，无共有 n-gram 为0，近似文本与分词路径接近"""
+        original = "今天是星期天天气晴今天晚上我要去看电影"
+        plagiarized = "今天是周天天气晴朗我晚上要去看电影"
+        self.assertEqual(ngram_similarity(original, original), 1.0)
+        self.assertEqual(ngram_similarity(original, "hello world"), 0.0)
+
+        configure_analyzer('char')
+        similarity = calculate_similarity(original, plagiarized)
+        self.assertEqual(similarity, ngram_similarity(original, plagiarized))
+        self.assertEqual(calculate_similarity("", ""), 1.0)
+        configure_analyzer('jieba')
+        self.assertLess(abs(similarity - calculate_similarity(original, plagiarized)), 0.3)
+        with self.assertRaises(Exception):
+            configure_analyzer('unknown')
+
+    def test_benchmark_agreement(self):
+        """测试基准测试报告两种分析器的结果差异和吞吐率"""
+        test_dir = tempfile.mkdtemp()
+        try:
+            corpus = benchmark.generate_corpus(test_dir, ['1K'], kinds=['del', 'dup'])
+            report = benchmark.compare_analyzers(corpus, repeat=1)
+        finally:
+            shutil.rmtree(test_dir)
+        self.assertEqual(report['summary']['pairs'], 2)
+        for entry in report['pairs']:
+            self.assertIn('chars_per_second', entry['char'])
+            self.assertEqual(entry['difference'],
+                             round(abs(entry['jieba']['similarity'] - entry['char']['similarity']), 2))
+
+    def test_benchmark_reads_existing_corpus(self):
+        """测试 analyzers --corpus 只读取已有语料，不重新生成覆盖其中的论文"""
+        import json
+        test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, test_dir)
+        original = os.path.join(test_dir, "orig_1K.txt")
+        with open(original, 'w', encoding='utf-8') as f:
+            f.write("自然语言处理是人工智能领域中的一个重要方向。")
+        with open(os.path.join(test_dir, "orig_1K_0.8_del.txt"), 'w', encoding='utf-8') as f:
+            f.write("自然语言处理是人工智能的一个方向。")
+        output = os.path.join(test_dir, "report.json")
+
+        with patch('builtins.print'):
+            benchmark.main(['analyzers', '--corpus', test_dir, '--repeat', '1', '-o', output])
+        with open(original, 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), "自然语言处理是人工智能领域中的一个重要方向。")
+        with open(output, 'r', encoding='utf-8') as f:
+            self.assertEqual([entry['variant'] for entry in json.load(f)['pairs']], ['del'])
+
+
+def _ingest_worker(directory, documents, barrier):
+    """并发收录测试的工作进程：全部分词完成后在栅栏处等待，让两个进程都在对方登记前读取词表"""
+    import corpus_store
+    segment = corpus_store.segment_text
+    calls = []
+
+    def segment_then_wait(text):
+        words = segment(text)
+        calls.append(text)
+        if len(calls) == len(documents):
+            barrier.wait(60)
+        return words
+
+    corpus_store.segment_text = segment_then_wait
+    store = corpus_store.CorpusStore(directory)
+    try:
+        store.add_documents(documents)
+    finally:
+        store.close()
+
+
+class TestCorpusStore(unittest.TestCase):
+    """分词语料库单元测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.texts = [
+            ("a", "今天是星期天，天气晴，今天晚上我要去看电影。"),
+            ("b", "今天是周天，天气晴朗，我晚上要去看电影。"),
+            ("c", "机器学习是人工智能的一个重要分支。"),
+            ("d", "   "),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_append_only_segments(self):
+        """测试分批收录追加分段，重复文档跳过，重新打开后内容不变"""
+        store = CorpusStore(self.test_dir)
+        self.assertEqual(store.add_documents(self.texts[:2]), 2)
+        self.assertEqual(store.add_documents(self.texts[1:] + [("c", "重复")]), 2)
+        self.assertEqual(len(store.segments), 2)
+        store.close()
+
+        store = CorpusStore(self.test_dir)
+        self.assertEqual(len(store), 4)
+        self.assertEqual(store.doc_ids(), ["a", "b", "c", "d"])
+        self.assertEqual(store.row("c"), 2)
+        self.assertTrue(store.document(3)['blank'])
+        terms = store.vocabulary.terms
+        self.assertEqual([terms[term_id] for term_id in store.token_ids(2)],
+                         [word.lower() for word in segment_text(preprocess_text(self.texts[2][1]))
+                          if len(word) >= 2])
+        store.close()
+
+    def test_similarity_matches_text_path(self):
+        """测试直接读取语料库的相似度与从原文计算的结果一致，词频矩阵不复制映射数组"""
+        import numpy as np
+
+        store = CorpusStore(self.test_dir)
+        store.add_documents(self.texts[:3])
+        store.add_documents(self.texts[3:])
+        texts = [text for _, text in self.texts]
+        self.assertEqual(store.similarity(0, 1), calculate_similarity(texts[0], texts[1]))
+        self.assertEqual(store.similarity(3, 3), 1.0)
+        self.assertEqual([row for _, row in store.iter_similarity_rows()], calculate_similarity_matrix(texts))
+        self.assertEqual([row for _, row in store.iter_similarity_rows(rows=[2, 0], query_indices=[1])],
+                         calculate_similarity_matrix([texts[2], texts[0]], [1]))
+
+        matrix = store.segments[0].count_matrix(len(store.vocabulary))
+        self.assertTrue(np.shares_memory(matrix.indices, store.segments[0].count_indices))
+        self.assertEqual(store.document_frequencies().sum(), store.count_matrix().nnz)
+        store.close()
+
+    def test_concurrent_ingest(self):
+        """测试两个进程同时收录含有相同新词（及相同文档）的论文：词编号不冲突，内容与串行收录一致"""
+        import multiprocessing
+        context = multiprocessing.get_context('spawn')
+        barrier = context.Barrier(2)
+        batches = [self.texts[:3], [self.texts[2], ("e", "今天晚上天气晴朗，机器学习很重要。")]]
+        workers = [context.Process(target=_ingest_worker, args=(self.test_dir, batch, barrier)) for batch in batches]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(120)
+            self.assertEqual(worker.exitcode, 0)
+
+        store = CorpusStore(self.test_dir)
+        self.assertEqual(sorted(store.doc_ids()), ["a", "b", "c", "e"])
+        terms = store.vocabulary.terms
+        self.assertEqual(len(terms), len(set(terms)))
+        texts = dict(self.texts[:3] + batches[1][1:])
+        for row, doc_id in enumerate(store.doc_ids()):
+            self.assertEqual([terms[term_id] for term_id in store.token_ids(row)],
+                             [word.lower() for word in segment_text(preprocess_text(texts[doc_id]))
+                              if len(word) >= 2])
+        self.assertEqual([row for _, row in store.iter_similarity_rows()],
+                         calculate_similarity_matrix([texts[doc_id] for doc_id in store.doc_ids()]))
+        store.close()
+
+
+class TestShardedSearch(unittest.TestCase):
+    """分片检索单元测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.documents = [
+            ("a", "今天是星期天，天气晴，今天晚上我要去看电影。"),
+            ("b", "今天是周天，天气晴朗，我晚上要去看电影。"),
+            ("c", "机器学习是人工智能的一个重要分支。"),
+            ("d", "深度学习推动了语音识别和图像识别的发展。"),
+            ("e", "人工智能和机器学习改变了图像识别。"),
+        ]
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.test_dir)
+
+    def _start_shard(self, name, documents):
+        import threading
+        store = CorpusStore(os.path.join(self.test_dir, name))
+        store.add_documents(documents)
+        self.stores.append(store)
+        shard_server = shards.create_shard_server("127.0.0.1:0", shards.ShardIndex(store))
+        threading.Thread(target=shard_server.serve_forever, daemon=True).start()
+        self.addCleanup(shard_server.server_close)
+        self.addCleanup(shard_server.shutdown)
+        return f"127.0.0.1:{shard_server.server_address[1]}"
+
+    def _expected(self, documents, query, top_k):
+        """所有文档放在一起拟合IDF、查询只做 transform 时的前K个结果"""
+        import numpy as np
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        def analyzer(text):
+            return [word.lower() for word in segment_text(preprocess_text(text)) if len(word) >= 2]
+        vectorizer = TfidfVectorizer(analyzer=analyzer)
+        matrix = vectorizer.fit_transform([text for _, text in documents])
+        scores = (matrix @ vectorizer.transform([query]).T).toarray().ravel()
+        ranked = sorted(((-score, doc_id) for score, (doc_id, _) in zip(scores, documents) if score > 0))[:top_k]
+        return [(doc_id, round(-score, 2)) for score, doc_id in ranked]
+
+    def test_merge_matches_single_index(self):
+        """测试多分片合并的前K结果与整个语料放在一起计算一致"""
+        query = "人工智能中的机器学习可以用于图像识别"
+        addresses = [self._start_shard("s1", self.documents[:2]), self._start_shard("s2", self.documents[2:])]
+        coordinator = shards.ShardCoordinator(addresses)
+        try:
+            self.assertEqual(coordinator.search(query, top_k=3), self._expected(self.documents, query, 3))
+
+            # 移除分片后全局IDF随之更新，不需要重建
+            coordinator.remove_shard(addresses[0])
+            self.assertEqual(coordinator.search(query, top_k=3), self._expected(self.documents[2:], query, 3))
+            coordinator.add_shard(addresses[0])
+            self.assertEqual(coordinator.search(query, top_k=5), self._expected(self.documents, query, 5))
+            self.assertEqual(coordinator.search("！！！"), [])
+        finally:
+            coordinator.close()
+
+    def test_unavailable_shard(self):
+        """测试分片未运行时抛出 ServerUnavailable"""
+        coordinator = shards.ShardCoordinator([os.path.join(self.test_dir, "missing.sock")])
+        try:
+            with self.assertRaises(server.ServerUnavailable):
+                coordinator.search("机器学习和人工智能")
+        finally:
+            coordinator.close()
+
+
+class TestPlagiarismCheckerApi(unittest.TestCase):
+    """可嵌入查重对象单元测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.pairs = [
+            ("今天是星期天，天气晴，今天晚上我要去看电影。", "今天是周天，天气晴朗，我晚上要去看电影。"),
+            ("机器学习是人工智能的一个分支。", "深度学习是机器学习的一个分支。"),
+            ("自然语言处理研究文本分析。", "今天的天气非常好。"),
+            ("", ""),
+        ]
+        self.checker = PlagiarismChecker()
+
+    def tearDown(self):
+        self.checker.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_same_results_as_module_functions(self):
+        """测试单对、批量和矩阵结果与模块函数一致"""
+        expected = [calculate_similarity(*pair) for pair in self.pairs]
+        self.assertEqual([self.checker.check(*pair) for pair in self.pairs], expected)
+        self.assertEqual(self.checker.check_many(self.pairs), expected)
+
+        texts = [text for pair in self.pairs for text in pair]
+        self.assertEqual(self.checker.check_matrix(texts, [0, 2]),
+                         [row for _, row in iter_similarity_rows(texts, [0, 2])])
+
+    def test_concurrent_threads(self):
+        """测试多个线程同时调用同一个对象，结果与串行一致"""
+        from concurrent.futures import ThreadPoolExecutor
+        expected = self.checker.check_many(self.pairs)
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: self.checker.check_many(self.pairs), range(32)))
+        self.assertEqual(results, [expected] * 32)
+
+    def test_asyncio(self):
+        """测试 asyncio 版本的单对、批量和逐行矩阵接口"""
+        import asyncio
+        texts = [text for pair in self.pairs for text in pair]
+
+        async def run():
+            single = await self.checker.acheck(*self.pairs[0])
+            many = await self.checker.acheck_many(self.pairs)
+            rows = [item async for item in self.checker.aiter_rows(texts)]
+            return single, many, rows
+
+        single, many, rows = asyncio.run(run())
+        self.assertEqual(single, self.checker.check(*self.pairs[0]))
+        self.assertEqual(many, self.checker.check_many(self.pairs))
+        self.assertEqual(rows, list(iter_similarity_rows(texts)))
+
+    def test_independent_configuration(self):
+        """测试对象的配置不影响进程级配置和其他对象"""
+        with PlagiarismChecker(analyzer='char') as char_checker:
+            original, plagiarized = self.pairs[0]
+            self.assertEqual(char_checker.check(original, plagiarized),
+                             ngram_similarity(preprocess_text(original), preprocess_text(plagiarized)))
+            self.assertEqual(self.checker.check(original, plagiarized), calculate_similarity(original, plagiarized))
+        with self.assertRaises(Exception):
+            PlagiarismChecker(analyzer='unknown', warm_up=False)
+
+    def test_files_modified_and_streaming(self):
+        """测试文件修改后重新读取；超出内存预算时流式计算，结果与整篇读入一致"""
+        original_file = os.path.join(self.test_dir, "orig.txt")
+        plagiarized_file = os.path.join(self.test_dir, "copy.txt")
+        with open(original_file, 'w', encoding='utf-8') as f:
+            f.write(self.pairs[0][0])
+        with open(plagiarized_file, 'w', encoding='utf-8') as f:
+            f.write(self.pairs[0][1])
+        self.assertEqual(self.checker.check_files(original_file, plagiarized_file), self.checker.check(*self.pairs[0]))
+
+        with open(plagiarized_file, 'w', encoding='utf-8') as f:
+            f.write(self.pairs[0][0])
+        stat = os.stat(plagiarized_file)
+        os.utime(plagiarized_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        self.assertEqual(self.checker.check_files(original_file, plagiarized_file), 1.0)
+
+        with PlagiarismChecker(memory_budget=1, warm_up=False) as streaming_checker:
+            self.assertEqual(streaming_checker.check_files(original_file, plagiarized_file), 1.0)
+        with self.assertRaises(Exception):
+            streaming_checker.check(*self.pairs[0])
+
+    def test_close_waits_for_running_calls(self):
+        """测试 close 等其他线程中进行中的同步调用结束后才释放IDF模型，关闭后的新调用直接报错"""
+        import threading
+        from unittest.mock import MagicMock
+        started, release = threading.Event(), threading.Event()
+        order = []
+
+        def slow_similarity(original_text, plagiarized_text, options=None):
+            started.set()
+            release.wait(10)
+            order.append('check')
+            return 0.5
+
+        checker = PlagiarismChecker(warm_up=False)
+        # 读了一半的逐行迭代器不阻塞 close
+        rows = checker.iter_rows([pair[0] for pair in self.pairs[:3]])
+        next(rows)
+        checker.options = checker.options._replace(idf_model=MagicMock())
+        checker.options.idf_model.close.side_effect = lambda: order.append('model_close')
+        with patch('main.calculate_similarity', side_effect=slow_similarity):
+            results = []
+            worker = threading.Thread(target=lambda: results.append(checker.check(*self.pairs[0])))
+            worker.start()
+            self.assertTrue(started.wait(10))
+            closer = threading.Thread(target=checker.close)
+            closer.start()
+            closer.join(0.2)
+            self.assertTrue(closer.is_alive())
+            release.set()
+            closer.join(10)
+            worker.join(10)
+        self.assertFalse(closer.is_alive())
+        self.assertEqual(results, [0.5])
+        self.assertEqual(order, ['check', 'model_close'])
+        with self.assertRaises(Exception):
+            checker.check(*self.pairs[0])
+        with self.assertRaises(Exception):
+            next(rows)
+
+
+class TestMemoryBudget(unittest.TestCase):
+    """内存预算、词频落盘与阶段内存峰值单元测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.texts = [
+            "今天是星期天，天气晴，今天晚上我要去看电影。",
+            "今天是周天，天气晴朗，我晚上要去看电影。",
+            "   ",
+            "机器学习是人工智能的一个分支。",
+            "深度学习是机器学习的一个分支。",
+            "",
+        ]
+        self.paths = []
+        for index, text in enumerate(self.texts):
+            path = os.path.join(self.test_dir, f"doc{index}.txt")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            self.paths.append(path)
+        self.records = []
+
+    def tearDown(self):
+        metrics.configure_metrics()
+        memory.configure_memory_tracking(None)
+        configure_idf_model(None)
+        shutil.rmtree(self.test_dir)
+
+    def test_spilled_counts_matrix(self):
+        """测试落盘前后追加的词频拼成的矩阵与内存中构造的一致"""
+        from vocabulary import counter_matrix
+        from collections import Counter
+        rows = [Counter({3: 2, 0: 1}), Counter(), Counter({1: 5, 2: 1, 3: 1})]
+        with SpilledCounts(self.test_dir) as spilled:
+            spilled.append(rows[0])
+            spilled.spill()
+            spilled.append(rows[1])
+            spilled.append(rows[2])
+            self.assertGreater(spilled.pending_bytes(), 0)
+            matrix = spilled.matrix(4)
+            self.assertEqual(spilled.spills, 2)
+            self.assertEqual((matrix != counter_matrix(rows, 4)).nnz, 0)
+            directory = spilled.directory
+        self.assertFalse(os.path.exists(directory))
+
+    def test_budgeted_rows_match_in_memory(self):
+        """测试超出预算时（流式处理每篇文件并落盘词频）结果与整篇读入的批量计算一致"""
+        metrics.configure_metrics(hooks=[self.records.append])
+        expected = list(iter_similarity_rows(self.texts))
+        self.assertEqual(list(iter_file_similarity_rows(self.paths)), expected)
+        metrics.reset()
+        self.assertEqual(list(iter_file_similarity_rows(self.paths, [1, 2], memory_budget=1)),
+                         [expected[1], expected[2]])
+        stages = metrics.emit('batch')['stages']
+        # 空文件不超过预算，仍整篇读入
+        self.assertEqual(stages['stream']['calls'], len(self.paths) - 1)
+        self.assertGreater(stages['spill']['calls'], 0)
+        with self.assertRaises(Exception):
+            list(iter_file_similarity_rows(self.paths, [len(self.paths)]))
+
+    def test_budgeted_rows_with_idf_model(self):
+        """测试使用语料IDF模型时，落盘词频的结果与 transform 一致"""
+        model_path = os.path.join(self.test_dir, "corpus.idf")
+        build_idf_model((segment_text(preprocess_text(text)) for text in self.texts), model_path).close()
+        configure_idf_model(model_path)
+        expected = list(iter_similarity_rows(self.texts))
+        self.assertEqual(list(iter_file_similarity_rows(self.paths, memory_budget=1)), expected)
+
+    def test_stage_peak_memory(self):
+        """测试开启内存跟踪后每个阶段记录峰值，嵌套阶段的峰值计入外层，多次调用取最大值"""
+        memory.configure_memory_tracking('tracemalloc')
+        metrics.configure_metrics(hooks=[self.records.append])
+        with metrics.stage('outer'):
+            with metrics.stage('inner'):
+                block = bytearray(8 * 1024 * 1024)
+                del block
+            with metrics.stage('inner'):
+                pass
+        stages = metrics.emit('check')['stages']
+        self.assertGreaterEqual(stages['inner']['peak_memory'], 8 * 1024 * 1024)
+        self.assertGreaterEqual(stages['outer']['peak_memory'], stages['inner']['peak_memory'])
+        with self.assertRaises(Exception):
+            memory.configure_memory_tracking('unknown')
+
+    def test_batch_cli_memory_budget(self):
+        """测试 batch 子命令在极小内存预算下输出不变"""
+        outputs = []
+        for extra in ([], ["--memory-budget", "0.001", "--memory-trace", "rss"]):
+            output = os.path.join(self.test_dir, f"matrix{len(outputs)}.csv")
+            with patch('sys.argv', ["main.py", "batch", self.test_dir, "-o", output] + extra):
+                main()
+            with open(output, 'r', encoding='utf-8') as f:
+                outputs.append(f.read())
+        self.assertEqual(outputs[0], outputs[1])
+
+
+class TestSegmentDictionary(unittest.TestCase):
+    """预编译分词词典单元测试"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.test_dir = tempfile.mkdtemp()
+        cls.user_dict = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thesis_dict.txt")
+        cls.default_path = os.path.join(cls.test_dir, "default.segdict")
+        cls.thesis_path = os.path.join(cls.test_dir, "thesis.segdict")
+        seg_dict.build_segment_dictionary(cls.default_path).close()
+        seg_dict.build_segment_dictionary(cls.thesis_path, [cls.user_dict]).close()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.test_dir)
+
+    def setUp(self):
+        self.texts = [
+            "我来到北京清华大学",
+            "小明硕士毕业于中国科学院计算所，后在日本京都大学深造。",
+            "工信处女干事每月经过下属科室都要亲口交代24口交换机等技术性器件的安装工作",
+            "C++和C#都是编程语言，圆周率约为3.14，增长了5%。\r\n第二段  English words here!",
+            "本文采用余弦相似度和词频逆文档频率实现抄袭检测",
+            "",
+            "  \n ",
+        ]
+
+    def tearDown(self):
+        seg_dict.configure_segment_dictionary(None)
+
+    def test_matches_jieba(self):
+        """测试分词结果与 jieba.cut 精确模式完全一致"""
+        import jieba
+        dictionary = seg_dict.CompiledDictionary(self.default_path)
+        try:
+            for text in self.texts + [preprocess_text(text) for text in self.texts]:
+                self.assertEqual(list(dictionary.cut(text)), list(jieba.cut(text, cut_all=False)))
+            self.assertEqual(dictionary.frequency("北京"), jieba.dt.FREQ["北京"])
+            self.assertIsNone(dictionary.frequency("不存在的词语组合"))
+        finally:
+            dictionary.close()
+
+    def test_user_dictionary(self):
+        """测试自定义词典按 jieba load_userdict 的规则编译"""
+        import jieba
+        tokenizer = jieba.Tokenizer()
+        tokenizer.load_userdict(self.user_dict)
+        dictionary = seg_dict.CompiledDictionary(self.thesis_path)
+        try:
+            for text in self.texts:
+                self.assertEqual(list(dictionary.cut(text)), list(tokenizer.cut(text, cut_all=False)))
+            self.assertIn("余弦相似度", list(dictionary.cut(self.texts[4])))
+            self.assertNotEqual(dictionary.version, seg_dict.CompiledDictionary(self.default_path).version)
+        finally:
+            dictionary.close()
+
+    def test_configured_segmentation(self):
+        """测试开启后 segment_text 使用预编译词典，分词缓存的词典版本随之变化"""
+        from seg_cache import dictionary_version
+        expected = [segment_text(text) for text in self.texts]
+        jieba_version = dictionary_version()
+        dictionary = seg_dict.configure_segment_dictionary(self.default_path)
+        self.assertEqual([segment_text(text) for text in self.texts], expected)
+        self.assertEqual(dictionary_version(), dictionary.version)
+        seg_dict.configure_segment_dictionary(None)
+        self.assertEqual(dictionary_version(), jieba_version)
+
+    def test_invalid_file(self):
+        """测试无效的词典文件"""
+        path = os.path.join(self.test_dir, "invalid.segdict")
+        with open(path, 'wb') as f:
+            f.write(b"not a dictionary" * 4)
+        with self.assertRaises(Exception):
+            seg_dict.CompiledDictionary(path)
+        with self.assertRaises(Exception):
+            seg_dict.CompiledDictionary(os.path.join(self.test_dir, "missing.segdict"))
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
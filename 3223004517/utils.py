@@ -1,52 +1,151 @@
+import codecs
 import os
+
+import metrics
+
+# 流式读取的默认块大小：1MB
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# 按顺序尝试的编码（gb2312、ascii 都是 gbk 的子集，不再单独尝试）
+CANDIDATE_ENCODINGS = ['utf-8', 'gbk']
+
+# 字节序标记与对应编码
+_BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
+def detect_encoding(prefix, final=False):
+    """
+    根据文件开头的字节判断编码
+    先识别BOM，再依次尝试候选编码；prefix 不是整个文件时末尾可能截断多字节字符，
+    用增量解码器（final=False）判断，避免误判
+    """
+    for bom, encoding in _BOMS:
+        if prefix.startswith(bom):
+            return encoding
+    for encoding in CANDIDATE_ENCODINGS:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(prefix, final)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def _check_readable(file_path):
+    """检查文件存在且可读"""
+    if not os.path.exists(file_path):
+        raise Exception(f"文件不存在: {file_path}")
+    if not os.access(file_path, os.R_OK):
+        raise Exception(f"无法读取文件: {file_path}")
+
+
+class EncodingFallback(Exception):
+    """开头识别出的编码在文件后部解码失败，已产出的文本作废，调用方应改用 detect_file_encoding 的结果重新读取"""
+
+
+def detect_file_encoding(file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    逐块解码整个文件，返回第一个能解码全文的候选编码，都不能时返回 None
+    与 read_file 的整体回退尝试相同的编码，但峰值内存只与块大小有关
+    """
+    for encoding in CANDIDATE_ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            with open(file_path, 'rb') as file:
+                data = file.read(chunk_size)
+                while data:
+                    decoder.decode(data)
+                    data = file.read(chunk_size)
+            decoder.decode(b'', True)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def iter_file_text(file_path, chunk_size=DEFAULT_CHUNK_SIZE, encoding=None):
+    """
+    流式读取文本文件
+    字节只读取一遍：用第一块识别编码（或使用指定的 encoding），之后增量解码，逐块产出字符串，
+    峰值内存只与块大小有关，与文件大小无关
+    按第一块识别的编码在后面解码失败时抛出 EncodingFallback
+    """
+    _check_readable(file_path)
+    with open(file_path, 'rb') as file:
+        prefix = file.read(chunk_size)
+        if not prefix:
+            return
+        detected = encoding is None
+        if detected:
+            encoding = detect_encoding(prefix, len(prefix) < chunk_size)
+            if encoding is None:
+                raise Exception(f"文件编码不支持: {file_path}")
+
+        decoder = codecs.getincrementaldecoder(encoding)()
+        data = prefix
+        try:
+            while data:
+                text = decoder.decode(data)
+                if text:
+                    yield text
+                data = file.read(chunk_size)
+            text = decoder.decode(b'', True)
+            if text:
+                yield text
+        except UnicodeDecodeError:
+            if detected:
+                raise EncodingFallback(f"文件编码不支持: {file_path}")
+            raise Exception(f"文件编码不支持: {file_path}")
+
+
 def read_file(file_path):
     """读取文件函数"""
-    try:
-        # 检查文件是否存在
-        if not os.path.exists(file_path):
-            raise Exception(f"文件不存在: {file_path}")
+    with metrics.stage('read') as sizes:
+        text = _read_file(file_path)
+        if metrics.enabled():
+            sizes['bytes'] = os.path.getsize(file_path) if text else 0
+            sizes['chars'] = len(text)
+    return text
+
 
-        # 检查文件是否可读
-        if not os.access(file_path, os.R_OK):
-            raise Exception(f"无法读取文件: {file_path}")
+def _read_file(file_path):
+    try:
+        _check_readable(file_path)
 
         # 检查文件大小
         file_size = os.path.getsize(file_path)
         if file_size == 0:
             return ""
 
-        # 读取文件内容
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
+            return ''.join(iter_file_text(file_path))
+        except Exception:
+            # 文件开头能按某种编码解码、后面却不能时，退回整体尝试所有编码
+            with open(file_path, 'rb') as file:
                 content = file.read()
-            return content
-        except UnicodeDecodeError:
-            # 尝试其他编码
-            try:
-                with open(file_path, 'r', encoding='gbk') as file:
-                    content = file.read()
-                return content
-            except:
-                # 尝试二进制读取
+            for encoding in CANDIDATE_ENCODINGS:
                 try:
-                    with open(file_path, 'rb') as file:
-                        content = file.read()
-                    # 尝试常见编码
-                    for encoding in ['utf-8', 'gbk', 'gb2312', 'ascii']:
-                        try:
-                            return content.decode(encoding)
-                        except UnicodeDecodeError:
-                            continue
-                    raise Exception(f"文件编码不支持: {file_path}")
-                except:
-                    raise Exception(f"文件读取失败: {file_path}")
+                    return content.decode(encoding)
+                except UnicodeDecodeError:
+                    continue
+            raise Exception(f"文件编码不支持: {file_path}")
     except Exception as e:
         raise Exception(f"读取文件失败: {str(e)}")
 
 
-
 def write_result(file_path, similarity):
     """写入文件函数"""
+    with metrics.stage('write_result'):
+        _write_result(file_path, similarity)
+
+
+def _write_result(file_path, similarity):
     try:
         # 检查目录是否存在
         directory = os.path.dirname(file_path)
@@ -66,3 +165,98 @@ def write_result(file_path, similarity):
             file.write(f"{similarity:.2f}")
     except Exception as e:
         raise Exception(f"写入文件失败: {str(e)}")
+
+
+def document_labels(paths):
+    """
+    相似度矩阵的行列名：默认取文件名，文件名重复时向上补足上级目录直到互不相同
+    （a/x.txt 与 b/x.txt），同一路径出现多次时再加 #序号
+    """
+    from collections import Counter
+
+    full_paths = [os.path.normpath(os.path.abspath(path)) for path in paths]
+    distinct = list(dict.fromkeys(full_paths))
+    parts = [path.split(os.sep) for path in distinct]
+    depths = [1] * len(parts)
+    while True:
+        labels = ['/'.join(part[-depth:]).lstrip('/') for part, depth in zip(parts, depths)]
+        counts = Counter(labels)
+        extended = False
+        for index, label in enumerate(labels):
+            if counts[label] > 1 and depths[index] < len(parts[index]):
+                depths[index] += 1
+                extended = True
+        if not extended:
+            break
+
+    label_of = dict(zip(distinct, labels))
+    repeats = Counter(full_paths)
+    seen = Counter()
+    unique = []
+    for path in full_paths:
+        label = label_of[path]
+        if repeats[path] > 1:
+            seen[path] += 1
+            label = f"{label}#{seen[path]}"
+        unique.append(label)
+    return unique
+
+
+def write_similarity_rows(file_path, row_names, column_names, rows, output_format='csv'):
+    """
+    流式写入相似度矩阵
+    rows 为 (行号, 相似度列表) 的迭代器，每计算出一行就写出一行
+    output_format 支持 csv 与 jsonl，file_path 为 '-' 时写到标准输出
+    """
+    import csv
+    import json
+    import sys
+
+    if output_format not in ('csv', 'jsonl'):
+        raise Exception(f"不支持的输出格式: {output_format}")
+    if len(set(column_names)) != len(column_names):
+        # JSONL 按列名组成字典，重名的列会互相覆盖
+        raise Exception("相似度矩阵的列名重复，请使用 document_labels 生成互不相同的名称")
+
+    try:
+        if file_path in (None, '-'):
+            file = sys.stdout
+        else:
+            directory = os.path.dirname(file_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            file = open(file_path, 'w', encoding='utf-8', newline='')
+
+        try:
+            if output_format == 'csv':
+                writer = csv.writer(file)
+                writer.writerow(['document'] + list(column_names))
+                for index, row in rows:
+                    writer.writerow([row_names[index]] + [f"{score:.2f}" for score in row])
+                    file.flush()
+            else:
+                for index, row in rows:
+                    record = {
+                        'document': row_names[index],
+                        'similarities': dict(zip(column_names, row)),
+                    }
+                    file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    file.flush()
+        finally:
+            if file is not sys.stdout:
+                file.close()
+    except Exception as e:
+        raise Exception(f"写入文件失败: {str(e)}")
+
+
+def write_report(file_path, report):
+    """写入JSON格式的查重报告（如匹配片段列表）"""
+    import json
+    try:
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(file_path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    except Exception as e:
+        raise Exception(f"写入文件失败: {str(e)}")
@@ -0,0 +1,117 @@
+from array import array
+
+# array 的类型码：无符号32位整数，足够容纳任何实际词表
+TERM_ID_TYPECODE = 'I'
+
+# TfidfVectorizer 默认的切分规则会丢弃单字词，默认保持一致以免改变查重结果
+DEFAULT_MIN_TERM_LENGTH = 2
+
+
+class Vocabulary:
+    """
+    词语驻留表：把词映射为连续的整数编号
+    文档只以 array('I') 形式的编号序列保存，不再拼接、重新切分字符串
+    """
+
+    def __init__(self, min_term_length=DEFAULT_MIN_TERM_LENGTH):
+        self.min_term_length = min_term_length
+        self.terms = []
+        self._ids = {}
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, term):
+        return term in self._ids
+
+    def intern(self, term):
+        """返回词的编号，新词追加到词表末尾"""
+        term_id = self._ids.get(term)
+        if term_id is None:
+            term_id = self._ids[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def get(self, term, default=None):
+        """查询词的编号，不存在时返回 default"""
+        return self._ids.get(term, default)
+
+    def term_ids(self, words):
+        """
+        把分词结果转换为编号数组
+        与 TfidfVectorizer 默认规则一致：转小写，丢弃短于 min_term_length 的词
+        （输入为预处理后文本的分词结果，每个词都只含字母、数字和汉字）
+        """
+        intern = self.intern
+        min_length = self.min_term_length
+        return array(TERM_ID_TYPECODE, [intern(word.lower()) for word in words if len(word) >= min_length])
+
+
+def count_matrix(documents, vocabulary_size):
+    """
+    由编号数组直接构造词频稀疏矩阵（CSR，文档 × 词表）
+    编号数组以零拷贝方式转换为 NumPy 数组，重复编号由 sum_duplicates 合并为词频
+    """
+    import numpy as np
+    from scipy.sparse import csr_matrix
+
+    indptr = np.zeros(len(documents) + 1, dtype=np.int64)
+    np.cumsum([len(document) for document in documents], out=indptr[1:])
+    if indptr[-1]:
+        indices = np.concatenate([np.frombuffer(document, dtype=np.uintc) for document in documents if document])
+    else:
+        indices = np.empty(0, dtype=np.uintc)
+    data = np.ones(len(indices), dtype=np.int64)
+    counts = csr_matrix((data, indices.astype(np.int32), indptr), shape=(len(documents), vocabulary_size))
+    counts.sum_duplicates()
+    return counts
+
+
+def counter_matrix(counters, vocabulary_size):
+    """由 {编号: 词频} 字典构造词频稀疏矩阵（CSR，文档 × 词表）"""
+    import numpy as np
+    from scipy.sparse import csr_matrix
+
+    indptr = np.zeros(len(counters) + 1, dtype=np.int64)
+    np.cumsum([len(counter) for counter in counters], out=indptr[1:])
+    indices = np.fromiter((term_id for counter in counters for term_id in counter), dtype=np.int32,
+                          count=int(indptr[-1]))
+    data = np.fromiter((count for counter in counters for count in counter.values()), dtype=np.int64,
+                       count=int(indptr[-1]))
+    counts = csr_matrix((data, indices, indptr), shape=(len(counters), vocabulary_size))
+    counts.sum_duplicates()
+    return counts
+
+
+def limit_features(counts, terms, max_features):
+    """
+    按总词频保留前 max_features 个特征
+    与 TfidfVectorizer 的做法相同：列先按词的字典序排列，再对总词频做 argsort，
+    因此词频相同的特征取舍也与 sklearn 一致
+    """
+    import numpy as np
+
+    if max_features is None or counts.shape[1] <= max_features:
+        return counts
+    # 只保留出现过的词：sklearn 的词表里没有未出现的词，多出的零列会改变 argsort 对并列值的排序
+    seen = np.flatnonzero(counts.getnnz(axis=0))
+    if len(seen) <= max_features:
+        return counts[:, seen]
+    order = np.array(sorted(seen.tolist(), key=terms.__getitem__), dtype=np.int64)
+    counts = counts[:, order]
+    term_frequencies = np.asarray(counts.sum(axis=0)).ravel()
+    keep = np.sort((-term_frequencies).argsort()[:max_features])
+    return counts[:, keep]
+
+
+def tfidf_matrix(counts, vocabulary, max_features=5000):
+    """
+    词频矩阵 → L2归一化的TF-IDF矩阵，与 TfidfVectorizer 默认参数的结果一致
+    行向量之间的点积即为余弦相似度
+    """
+    from sklearn.feature_extraction.text import TfidfTransformer
+
+    if counts.nnz == 0:
+        raise Exception("empty vocabulary; perhaps the documents only contain stop words")
+    counts = limit_features(counts, vocabulary.terms, max_features)
+    return TfidfTransformer().fit_transform(counts).tocsr()
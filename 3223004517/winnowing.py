@@ -0,0 +1,147 @@
+import re
+
+import numpy as np
+
+# 滚动哈希的基数（奇数），运算按 2^64 自然溢出取模
+_BASE = np.uint64(0x100000001B3)
+
+# 同一个指纹在原文中最多记录的出现位置数，防止高度重复的文本让匹配退化为平方复杂度
+MAX_POSITIONS_PER_HASH = 16
+
+# 匹配片段在报告中附带的原文摘录最大长度
+EXCERPT_LENGTH = 200
+
+_KEEP = re.compile(r'[\u4e00-\u9fa5a-zA-Z0-9]')
+
+
+def preprocess_with_offsets(text):
+    """
+    与 preprocess_text 相同的字符过滤（去掉标点和空白），同时记录每个保留字符在原文中的位置
+    返回 (小写后的保留字符, 原文偏移数组)
+    """
+    offsets = [match.start() for match in _KEEP.finditer(text)]
+    chars = ''.join(text[offset] for offset in offsets).lower()
+    return chars, np.array(offsets, dtype=np.int64)
+
+
+def kgram_hashes(chars, k):
+    """计算所有长度为 k 的字符片段的多项式哈希（向量化，整体为线性时间）"""
+    if len(chars) < k:
+        return np.empty(0, dtype=np.uint64)
+    codes = np.frombuffer(chars.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    count = len(codes) - k + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for offset in range(k):
+            hashes = hashes * _BASE + codes[offset:offset + count]
+    return hashes
+
+
+def winnow(hashes, window):
+    """
+    winnowing 选取指纹：每个长度为 window 的哈希窗口取最小值（相同时取最右侧），
+    相邻窗口选中同一位置时只记录一次
+    返回 (指纹哈希数组, 指纹位置数组)
+    """
+    if len(hashes) == 0:
+        return hashes, np.empty(0, dtype=np.int64)
+    if len(hashes) < window:
+        window = len(hashes)
+
+    windows = np.lib.stride_tricks.sliding_window_view(hashes, window)
+    # 在反转的窗口上取第一个最小值，即原窗口最右侧的最小值
+    positions = np.arange(len(windows)) + (window - 1 - np.argmin(windows[:, ::-1], axis=1))
+    keep = np.ones(len(positions), dtype=bool)
+    keep[1:] = positions[1:] != positions[:-1]
+    positions = positions[keep]
+    return hashes[positions], positions
+
+
+def fingerprint(text, k=5, window=4):
+    """计算文本的 winnowing 指纹，返回 (哈希数组, 位置数组, 原文偏移数组)"""
+    chars, offsets = preprocess_with_offsets(text)
+    hashes, positions = winnow(kgram_hashes(chars, k), window)
+    return hashes, positions, offsets
+
+
+def _match_spans(original_fp, plagiarized_fp, k, window):
+    """
+    按位置差分组合并连续匹配的指纹，得到匹配片段
+    返回 [(原文起点, 原文终点, 抄袭版起点, 抄袭版终点)]，均为预处理后字符序列中的位置
+    """
+    original_hashes, original_positions = original_fp
+    plagiarized_hashes, plagiarized_positions = plagiarized_fp
+
+    index = {}
+    for value, position in zip(original_hashes.tolist(), original_positions.tolist()):
+        positions = index.setdefault(value, [])
+        if len(positions) < MAX_POSITIONS_PER_HASH:
+            positions.append(position)
+
+    # 同一处抄袭中相邻两个指纹相距不超过 window 个位置
+    max_gap = window + k
+    open_spans = {}
+    spans = []
+    for value, b_position in zip(plagiarized_hashes.tolist(), plagiarized_positions.tolist()):
+        for a_position in index.get(value, ()):
+            shift = b_position - a_position
+            span = open_spans.get(shift)
+            if span is not None and b_position <= span[3] + max_gap:
+                span[1] = a_position + k
+                span[3] = b_position + k
+            else:
+                if span is not None:
+                    spans.append(span)
+                open_spans[shift] = [a_position, a_position + k, b_position, b_position + k]
+    spans.extend(open_spans.values())
+
+    # 不同位置差的片段可能重叠，按抄袭版起点排序后去掉被完全覆盖的片段
+    spans.sort(key=lambda span: (span[2], -span[3]))
+    merged = []
+    for span in spans:
+        if merged and span[2] >= merged[-1][2] and span[3] <= merged[-1][3]:
+            continue
+        merged.append(span)
+    return merged
+
+
+def winnowing_similarity(original_text, plagiarized_text, k=5, window=4):
+    """
+    基于 winnowing 指纹（MOSS 方法）的相似度
+    相似度为抄袭版指纹中出现在原文里的比例，保留两位小数；
+    同时给出匹配片段在两篇原始文本中的字符偏移
+    返回 {'similarity': 相似度, 'matches': [{'original': [起, 止), 'plagiarized': [起, 止), 'text': 原文摘录}]}
+    """
+    # 空文本语义与 calculate_similarity 一致
+    if not original_text.strip() and not plagiarized_text.strip():
+        return {'similarity': 1.0, 'matches': []}
+    if not original_text.strip() or not plagiarized_text.strip():
+        return {'similarity': 0.0, 'matches': []}
+
+    try:
+        original_hashes, original_positions, original_offsets = fingerprint(original_text, k, window)
+        plagiarized_hashes, plagiarized_positions, plagiarized_offsets = fingerprint(plagiarized_text, k, window)
+    except Exception as e:
+        raise Exception(f"指纹计算失败: {str(e)}")
+
+    if len(original_hashes) == 0 or len(plagiarized_hashes) == 0:
+        return {'similarity': 0.0, 'matches': []}
+
+    try:
+        shared = np.isin(plagiarized_hashes, original_hashes)
+        similarity = round(float(shared.mean()), 2)
+
+        matches = []
+        spans = _match_spans((original_hashes, original_positions),
+                             (plagiarized_hashes[shared], plagiarized_positions[shared]), k, window)
+        for a_start, a_end, b_start, b_end in spans:
+            original_span = [int(original_offsets[a_start]), int(original_offsets[a_end - 1]) + 1]
+            plagiarized_span = [int(plagiarized_offsets[b_start]), int(plagiarized_offsets[b_end - 1]) + 1]
+            matches.append({
+                'original': original_span,
+                'plagiarized': plagiarized_span,
+                'text': original_text[original_span[0]:original_span[1]][:EXCERPT_LENGTH],
+            })
+        return {'similarity': similarity, 'matches': matches}
+    except Exception as e:
+        raise Exception(f"相似度计算失败: {str(e)}")